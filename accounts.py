@@ -0,0 +1,236 @@
+"""管理员账户：登录校验和密码修改
+
+密码用 scrypt（OpenSSL 不支持时用 PBKDF2-SHA256）加每个用户独立的随机盐保存，格式带算法和参数：
+
+    scrypt$16384$8$1$盐$哈希          pbkdf2_sha256$600000$盐$哈希
+
+盐和哈希是 base64。旧版本保存的是不加盐的 SHA-256 十六进制串，仍然可以登录；
+算法或参数与当前设置不同的哈希在登录成功时自动改成新格式，调高参数后用户无需重设密码。
+
+派生密钥故意很慢（几十毫秒），界面和服务器都在工作线程中调用这里的函数。
+`python accounts.py --benchmark` 测量各档参数的耗时，帮助选择登录延迟可以接受的参数。
+"""
+import base64
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+# 默认管理员账户，数据库中没有时自动创建（登录后界面会提醒修改默认密码）
+ADMIN_USERNAME = "jirowang"
+DEFAULT_PASSWORD = "123456"
+
+# 新密码使用的算法和参数，修改后旧哈希在下次登录时升级
+SCHEME = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# 最近验证通过的密码缓存的条数，命中时不再派生密钥
+VERIFY_CACHE_SIZE = 64
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL 默认最多使用 32 MiB，参数调高后需要放宽
+    maxmem = 128 * r * (n + p + 2) + (1 << 20)
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=HASH_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, HASH_BYTES)
+
+
+def hash_password(password, scheme=None, salt=None):
+    """按当前设置（或指定的算法）生成带随机盐的密码哈希"""
+    scheme = scheme or SCHEME
+    salt = salt if salt is not None else secrets.token_bytes(SALT_BYTES)
+    if scheme == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+    if scheme == "pbkdf2_sha256":
+        digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}"
+    raise ValueError(f"不支持的密码算法: {scheme}")
+
+
+def _derive(password, hashed_password):
+    """按保存的哈希中的算法和参数重新计算，返回 (计算结果, 保存的结果)，格式不认识时返回 None"""
+    parts = hashed_password.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+            return _scrypt(password, salt, n, r, p), expected
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            salt, expected = base64.b64decode(parts[2]), base64.b64decode(parts[3])
+            return _pbkdf2(password, salt, int(parts[1])), expected
+    except ValueError:
+        return None
+    if len(parts) == 1 and len(hashed_password) == 64:
+        # 旧版本：不加盐的 SHA-256
+        return hashlib.sha256(password.encode()).hexdigest().encode(), hashed_password.encode()
+    return None
+
+
+class VerifyCache:
+    """最近验证通过的 (哈希, 密码) 记录，重复登录和修改密码前的校验不必再派生密钥
+
+    只保存密码在本进程随机密钥下的 HMAC，不保存密码本身；哈希改变后旧记录自然失效。
+    """
+
+    def __init__(self, size=VERIFY_CACHE_SIZE):
+        self.size = size
+        self._key = secrets.token_bytes(32)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tag(self, password):
+        return hmac.new(self._key, password.encode(), hashlib.sha256).digest()
+
+    def hit(self, hashed_password, password):
+        with self._lock:
+            tag = self._entries.get(hashed_password)
+            if tag is None:
+                return False
+            self._entries.move_to_end(hashed_password)
+        return hmac.compare_digest(tag, self._tag(password))
+
+    def add(self, hashed_password, password):
+        tag = self._tag(password)
+        with self._lock:
+            self._entries[hashed_password] = tag
+            self._entries.move_to_end(hashed_password)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+VERIFY_CACHE = VerifyCache()
+
+
+def verify_password(password, hashed_password):
+    """验证密码，支持所有版本的哈希格式"""
+    if VERIFY_CACHE.hit(hashed_password, password):
+        return True
+    derived = _derive(password, hashed_password)
+    if derived is None or not hmac.compare_digest(*derived):
+        return False
+    VERIFY_CACHE.add(hashed_password, password)
+    return True
+
+
+def needs_rehash(hashed_password):
+    """哈希的算法或参数是否与当前设置不同"""
+    if SCHEME == "scrypt":
+        return not hashed_password.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not hashed_password.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+def ensure_admin(conn):
+    """检查并创建管理员账户"""
+    row = conn.execute("SELECT 1 FROM users WHERE username = ?", (ADMIN_USERNAME,)).fetchone()
+    if row is None:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                     (ADMIN_USERNAME, hash_password(DEFAULT_PASSWORD)))
+
+
+def verify_login(conn, username, password):
+    """用户名和密码正确时返回保存的哈希，否则返回 None（只读，可以在只读连接上调用）"""
+    row = conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+    if row is None or not verify_password(password, row[0]):
+        return None
+    return row[0]
+
+
+def upgrade_hash(conn, username, password, hashed_password):
+    """登录成功后把旧格式的哈希换成当前设置（由调用方提交），返回是否升级了
+
+    只在哈希仍是 hashed_password 时替换，不会覆盖同时修改的新密码。
+    """
+    if not needs_rehash(hashed_password):
+        return False
+    return replace_hash(conn, username, hashed_password, hash_password(password))
+
+
+def replace_hash(conn, username, old_hash, new_hash):
+    """哈希仍是 old_hash 时换成 new_hash（新哈希可以事先在别的线程算好），返回是否替换了"""
+    cursor = conn.execute("UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                          (new_hash, username, old_hash))
+    return cursor.rowcount > 0
+
+
+def check_login(conn, username, password):
+    """用户名和密码是否正确；正确且哈希是旧格式时顺便升级（需要可写的连接，由调用方提交）"""
+    hashed_password = verify_login(conn, username, password)
+    if hashed_password is None:
+        return False
+    upgrade_hash(conn, username, password, hashed_password)
+    return True
+
+
+def set_password(conn, username, password):
+    """修改密码（由调用方提交）"""
+    store_hash(conn, username, hash_password(password))
+
+
+def store_hash(conn, username, hashed_password):
+    """保存已经算好的密码哈希（由调用方提交）"""
+    conn.execute("UPDATE users SET password_hash = ? WHERE username = ?", (hashed_password, username))
+
+
+def benchmark(target_ms=250, repeat=3):
+    """测量各档参数派生一次密钥的耗时（毫秒），返回 [(算法, 参数说明, 耗时, 是否在目标之内)]"""
+    candidates = []
+    if hasattr(hashlib, "scrypt"):
+        candidates += [("scrypt", f"n=2**{bits} r=8 p=1",
+                        lambda bits=bits: _scrypt("benchmark", b"salt", 2 ** bits, 8, 1))
+                       for bits in range(13, 18)]
+    candidates += [("pbkdf2_sha256", f"iterations={iterations}",
+                    lambda iterations=iterations: _pbkdf2("benchmark", b"salt", iterations))
+                   for iterations in (200_000, 400_000, 600_000, 1_000_000)]
+
+    results = []
+    for scheme, label, derive in candidates:
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            derive()
+            samples.append((time.perf_counter() - started) * 1000)
+        elapsed = min(samples)
+        results.append((scheme, label, elapsed, elapsed <= target_ms))
+    return results
+
+
+if __name__ == "__main__":
+    # python accounts.py --benchmark [--target-ms 250]：选择登录延迟不超过目标的最强参数
+    import argparse
+
+    parser = argparse.ArgumentParser(description="密码哈希参数基准测试")
+    parser.add_argument("--benchmark", action="store_true", help="测量各档参数派生密钥的耗时")
+    parser.add_argument("--target-ms", type=float, default=250, help="可以接受的登录延迟（毫秒）")
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.print_help()
+    else:
+        print(f"当前设置: {SCHEME}（scrypt n={SCRYPT_N} r={SCRYPT_R} p={SCRYPT_P}；"
+              f"pbkdf2 iterations={PBKDF2_ITERATIONS}），CPU 数 {os.cpu_count()}")
+        best = {}
+        for scheme, label, elapsed, ok in benchmark(args.target_ms):
+            print(f"  {scheme:<15}{label:<22}{elapsed:>9.1f} ms  {'' if ok else '超过目标'}")
+            if ok:
+                best[scheme] = label
+        for scheme, label in best.items():
+            print(f"{args.target_ms:.0f} ms 以内最强的 {scheme} 参数: {label}")
@@ -0,0 +1,198 @@
+"""客户分析报表：每月/每年新增客户、客户总数趋势和备注关键词统计
+
+数据来自两张汇总表，报表的读取代价与客户数量无关：
+
+- customer_monthly_stats：每月每种类型新增的客户数，和 stats 的计数表一样由触发器逐行维护；
+- customer_note_stats：每年备注中各个短语出现的客户数。短语要在 Python 中拆分，触发器只把受影响的
+  年份记入 customer_note_dirty，生成报表前由 refresh() 重新统计这些年份（按登记日期索引只读取这几年）。
+"""
+import collections
+import datetime
+import re
+
+# 报表显示的月数、年数和备注短语数
+REPORT_MONTHS = 24
+REPORT_YEARS = 5
+REPORT_PHRASES = 20
+
+# 备注按这些符号拆成短语，追加备注时的分隔符（repository.NOTES_SEPARATOR）也在其中
+NOTE_SEPARATORS = re.compile(r"[，,；;。.、\s]+")
+
+# 太长的短语是随手写的说明而不是关键词，不统计
+NOTE_PHRASE_MAX_LENGTH = 20
+
+# 一年中只出现在一个客户上的短语不保存，汇总表不会随着自由文本无限增长
+NOTE_PHRASE_MIN_COUNT = 2
+
+
+def install(conn):
+    """创建汇总表及维护触发器，并用现有数据初始化（由调用方提交事务）"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS customer_monthly_stats (
+        month TEXT NOT NULL,
+        customer_type TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, customer_type)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS customer_note_stats (
+        year TEXT NOT NULL,
+        phrase TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (year, phrase)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS customer_note_dirty (year TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_analytics_ai AFTER INSERT ON customers BEGIN
+        INSERT OR IGNORE INTO customer_monthly_stats (month, customer_type, count)
+        VALUES (substr(new.registration_date, 1, 7), new.customer_type, 0);
+        UPDATE customer_monthly_stats SET count = count + 1
+        WHERE month = substr(new.registration_date, 1, 7) AND customer_type = new.customer_type;
+        INSERT OR IGNORE INTO customer_note_dirty (year)
+        SELECT substr(new.registration_date, 1, 4) WHERE COALESCE(new.notes, '') != '';
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_analytics_ad AFTER DELETE ON customers BEGIN
+        UPDATE customer_monthly_stats SET count = count - 1
+        WHERE month = substr(old.registration_date, 1, 7) AND customer_type = old.customer_type;
+        INSERT OR IGNORE INTO customer_note_dirty (year)
+        SELECT substr(old.registration_date, 1, 4) WHERE COALESCE(old.notes, '') != '';
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_analytics_au_type AFTER UPDATE OF customer_type, registration_date
+    ON customers
+    WHEN old.customer_type IS NOT new.customer_type OR old.registration_date IS NOT new.registration_date BEGIN
+        UPDATE customer_monthly_stats SET count = count - 1
+        WHERE month = substr(old.registration_date, 1, 7) AND customer_type = old.customer_type;
+        INSERT OR IGNORE INTO customer_monthly_stats (month, customer_type, count)
+        VALUES (substr(new.registration_date, 1, 7), new.customer_type, 0);
+        UPDATE customer_monthly_stats SET count = count + 1
+        WHERE month = substr(new.registration_date, 1, 7) AND customer_type = new.customer_type;
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_analytics_au_notes AFTER UPDATE OF notes, registration_date ON customers
+    WHEN old.notes IS NOT new.notes OR old.registration_date IS NOT new.registration_date BEGIN
+        INSERT OR IGNORE INTO customer_note_dirty (year) VALUES (substr(old.registration_date, 1, 4));
+        INSERT OR IGNORE INTO customer_note_dirty (year) VALUES (substr(new.registration_date, 1, 4));
+    END''')
+
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """用一次分组查询重新计算每月计数，备注统计标记为全部需要刷新"""
+    conn.execute("DELETE FROM customer_monthly_stats")
+    conn.execute('''
+    INSERT INTO customer_monthly_stats (month, customer_type, count)
+    SELECT substr(registration_date, 1, 7), customer_type, COUNT(*) FROM customers
+    GROUP BY substr(registration_date, 1, 7), customer_type
+    ''')
+    conn.execute("DELETE FROM customer_note_stats")
+    conn.execute('''
+    INSERT OR IGNORE INTO customer_note_dirty (year)
+    SELECT DISTINCT substr(registration_date, 1, 4) FROM customers
+    ''')
+
+
+def split_phrases(notes):
+    """把一条备注拆成不重复的短语"""
+    phrases = set()
+    for phrase in NOTE_SEPARATORS.split(notes or ""):
+        if phrase and len(phrase) <= NOTE_PHRASE_MAX_LENGTH:
+            phrases.add(phrase)
+    return phrases
+
+
+def refresh(conn):
+    """重新统计有客户变动的年份的备注短语（由调用方提交），返回刷新的年份"""
+    years = [row[0] for row in conn.execute("SELECT year FROM customer_note_dirty ORDER BY year")]
+    for year in years:
+        counts = collections.Counter()
+        # 登记日期是 YYYY-MM-DD 字符串，按范围读取可以用上 idx_customers_registration_date
+        cursor = conn.execute("SELECT notes FROM customers WHERE registration_date >= ? AND registration_date < ?"
+                              " AND notes != ''", (year, str(int(year) + 1)))
+        for (notes,) in cursor:
+            counts.update(split_phrases(notes))
+        conn.execute("DELETE FROM customer_note_stats WHERE year = ?", (year,))
+        conn.executemany("INSERT INTO customer_note_stats (year, phrase, count) VALUES (?, ?, ?)",
+                         [(year, phrase, count) for phrase, count in counts.items()
+                          if count >= NOTE_PHRASE_MIN_COUNT])
+        conn.execute("DELETE FROM customer_note_dirty WHERE year = ?", (year,))
+    return years
+
+
+def _month_range(last, count):
+    """以 last（YYYY-MM）结尾的 count 个连续月份"""
+    year, month = int(last[:4]), int(last[5:7])
+    months = []
+    for _ in range(count):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    months.reverse()
+    return months
+
+
+def load(conn, months=REPORT_MONTHS, years=REPORT_YEARS, phrases=REPORT_PHRASES):
+    """读取报表数据（只读），结构可以直接转成 JSON：
+
+    types       客户类型，按客户数从多到少
+    months      最近 months 个月（到本月或数据中最晚的月份为止）
+    monthly     {类型: [每月新增数]}，与 months 对齐
+    base_total  months 第一个月之前登记的客户总数，用于画累计趋势
+    years       有客户登记的全部年份
+    yearly      {类型: [每年新增数]}，与 years 对齐
+    note_years  最近 years 年
+    notes       [[短语, [每年客户数], 合计]]，按合计从多到少取前 phrases 个
+    """
+    rows = conn.execute("SELECT month, customer_type, count FROM customer_monthly_stats WHERE count > 0").fetchall()
+    type_totals = collections.Counter()
+    for month, customer_type, count in rows:
+        type_totals[customer_type] += count
+    types = [customer_type for customer_type, count in type_totals.most_common()]
+
+    current = datetime.date.today().strftime("%Y-%m")
+    last = max([current] + [month for month, customer_type, count in rows])
+    month_list = _month_range(last, months)
+    month_index = {month: index for index, month in enumerate(month_list)}
+    monthly = {customer_type: [0] * len(month_list) for customer_type in types}
+    base_total = 0
+
+    year_list = sorted({month[:4] for month, customer_type, count in rows})
+    year_index = {year: index for index, year in enumerate(year_list)}
+    yearly = {customer_type: [0] * len(year_list) for customer_type in types}
+
+    for month, customer_type, count in rows:
+        if month in month_index:
+            monthly[customer_type][month_index[month]] += count
+        elif month < month_list[0]:
+            base_total += count
+        yearly[customer_type][year_index[month[:4]]] += count
+
+    note_years = [str(year) for year in range(int(last[:4]) - years + 1, int(last[:4]) + 1)]
+    placeholders = ", ".join("?" * len(note_years))
+    phrase_counts = collections.defaultdict(lambda: [0] * len(note_years))
+    for year, phrase, count in conn.execute(
+            f"SELECT year, phrase, count FROM customer_note_stats WHERE year IN ({placeholders})", note_years):
+        phrase_counts[phrase][note_years.index(year)] = count
+    notes = sorted(([phrase, counts, sum(counts)] for phrase, counts in phrase_counts.items()),
+                   key=lambda item: (-item[2], item[0]))[:phrases]
+
+    return {
+        "types": types,
+        "months": month_list,
+        "monthly": monthly,
+        "base_total": base_total,
+        "years": year_list,
+        "yearly": yearly,
+        "note_years": note_years,
+        "notes": notes,
+    }
+
+
+def report(conn):
+    """刷新备注统计后读取报表数据（需要可写的连接，由调用方提交）"""
+    refresh(conn)
+    return load(conn)
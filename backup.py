@@ -0,0 +1,395 @@
+"""数据库备份：后台分页在线备份、gzip 压缩、自动备份和保留策略"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+
+import db_pool
+from db_worker import report_progress
+import history
+import migrations
+
+BACKUP_DIR = "data/backups"
+
+# 每一步复制的页数，步与步之间释放读锁并汇报进度
+BACKUP_PAGES_PER_STEP = 256
+
+# 压缩时每次读写的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# 自动备份间隔
+AUTO_BACKUP_INTERVAL = datetime.timedelta(hours=24)
+
+# 保留策略：最近的若干份全部保留，其余每天保留最新一份、每周保留最新一份
+KEEP_LAST = 5
+KEEP_DAILY = 7
+KEEP_WEEKLY = 4
+
+
+class BackupError(Exception):
+    """备份文件无法使用"""
+
+
+BACKUP_NAME = re.compile(r"^customer_data_(backup|auto)_(\d{8}_\d{6})\.db(\.gz)?$")
+
+
+def backup_files(backup_dir=BACKUP_DIR):
+    """列出备份文件，返回按时间从新到旧排列的 [(时间, 文件名), ...]"""
+    if not os.path.isdir(backup_dir):
+        return []
+    result = []
+    for name in os.listdir(backup_dir):
+        match = BACKUP_NAME.match(name)
+        if match:
+            created = datetime.datetime.strptime(match.group(2), "%Y%m%d_%H%M%S")
+            result.append((created, name))
+    result.sort(reverse=True)
+    return result
+
+
+def metadata_path(backup_path):
+    """备份文件对应的元数据文件"""
+    return backup_path + ".json"
+
+
+def read_metadata(backup_path):
+    """读取备份的元数据，旧版本生成的备份没有元数据时返回 None"""
+    try:
+        with open(metadata_path(backup_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def snapshot(conn, target_path):
+    """用 SQLite 在线备份 API 分页复制数据库，复制期间其他连接仍可读写"""
+    def progress(status, remaining, total):
+        report_progress(total - remaining, total)
+
+    target = sqlite3.connect(target_path)
+    try:
+        conn.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=progress)
+        # 复制出的文件沿用正在使用的数据库的 WAL 模式，改回普通模式后单独一个文件就是完整的备份
+        set_rollback_journal(target)
+    finally:
+        target.close()
+
+
+def set_rollback_journal(conn):
+    """把数据库改回普通（DELETE）日志模式，关闭后不会在旁边留下 -wal / -shm 文件"""
+    conn.execute("PRAGMA journal_mode=DELETE")
+
+
+def compress(source_path, target_path):
+    """gzip 压缩，返回原文件的 SHA-256"""
+    total = os.path.getsize(source_path)
+    digest = hashlib.sha256()
+    done = 0
+    with open(source_path, "rb") as source, gzip.open(target_path, "wb", compresslevel=6) as target:
+        while True:
+            chunk = source.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+            done += len(chunk)
+            report_progress(done, total)
+    return digest.hexdigest()
+
+
+def extract(backup_path, target_path):
+    """解压 .gz 备份，返回解压后内容的 SHA-256"""
+    total = os.path.getsize(backup_path)
+    digest = hashlib.sha256()
+    with open(backup_path, "rb") as raw, gzip.GzipFile(fileobj=raw) as source, \
+            open(target_path, "wb") as target:
+        while True:
+            chunk = source.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+            report_progress(raw.tell(), total)
+    return digest.hexdigest()
+
+
+def open_readonly(db_path):
+    """以只读方式打开数据库文件，不会创建文件也不会修改它
+
+    immutable=1：备份文件不会再被修改，不加锁，也不会在旁边创建 -wal / -shm 文件。
+    """
+    # urllib.request 导入较慢（会带入 http.client、email 等），只在这里用到
+    import urllib.request
+
+    uri = "file:" + urllib.request.pathname2url(os.path.abspath(db_path)) + "?mode=ro&immutable=1"
+    return sqlite3.connect(uri, uri=True)
+
+
+def describe(db_path):
+    """统计数据库文件中的客户数量和结构版本"""
+    conn = open_readonly(db_path)
+    try:
+        by_type = dict(conn.execute("SELECT customer_type, COUNT(*) FROM customers GROUP BY customer_type"))
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+    return {"customers": sum(by_type.values()), "by_type": by_type, "schema_version": version}
+
+
+def create_backup(conn, backup_dir=BACKUP_DIR, automatic=False):
+    """备份数据库并压缩，返回备份信息
+
+    自动备份时如果数据与上一份备份完全相同，则不再生成新文件（返回 None）。
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name, now = _unique_name(backup_dir, "auto" if automatic else "backup", ".db.gz")
+    backup_path = os.path.join(backup_dir, name)
+    raw_path = backup_path + ".tmp"
+    part_path = backup_path + ".part"
+
+    try:
+        snapshot(conn, raw_path)
+        info = describe(raw_path)
+        info["sha256"] = compress(raw_path, part_path)
+        info["raw_size"] = os.path.getsize(raw_path)
+
+        if automatic:
+            latest = next(iter(backup_files(backup_dir)), None)
+            previous = read_metadata(os.path.join(backup_dir, latest[1])) if latest else None
+            if previous and previous.get("sha256") == info["sha256"]:
+                # 记下检查时间，下一次自动备份从现在开始计时
+                previous["checked"] = now.strftime("%Y-%m-%d %H:%M:%S")
+                _write_metadata(os.path.join(backup_dir, latest[1]), previous)
+                os.remove(part_path)
+                return None
+
+        os.replace(part_path, backup_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+        db_pool.remove_wal_files(raw_path)
+
+    info.update({
+        "file": name,
+        "created": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "automatic": automatic,
+        "size": os.path.getsize(backup_path),
+    })
+    _write_metadata(backup_path, info)
+    return info
+
+
+def _unique_name(backup_dir, kind, extension):
+    """按当前时间生成备份文件名，返回 (文件名, 文件名中的时间)
+
+    文件名只精确到秒，同一秒内已有同名备份（或正在生成的 .tmp / .part）时顺延一秒，不会覆盖已有的备份。
+    """
+    now = datetime.datetime.now().replace(microsecond=0)
+    while True:
+        name = f"customer_data_{kind}_{now.strftime('%Y%m%d_%H%M%S')}{extension}"
+        path = os.path.join(backup_dir, name)
+        if not any(os.path.exists(path + suffix) for suffix in ("", ".tmp", ".part")):
+            return name, now
+        now += datetime.timedelta(seconds=1)
+
+
+def _write_metadata(backup_path, info):
+    with open(metadata_path(backup_path), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+
+def apply_retention(backup_dir=BACKUP_DIR, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY, keep_weekly=KEEP_WEEKLY):
+    """按保留策略删除多余的备份，返回被删除的文件名"""
+    files = backup_files(backup_dir)
+    keep = set(name for _, name in files[:keep_last])
+
+    days = []
+    weeks = []
+    for created, name in files:
+        day = created.date()
+        week = created.isocalendar()[:2]
+        # 文件按从新到旧排列，每天/每周遇到的第一份就是最新的一份
+        if day not in days and len(days) < keep_daily:
+            days.append(day)
+            keep.add(name)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.append(week)
+            keep.add(name)
+
+    removed = []
+    for _, name in files:
+        if name in keep:
+            continue
+        path = os.path.join(backup_dir, name)
+        os.remove(path)
+        if os.path.exists(metadata_path(path)):
+            os.remove(metadata_path(path))
+        # 之前版本打开 .db 备份时会在旁边留下这些文件
+        db_pool.remove_wal_files(path)
+        removed.append(name)
+    return removed
+
+
+def run_backup(conn, backup_dir=BACKUP_DIR, automatic=False):
+    """备份并执行保留策略，返回 (备份信息, 删除的旧备份)"""
+    info = create_backup(conn, backup_dir, automatic)
+    removed = apply_retention(backup_dir)
+    return info, removed
+
+
+def backup_due(backup_dir=BACKUP_DIR, interval=AUTO_BACKUP_INTERVAL):
+    """距最近一次备份是否已超过自动备份间隔"""
+    latest = next(iter(backup_files(backup_dir)), None)
+    if latest is None:
+        return True
+    last = latest[0]
+    checked = (read_metadata(os.path.join(backup_dir, latest[1])) or {}).get("checked")
+    if checked:
+        last = max(last, datetime.datetime.strptime(checked, "%Y-%m-%d %H:%M:%S"))
+    return datetime.datetime.now() - last >= interval
+
+
+def auto_backup(conn, backup_dir=BACKUP_DIR):
+    """到期时执行自动备份，未到期或数据无变化时返回 None"""
+    if not backup_due(backup_dir):
+        return None
+    info, _ = run_backup(conn, backup_dir, automatic=True)
+    return info
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """列出可恢复的备份及其元数据，不需要解压或完整读取备份文件
+
+    优先读取备份旁的 .json 元数据；旧版本生成的 .db 备份只读打开后统计客户数量。
+    """
+    result = []
+    for created, name in backup_files(backup_dir):
+        path = os.path.join(backup_dir, name)
+        info = read_metadata(path) or {}
+        if "customers" not in info and not name.endswith(".gz"):
+            try:
+                info.update(describe(path))
+            except sqlite3.Error:
+                pass
+        result.append({
+            "file": name,
+            "path": path,
+            "created": created,
+            "automatic": info.get("automatic", name.startswith("customer_data_auto_")),
+            "note": info.get("note", ""),
+            "customers": info.get("customers"),
+            "size": os.path.getsize(path),
+        })
+    return result
+
+
+def verify(db_path):
+    """检查数据库文件是否完整可用，有问题时抛出 BackupError"""
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            problems = [row[0] for row in conn.execute("PRAGMA quick_check")]
+            tables = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"不是有效的数据库文件: {e}")
+
+    if problems != ["ok"]:
+        raise BackupError("数据库文件已损坏: " + "; ".join(problems[:5]))
+    missing = {"users", "customers"} - tables
+    if missing:
+        raise BackupError("备份中缺少数据表: " + "、".join(sorted(missing)))
+
+
+def prepare_restore(backup_path, db_path):
+    """把备份还原到数据库旁的临时文件并完成校验和结构升级，返回临时文件路径
+
+    全程只读取正在使用的数据库（把修改历史接到还原出的数据库上），失败或取消时删除临时文件。
+    """
+    temp_path = db_path + ".restore"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    try:
+        if backup_path.endswith(".gz"):
+            digest = extract(backup_path, temp_path)
+            expected = (read_metadata(backup_path) or {}).get("sha256")
+            if expected and digest != expected:
+                raise BackupError("备份文件校验和不一致，文件可能已损坏")
+        else:
+            # 用备份 API 逐页复制，源文件只读打开
+            source = open_readonly(backup_path)
+            target = sqlite3.connect(temp_path)
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP,
+                              progress=lambda status, remaining, total: report_progress(total - remaining, total))
+            except sqlite3.DatabaseError as e:
+                raise BackupError(f"不是有效的数据库文件: {e}")
+            finally:
+                target.close()
+                source.close()
+
+        verify(temp_path)
+
+        conn = sqlite3.connect(temp_path)
+        try:
+            migrations.migrate(conn)
+            # 恢复前的修改历史和恢复造成的差异都记下来，误恢复后还能找回被覆盖的客户
+            if os.path.exists(db_path):
+                history.carry_over(conn, db_path)
+        finally:
+            conn.close()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return temp_path
+
+
+def swap_in(temp_path, db_path, backup_dir=BACKUP_DIR):
+    """用准备好的文件原子替换数据库，返回恢复前数据库的备份文件名
+
+    调用前必须关闭所有连接。替换前先把当前数据库硬链接（不支持时复制）成一份备份，
+    任何时刻 db_path 上都是一个完整的数据库。
+    """
+    # WAL 中还没写回的内容先写回数据库文件，旧的 -wal 文件不能留给新数据库
+    db_pool.checkpoint(db_path)
+    db_pool.remove_wal_files(db_path)
+    db_pool.remove_wal_files(temp_path)
+
+    saved = None
+    if os.path.exists(db_path):
+        os.makedirs(backup_dir, exist_ok=True)
+        saved, now = _unique_name(backup_dir, "backup", ".db")
+        saved_path = os.path.join(backup_dir, saved)
+        try:
+            os.link(db_path, saved_path)
+        except OSError:
+            shutil.copy2(db_path, saved_path)
+        _write_metadata(saved_path, {
+            "file": saved,
+            "created": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "automatic": False,
+            "note": "恢复前自动保存",
+            "size": os.path.getsize(saved_path),
+        })
+
+    os.replace(temp_path, db_path)
+    if saved:
+        # 替换后硬链接已是独立的文件，改成普通日志模式，之后只读打开它不会留下 -wal / -shm 文件
+        conn = sqlite3.connect(saved_path)
+        try:
+            set_rollback_journal(conn)
+        finally:
+            conn.close()
+    return saved
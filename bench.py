@@ -0,0 +1,443 @@
+"""客户数据库性能基准测试
+
+    python bench.py [--rows 10000 100000] [--repeat 20] [--output 结果.json] [--compare 旧结果.json]
+
+为每个规模在临时目录生成一份模拟客户数据库（随机的公司名称、联系人、1[3-9] 开头的 11 位手机号、
+精煤/中煤混合、备注和登记日期），依次测量列表查询和表格填充、首页统计、各种搜索、增删改、
+修改历史、备份和恢复的耗时，结果写成 JSON。--compare 给出旧版本的结果文件时，逐项打印耗时变化，
+方便在版本之间发现性能退化。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+import accounts
+import analytics
+import backup
+import customers
+import db_pool
+import dedup
+import history
+import migrations
+from repository import CustomerFilter, CustomerRepository
+import stats
+
+DEFAULT_ROWS = (10000, 100000)
+DEFAULT_REPEAT = 20
+
+# 每次批量插入的行数
+GENERATE_BATCH = 5000
+
+# 与界面表格一屏的行数相当
+VISIBLE_ROWS = 30
+
+# 耗时变化超过这个比例时在对比结果中标出
+REGRESSION_THRESHOLD = 0.2
+
+REGIONS = ("山西", "大同", "朔州", "阳泉", "长治", "晋城", "太原", "吕梁", "鄂尔多斯", "榆林",
+           "神木", "淮南", "平顶山", "唐山", "邯郸", "徐州", "兖州", "六盘水", "乌海", "河津")
+NAME_WORDS = ("华兴", "鑫源", "恒泰", "金鼎", "宏达", "瑞丰", "永昌", "天成", "中瑞", "晋能",
+              "东方", "广汇", "盛世", "汇丰", "昌盛", "隆基", "正元", "泰和", "新阳", "远航")
+INDUSTRIES = ("煤业", "能源", "矿业", "焦化", "洗煤", "煤炭运销", "电力", "钢铁", "物流", "化工")
+SUFFIXES = ("有限公司", "有限责任公司", "股份有限公司", "集团有限公司", "贸易有限公司")
+SURNAMES = "王李张刘陈杨赵黄周吴徐孙胡朱高林何郭马罗梁宋郑谢韩唐冯于董萧程曹袁邓许傅沈曾彭吕"
+GIVEN_CHARS = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华建国志红文斌海波鹏宇晨浩然"
+NOTES = ("", "", "", "长期合作", "月结", "需开增值税专用发票", "电厂用煤", "发热量要求 5500 以上",
+         "铁路发运", "汽运", "预付款", "季度框架合同", "老客户介绍", "价格敏感", "含硫量要求低于 1%")
+# 精煤约占六成
+TYPE_WEIGHTS = (("精煤", 6), ("中煤", 4))
+
+SEARCH_CASES = (
+    ("公司名称", "煤业", "所有"),
+    ("公司名称+类型", "煤业", "精煤"),
+    ("地区", "大同", "所有"),
+    ("联系人", "王伟", "所有"),
+    ("电话前缀", "139", "所有"),
+    ("两个词", "山西 能源", "所有"),
+    ("单字", "鑫", "所有"),
+    ("无结果", "不存在的公司", "所有"),
+)
+
+# 批量操作每次涉及的客户数
+BULK_ROWS = 1000
+
+# 客户列表的排序和高级筛选：(名称, CustomerFilter)
+LIST_FILTER_CASES = (
+    ("sort_company", CustomerFilter(sort="company_name", descending=False)),
+    ("sort_phone", CustomerFilter(sort="phone")),
+    ("by_date", CustomerFilter(date_from="2024-01-01", date_to="2024-06-30")),
+    ("phone_contact", CustomerFilter(phone_prefix="138", sort="contact_name", descending=False)),
+    ("notes_type", CustomerFilter("", "精煤", notes="长期合作")),
+)
+
+
+# ---- 模拟数据 ----
+
+def fake_customer(rng, start_date, days):
+    """生成一行 (公司名称, 客户名称, 联系电话, 客户类型, 备注, 登记日期)"""
+    company = rng.choice(REGIONS) + rng.choice(NAME_WORDS) + rng.choice(INDUSTRIES) + rng.choice(SUFFIXES)
+    contact = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_CHARS) for _ in range(rng.randint(1, 2)))
+    phone = "1%d%09d" % (rng.randint(3, 9), rng.randrange(10 ** 9))
+    customer_type = rng.choices([t for t, _ in TYPE_WEIGHTS], [w for _, w in TYPE_WEIGHTS])[0]
+    registered = start_date + datetime.timedelta(days=rng.randrange(days))
+    return (company, contact, phone, customer_type, rng.choice(NOTES), registered.strftime("%Y-%m-%d"))
+
+
+def generate(conn, rows, seed=0):
+    """向数据库插入 rows 个模拟客户（同一个 seed 生成的数据相同），由调用方提交"""
+    rng = random.Random(seed)
+    start_date = datetime.date(2015, 1, 1)
+    days = (datetime.date(2025, 1, 1) - start_date).days
+    repo = CustomerRepository(conn)
+    inserted = 0
+    while inserted < rows:
+        batch = [fake_customer(rng, start_date, days) for _ in range(min(GENERATE_BATCH, rows - inserted))]
+        inserted += repo.insert_many(batch)
+    return inserted
+
+
+def make_database(db_path, rows, seed=0):
+    """生成一份包含 rows 个模拟客户的完整数据库"""
+    conn = db_pool.connect(db_path)
+    try:
+        migrations.migrate(conn)
+        accounts.ensure_admin(conn)
+        generate(conn, rows, seed)
+        conn.commit()
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+
+# ---- 计时 ----
+
+def measure(func, repeat):
+    """调用 func repeat 次，返回耗时统计（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(samples[0], 3),
+        "max_ms": round(samples[-1], 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def bench_list(conn, results, repeat, rng):
+    """客户列表：load_customer_data 的统计查询、首屏和随机跳转"""
+    results["list.query"] = measure(lambda: customers.query_customers(conn, CustomerFilter()), repeat)
+    results["list.query_type"] = measure(lambda: customers.query_customers(conn, CustomerFilter("", "中煤")), repeat)
+
+    pager = customers.query_customers(conn, CustomerFilter())
+    results["list.first_window"] = measure(
+        lambda: customers.CustomerPager(pager.query).count(conn).window(conn, 0, VISIBLE_ROWS), repeat)
+
+    def jump():
+        pager.window(conn, rng.randrange(max(pager.total - VISIBLE_ROWS, 1)), VISIBLE_ROWS)
+    results["list.jump"] = measure(jump, repeat)
+
+    offset = [0]
+
+    def scroll():
+        # 每次向下滚动一屏，和拖动滚动条时的读取方式相同
+        offset[0] = (offset[0] + VISIBLE_ROWS) % max(pager.total - VISIBLE_ROWS, 1)
+        pager.window(conn, offset[0], VISIBLE_ROWS)
+    results["list.scroll"] = measure(scroll, repeat)
+
+    # 按列排序和高级筛选：统计加首屏，以及随机跳转
+    for name, customer_filter in LIST_FILTER_CASES:
+        results[f"list.{name}"] = measure(
+            lambda: customers.query_customers(conn, customer_filter).window(conn, 0, VISIBLE_ROWS), repeat)
+        filtered = customers.query_customers(conn, customer_filter)
+        results[f"list.{name}.jump"] = measure(
+            lambda: filtered.window(conn, rng.randrange(max(filtered.total - VISIBLE_ROWS, 1)), VISIBLE_ROWS),
+            repeat)
+
+
+def bench_tree_fill(conn, results, repeat):
+    """把一屏客户放进 Treeview，与 main.fill_customer_rows 相同；没有图形界面时跳过"""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+    except Exception as e:
+        results["tree.fill"] = {"skipped": f"无法创建窗口: {e}"}
+        return
+
+    try:
+        root.withdraw()
+        tree = ttk.Treeview(root, columns=("id", "company", "contact", "phone", "type", "notes"), show="headings")
+        pager = customers.query_customers(conn, CustomerFilter())
+        windows = [pager.window(conn, offset, VISIBLE_ROWS)
+                   for offset in range(0, min(pager.total, VISIBLE_ROWS * 10), VISIBLE_ROWS)] or [[]]
+        index = [0]
+
+        def fill():
+            rows = windows[index[0] % len(windows)]
+            index[0] += 1
+            tree.delete(*tree.get_children())
+            for customer in rows:
+                tree.insert("", "end", iid=str(customer.id), values=customer.list_values(),
+                            tags=(customer.customer_type,))
+            root.update_idletasks()
+        results["tree.fill"] = measure(fill, repeat)
+    finally:
+        root.destroy()
+
+
+def bench_dashboard(conn, results, repeat):
+    results["dashboard.load"] = measure(lambda: stats.load(conn), repeat)
+
+
+def bench_reports(conn, results, repeat):
+    """报表：第一次统计全部备注、汇总表读取，以及一年的备注有变动后重新统计"""
+    started = time.perf_counter()
+    analytics.refresh(conn)
+    conn.commit()
+    results["report.refresh_all"] = summarize([(time.perf_counter() - started) * 1000])
+    results["report.load"] = measure(lambda: analytics.load(conn), repeat)
+
+    def refresh_year():
+        year = conn.execute("SELECT MAX(year) FROM customer_note_stats").fetchone()[0]
+        conn.execute("INSERT OR IGNORE INTO customer_note_dirty (year) VALUES (?)", (year,))
+        analytics.refresh(conn)
+        conn.commit()
+    results["report.refresh_year"] = measure(refresh_year, repeat)
+
+
+def bench_dedup(conn, results, repeat, rng):
+    """查重：第一次补算全部分桶键、添加客户时的实时检查和全表查重"""
+    started = time.perf_counter()
+    dedup.refresh(conn)
+    conn.commit()
+    results["dedup.refresh_all"] = summarize([(time.perf_counter() - started) * 1000])
+
+    start_date = datetime.date(2024, 1, 1)
+    samples = [dict(zip(("company_name", "contact_name", "phone"), fake_customer(rng, start_date, 365)))
+               for _ in range(repeat)]
+    results["dedup.check"] = measure(lambda: dedup.find_duplicates(conn, samples[rng.randrange(repeat)]), repeat)
+    results["dedup.report"] = measure(lambda: dedup.duplicate_report(conn), 1)
+
+
+def bench_login(conn, results, repeat):
+    """登录校验：第一次需要派生密钥，之后命中验证缓存"""
+    def cold():
+        accounts.VERIFY_CACHE.clear()
+        accounts.check_login(conn, accounts.ADMIN_USERNAME, accounts.DEFAULT_PASSWORD)
+    results["login.check"] = measure(cold, repeat)
+    results["login.check_cached"] = measure(
+        lambda: accounts.check_login(conn, accounts.ADMIN_USERNAME, accounts.DEFAULT_PASSWORD), repeat)
+
+
+def bench_search(conn, results, repeat):
+    for name, text, customer_type in SEARCH_CASES:
+        results[f"search.list.{name}"] = measure(
+            lambda: customers.query_customers(conn, CustomerFilter(text, customer_type)), repeat)
+    for name, text, customer_type in SEARCH_CASES:
+        results[f"search.ranked.{name}"] = measure(
+            lambda: customers.search_customers(conn, text, None if customer_type == "所有" else customer_type),
+            repeat)
+
+
+def bench_writes(conn, results, repeat, rng):
+    """单条增删改，每次都提交，与界面写线程的做法相同"""
+    start_date = datetime.date(2024, 1, 1)
+    added = []
+
+    def add():
+        company, contact, phone, customer_type, notes, _ = fake_customer(rng, start_date, 365)
+        added.append(customers.add_customer(conn, {
+            "company_name": company, "contact_name": contact, "phone": phone,
+            "customer_type": customer_type, "notes": notes}))
+        conn.commit()
+    results["write.add"] = measure(add, repeat)
+
+    ids = iter(list(added))
+
+    def update():
+        customer = customers.get_customer(conn, next(ids))
+        customers.update_customer(conn, customer.id, {
+            "company_name": customer.company_name, "contact_name": customer.contact_name,
+            "phone": customer.phone, "customer_type": "中煤" if customer.customer_type == "精煤" else "精煤",
+            "notes": "基准测试修改"})
+        conn.commit()
+    results["write.update"] = measure(update, repeat)
+
+    ids = iter(list(added))
+
+    def delete():
+        customers.delete_customer(conn, next(ids))
+        conn.commit()
+    results["write.delete"] = measure(delete, repeat)
+
+    # 批量操作：每次随机选 BULK_ROWS 个客户操作后再撤销，操作和撤销各自一个事务
+    all_ids = CustomerRepository(conn).ids()
+    for name, func, args in (("type", customers.set_customers_type, ("中煤",)),
+                             ("notes", customers.append_customers_notes, ("基准测试",)),
+                             ("delete", customers.delete_customers, ())):
+        done, undone = [], []
+        for _ in range(repeat):
+            ids = rng.sample(all_ids, min(BULK_ROWS, len(all_ids)))
+            started = time.perf_counter()
+            before = func(conn, ids, *args)
+            conn.commit()
+            done.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            customers.restore_customers(conn, before)
+            conn.commit()
+            undone.append((time.perf_counter() - started) * 1000)
+        results[f"write.bulk_{name}"] = summarize(done)
+        results[f"write.bulk_{name}.undo"] = summarize(undone)
+
+def bench_history(conn, results, repeat, rng, since):
+    """修改历史：since 之后的修改（即 bench_writes 中的写操作）、单个客户的记录和历史状态、已删除的客户
+
+    历史中还有生成数据时每个客户的添加记录，条数与客户数相同。触发器的开销算在 write.* 中。
+    """
+    results["history.changed_since"] = measure(lambda: history.changed_since(conn, since), repeat)
+    results["history.changed_since"]["entries"] = conn.execute("SELECT COUNT(*) FROM customer_history").fetchone()[0]
+    ids = CustomerRepository(conn).ids()
+    results["history.timeline"] = measure(lambda: history.timeline(conn, rng.choice(ids)), repeat)
+    results["history.as_of"] = measure(lambda: history.customer_as_of(conn, rng.choice(ids), since), repeat)
+    results["history.deleted"] = measure(lambda: history.deleted_customers(conn), repeat)
+
+
+def bench_backup(db_path, results, workdir):
+    """备份和恢复各测一次（恢复会替换测试数据库）"""
+    backup_dir = os.path.join(workdir, "backups")
+    conn = db_pool.connect(db_path)
+    try:
+        started = time.perf_counter()
+        info = backup.create_backup(conn, backup_dir)
+        results["backup.create"] = summarize([(time.perf_counter() - started) * 1000])
+        results["backup.create"]["size"] = info["size"]
+    finally:
+        conn.close()
+
+    started = time.perf_counter()
+    temp_path = backup.prepare_restore(os.path.join(backup_dir, info["file"]), db_path)
+    backup.swap_in(temp_path, db_path, backup_dir)
+    results["backup.restore"] = summarize([(time.perf_counter() - started) * 1000])
+
+
+def run(rows, repeat=DEFAULT_REPEAT, seed=0, workdir=None):
+    """在 rows 行的模拟数据库上运行全部基准测试，返回 {测试项: 耗时统计}"""
+    workdir = workdir or tempfile.mkdtemp(prefix="customer_bench_")
+    db_path = os.path.join(workdir, "customer_data.db")
+    rng = random.Random(seed)
+    results = {}
+    try:
+        started = time.perf_counter()
+        make_database(db_path, rows, seed)
+        results["generate"] = summarize([(time.perf_counter() - started) * 1000])
+        results["generate"]["size"] = os.path.getsize(db_path)
+
+        conn = db_pool.connect(db_path)
+        try:
+            bench_list(conn, results, repeat, rng)
+            bench_tree_fill(conn, results, repeat)
+            bench_dashboard(conn, results, repeat)
+            bench_reports(conn, results, repeat)
+            bench_dedup(conn, results, repeat, rng)
+            bench_login(conn, results, repeat)
+            bench_search(conn, results, repeat)
+            since = conn.execute(f"SELECT {history.NOW}").fetchone()[0]
+            bench_writes(conn, results, repeat, rng)
+            bench_history(conn, results, repeat, rng, since)
+        finally:
+            conn.close()
+
+        bench_backup(db_path, results, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def code_version():
+    """当前代码的 git 提交，不在 git 仓库中时返回 None"""
+    try:
+        output = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """对比两份结果，返回 [(规模, 测试项, 旧中位数, 新中位数, 变化比例), ...]"""
+    changes = []
+    for rows, items in new["results"].items():
+        previous = old.get("results", {}).get(rows, {})
+        for name, result in items.items():
+            before = previous.get(name, {}).get("median_ms")
+            after = result.get("median_ms")
+            if before and after is not None:
+                changes.append((rows, name, before, after, after / before - 1))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="客户数据库性能基准测试")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS),
+                        help="模拟客户数量，可以给多个规模（例如 10000 100000 1000000）")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每项测试重复的次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子，相同的种子生成相同的数据")
+    parser.add_argument("--output", help="结果文件，默认为 bench_<时间>.json")
+    parser.add_argument("--compare", help="与之前的结果文件对比")
+    args = parser.parse_args()
+
+    report = {
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "version": code_version(),
+        "schema_version": migrations.SCHEMA_VERSION,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": {},
+    }
+    for rows in args.rows:
+        print(f"{rows} 个客户…")
+        results = run(rows, args.repeat, args.seed)
+        report["results"][str(rows)] = results
+        for name, result in results.items():
+            if "median_ms" in result:
+                print(f"  {name:<28}{result['median_ms']:>10.2f} ms  (p95 {result['p95_ms']:.2f})")
+            else:
+                print(f"  {name:<28}{result['skipped']}")
+
+    output = args.output or f"bench_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        print(f"与 {args.compare}（{old.get('version') or '未知版本'}）对比：")
+        for rows, name, before, after, change in compare(old, report):
+            mark = "  ← 变慢" if change > REGRESSION_THRESHOLD else ""
+            print(f"  {rows:>8} {name:<28}{before:>10.2f} → {after:>8.2f} ms  {change:+.0%}{mark}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""命令行工具：不打开图形界面，可以在脚本和计划任务（cron / Windows 任务计划程序）中使用
+
+    python cli.py [--db data/customer_data.db] 命令 [参数]
+
+    backup [--auto] [--list]              备份；--auto 与界面的自动备份相同，到期且数据有变化时才备份
+    restore 备份文件|latest [--force]     从备份恢复，当前数据库先自动保存为一份备份
+    import 文件.csv|文件.xlsx              批量导入，校验不通过的行写入 *.rejects.csv
+    export 文件.csv|文件.xlsx|-            按条件导出，- 表示以 CSV 写到标准输出
+    search [关键词] [筛选条件] [--json]    按条件逐块输出客户（CSV，或每行一个 JSON 对象）
+    stats [--json]                         客户总数、各类型客户数和最近添加的客户
+    vacuum                                 整理数据库文件，回收删除数据后留下的空间
+    password                               修改管理员密码（从终端读取，或从标准输入读一行）
+
+不导入 tkinter、Pillow 和 sv_ttk，使用与界面相同的数据库和数据访问代码。界面或服务器正在使用
+数据库时，除 restore 外的命令都可以执行（WAL 模式下读写互不阻塞）；restore 要先关闭它们。
+出错时把原因写到标准错误并以非零状态退出。
+"""
+import argparse
+import csv
+import getpass
+import json
+import os
+import sqlite3
+import sys
+
+import accounts
+import backup
+import db_pool
+from exporter import EXPORT_COLUMNS
+import migrations
+from repository import FIELDS, SORT_FIELDS, CustomerFilter, CustomerRepository
+
+# importer、customers、stats 在对应的命令中才导入
+
+DEFAULT_DB = "data/customer_data.db"
+
+# search / export - 每次从游标取出并写出的行数
+OUTPUT_CHUNK_SIZE = 1000
+
+
+class CliError(Exception):
+    """命令无法执行，消息直接显示给用户"""
+
+
+def backup_dir_for(db_path):
+    """备份放在数据库所在目录下的 backups 中，与界面和服务器相同"""
+    return os.path.join(os.path.dirname(db_path), "backups")
+
+
+def open_database(db_path, create=False):
+    """打开数据库并升级到最新结构；create 为 False 时数据库必须已经存在"""
+    if not os.path.exists(db_path):
+        if not create:
+            raise CliError(f"数据库文件不存在: {db_path}")
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = db_pool.connect(db_path)
+    try:
+        migrations.migrate(conn)
+        accounts.ensure_admin(conn)
+        conn.commit()
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def format_size(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def database_size(db_path):
+    """数据库文件加上 -wal 文件的大小"""
+    return sum(os.path.getsize(db_path + suffix) for suffix in ("", "-wal") if os.path.exists(db_path + suffix))
+
+
+def filter_from_args(args):
+    """search / export 的筛选参数转成 CustomerFilter"""
+    return CustomerFilter(args.text, args.type, args.date_from, args.date_to, args.phone_prefix, args.notes,
+                          args.sort, not args.asc)
+
+
+def write_rows(conn, customer_filter, out, as_json=False, limit=None):
+    """按结果顺序逐块写出客户，返回写出的行数"""
+    repo = CustomerRepository(conn)
+    if as_json:
+        writer = None
+    else:
+        writer = csv.writer(out)
+        writer.writerow([title for field, title in EXPORT_COLUMNS])
+    written = 0
+    for rows in repo.iter_rows(repo.compile(customer_filter), OUTPUT_CHUNK_SIZE):
+        if limit is not None:
+            rows = rows[:limit - written]
+        if as_json:
+            out.writelines(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n" for row in rows)
+        else:
+            writer.writerows(rows)
+        out.flush()
+        written += len(rows)
+        if limit is not None and written >= limit:
+            break
+    return written
+
+
+# ---- 命令 ----
+
+def cmd_backup(args):
+    backup_dir = backup_dir_for(args.db)
+    if args.list:
+        backups = backup.list_backups(backup_dir)
+        for item in backups:
+            kind = item["note"] or ("自动" if item["automatic"] else "手动")
+            customers = "—" if item["customers"] is None else item["customers"]
+            print(f"{item['created']:%Y-%m-%d %H:%M:%S}  {kind:<4}{customers:>10} 个客户"
+                  f"{format_size(item['size']):>12}  {item['file']}")
+        if not backups:
+            print(f"{backup_dir} 中没有备份")
+        return
+
+    conn = open_database(args.db)
+    try:
+        if args.auto:
+            info = backup.auto_backup(conn, backup_dir)
+            if info is None:
+                print("未到自动备份时间，或数据与上一份备份相同，没有生成新备份")
+                return
+            removed = []
+        else:
+            info, removed = backup.run_backup(conn, backup_dir)
+    finally:
+        conn.close()
+    print(f"已备份 {info['customers']} 个客户到 {os.path.join(backup_dir, info['file'])}（{format_size(info['size'])}）")
+    for name in removed:
+        print(f"按保留策略删除旧备份: {name}")
+
+
+def cmd_restore(args):
+    backup_dir = backup_dir_for(args.db)
+    if args.backup == "latest":
+        backups = backup.list_backups(backup_dir)
+        if not backups:
+            raise CliError(f"{backup_dir} 中没有备份")
+        path = backups[0]["path"]
+    elif os.path.exists(args.backup):
+        path = args.backup
+    elif os.path.exists(os.path.join(backup_dir, args.backup)):
+        path = os.path.join(backup_dir, args.backup)
+    else:
+        raise CliError(f"找不到备份文件: {args.backup}")
+
+    # 最后一个连接正常关闭时 SQLite 会删除 -wal 文件，它还在说明界面或服务器可能正在使用数据库
+    if os.path.exists(args.db + "-wal") and not args.force:
+        raise CliError("数据库可能正在被界面或服务器使用（存在 -wal 文件），请先关闭它们；"
+                       "确认没有程序在使用后可以加 --force")
+
+    temp_path = backup.prepare_restore(path, args.db)
+    saved = backup.swap_in(temp_path, args.db, backup_dir)
+    # 用普通连接统计：关闭时会删除 -wal 文件，不影响下次判断数据库是否正在使用
+    conn = open_database(args.db)
+    try:
+        count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+    finally:
+        conn.close()
+    print(f"已从 {path} 恢复 {count} 个客户")
+    if saved:
+        print(f"恢复前的数据库已保存为 {os.path.join(backup_dir, saved)}")
+
+
+def cmd_import(args):
+    import importer
+
+    if not os.path.exists(args.file):
+        raise CliError(f"文件不存在: {args.file}")
+    conn = open_database(args.db, create=True)
+    try:
+        result = importer.import_customers(conn, args.file)
+    except importer.ImportFormatError as e:
+        raise CliError(f"导入失败，未导入任何数据: {e}")
+    finally:
+        conn.close()
+    print(f"成功导入 {result['imported']} 个客户（{result['rows_per_sec']:.0f} 行/秒）")
+    if result["rejected"]:
+        print(f"{result['rejected']} 行未通过校验，已写入: {result['rejects_path']}")
+
+
+def cmd_export(args):
+    import customers
+
+    conn = open_database(args.db)
+    try:
+        if args.file == "-":
+            write_rows(conn, filter_from_args(args), sys.stdout)
+            return
+        count = customers.export_customers(conn, args.file, filter_from_args(args))
+    finally:
+        conn.close()
+    print(f"已导出 {count} 个客户到: {args.file}")
+
+
+def cmd_search(args):
+    conn = open_database(args.db)
+    try:
+        write_rows(conn, filter_from_args(args), sys.stdout, args.json, args.limit)
+    finally:
+        conn.close()
+
+
+def cmd_stats(args):
+    import stats
+
+    conn = open_database(args.db)
+    try:
+        data = stats.load(conn, args.recent)
+    finally:
+        conn.close()
+    if args.json:
+        json.dump(dict(data, recent=[dict(zip(FIELDS, customer.astuple())) for customer in data["recent"]]),
+                  sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    print(f"客户总数: {data['total']}")
+    for customer_type, count in sorted(data["by_type"].items(), key=lambda item: -item[1]):
+        print(f"  {customer_type}: {count}")
+    if data["recent"]:
+        print("最近添加:")
+        for customer in data["recent"]:
+            print(f"  {customer.id:>8}  {customer.registration_date}  {customer.company_name}  "
+                  f"{customer.contact_name}  {customer.phone}  {customer.customer_type}")
+
+
+def cmd_vacuum(args):
+    conn = open_database(args.db)
+    try:
+        before = database_size(args.db)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        after = database_size(args.db)
+    finally:
+        conn.close()
+    print(f"整理完成: {format_size(before)} -> {format_size(after)}")
+
+
+def cmd_password(args):
+    if sys.stdin.isatty():
+        password = getpass.getpass("新密码: ")
+        if password != getpass.getpass("再次输入新密码: "):
+            raise CliError("两次输入的新密码不一致")
+    else:
+        password = sys.stdin.readline().rstrip("\r\n")
+    if not password:
+        raise CliError("密码不能为空")
+
+    conn = open_database(args.db)
+    try:
+        if conn.execute("SELECT 1 FROM users WHERE username = ?", (args.username,)).fetchone() is None:
+            raise CliError(f"用户不存在: {args.username}")
+        accounts.set_password(conn, args.username, password)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"{args.username} 的密码已更新")
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--type", default="所有", help="客户类型")
+    parser.add_argument("--from", dest="date_from", default="", help="登记日期从（YYYY-MM-DD）")
+    parser.add_argument("--to", dest="date_to", default="", help="登记日期到（YYYY-MM-DD）")
+    parser.add_argument("--phone-prefix", default="", help="电话前缀")
+    parser.add_argument("--notes", default="", help="备注关键词")
+    parser.add_argument("--sort", default="id", choices=SORT_FIELDS, help="排序列")
+    parser.add_argument("--asc", action="store_true", help="升序（默认降序）")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="凯川矿客户管理系统命令行工具")
+    parser.add_argument("--db", default=DEFAULT_DB, help="数据库文件")
+    commands = parser.add_subparsers(dest="command", metavar="命令")
+    commands.required = True
+
+    command = commands.add_parser("backup", help="备份数据库")
+    command.add_argument("--auto", action="store_true", help="按自动备份的规则：到期且数据有变化时才备份")
+    command.add_argument("--list", action="store_true", help="列出已有的备份")
+    command.set_defaults(func=cmd_backup)
+
+    command = commands.add_parser("restore", help="从备份恢复数据库（会覆盖当前数据和密码）")
+    command.add_argument("backup", help="备份文件（路径或 backups 中的文件名），latest 表示最新的一份")
+    command.add_argument("--force", action="store_true", help="存在 -wal 文件时仍然恢复")
+    command.set_defaults(func=cmd_restore)
+
+    command = commands.add_parser("import", help="从 CSV/Excel 文件批量导入客户")
+    command.add_argument("file", help="CSV 或 .xlsx 文件")
+    command.set_defaults(func=cmd_import)
+
+    command = commands.add_parser("export", help="导出客户到 CSV/Excel 文件")
+    command.add_argument("file", help="CSV 或 .xlsx 文件，- 表示以 CSV 写到标准输出")
+    command.add_argument("text", nargs="?", default="", help="搜索关键词")
+    add_filter_arguments(command)
+    command.set_defaults(func=cmd_export)
+
+    command = commands.add_parser("search", help="搜索客户，逐块输出")
+    command.add_argument("text", nargs="?", default="", help="搜索关键词（公司名称、客户名称、电话、备注）")
+    add_filter_arguments(command)
+    command.add_argument("--limit", type=int, help="最多输出的客户数")
+    command.add_argument("--json", action="store_true", help="每行输出一个 JSON 对象")
+    command.set_defaults(func=cmd_search)
+
+    command = commands.add_parser("stats", help="客户统计")
+    command.add_argument("--recent", type=int, default=5, help="列出的最近添加的客户数")
+    command.add_argument("--json", action="store_true", help="输出 JSON")
+    command.set_defaults(func=cmd_stats)
+
+    command = commands.add_parser("vacuum", help="整理数据库文件，回收空间")
+    command.set_defaults(func=cmd_vacuum)
+
+    command = commands.add_parser("password", help="修改管理员密码")
+    command.add_argument("--username", default=accounts.ADMIN_USERNAME, help="用户名")
+    command.set_defaults(func=cmd_password)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except BrokenPipeError:
+        # 输出被 head 等命令提前关闭，不再报错
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    except (CliError, backup.BackupError, migrations.SchemaVersionError, sqlite3.Error, ValueError, OSError,
+            RuntimeError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
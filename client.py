@@ -0,0 +1,304 @@
+"""局域网客户端：界面连接 server.py 时代替本地数据库
+
+下面的函数与 customers / accounts / stats / analytics / dedup / history 中的同名函数参数相同，只是第一个参数是 ApiClient
+而不是数据库连接，界面按运行模式选择其中一组交给工作线程执行。
+"""
+import contextlib
+import http.client
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+import customers
+from db_worker import DBExecutor, TaskCancelled, report_change
+import exporter
+import perf
+from repository import Customer, CustomerChange, CustomerFilter, CustomerQuery
+
+DEFAULT_PORT = 8765
+
+# 同时进行的只读请求数
+REMOTE_READERS = 2
+
+# 性能统计中接口路径里的客户 id 换成 {id}，同一个接口合并成一项
+_PATH_IDS = re.compile(r"/\d+(?=/|$)")
+
+
+class ApiError(Exception):
+    """服务器返回的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiClient:
+    """JSON 接口客户端，每个线程各用一条 keep-alive 连接
+
+    提供 DBExecutor 用到的 in_transaction 和 set_progress_handler，可以代替数据库连接交给工作线程；
+    任务被取消后，下一次请求前会抛出 TaskCancelled。
+    """
+
+    in_transaction = False
+
+    def __init__(self, base_url, timeout=30):
+        url = urllib.parse.urlsplit(base_url if "//" in base_url else "http://" + base_url)
+        self.host = url.hostname
+        self.port = url.port or DEFAULT_PORT
+        self.timeout = timeout
+        self.token = None
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def set_progress_handler(self, handler, n):
+        self._local.handler = handler
+
+    def _connection(self, renew=False):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and renew:
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def request(self, method, path, params=None, body=None):
+        """发送请求并返回解析后的 JSON，服务器返回错误时抛出 ApiError"""
+        handler = getattr(self._local, "handler", None)
+        if handler is not None and handler():
+            raise TaskCancelled()
+
+        name = f"{method} {_PATH_IDS.sub('/{id}', path)}"
+        if params:
+            path += "?" + urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+
+        # 服务器可能已经关闭了空闲的 keep-alive 连接，重连一次
+        started = time.perf_counter()
+        for attempt in range(2):
+            conn = self._connection(renew=attempt > 0)
+            try:
+                conn.request(method, path, payload, headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if attempt:
+                    raise
+
+        result = json.loads(data.decode("utf-8")) if data else {}
+        perf.STATS.record(perf.REQUEST, name, (time.perf_counter() - started) * 1000)
+        if response.status != 200:
+            raise ApiError(response.status, result.get("error") or f"服务器错误 {response.status}")
+        return result
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+class RemoteExecutor(DBExecutor):
+    """与 DBExecutor 用法相同，工作线程拿到的是 ApiClient
+
+    写请求仍在同一个线程中按提交顺序发送，读请求并发发送。
+    """
+
+    def __init__(self, root, api, poll_interval=30, readers=REMOTE_READERS):
+        self.api = api
+        self.path = None
+        session = lambda: contextlib.nullcontext(api)
+        self._start(root, poll_interval, session, session, readers)
+
+    def _release(self):
+        self.api.close()
+
+
+class RemotePager(customers.CustomerPager):
+    """通过服务器分页读取的客户列表，缓冲和滚动逻辑与本地相同"""
+
+    def __init__(self, customer_filter=None):
+        self.filter = customer_filter if customer_filter is not None else CustomerFilter()
+        # 筛选条件在服务器上编译，本地只需要排序方式来计算排序键
+        super().__init__(CustomerQuery(sort=self.filter.sort, descending=self.filter.descending))
+
+    def _params(self, **extra):
+        params = self.filter.params()
+        params.update(extra)
+        return params
+
+    def count(self, api):
+        data = api.request("GET", "/api/customers/count", self._params())
+        self.total = data["total"]
+        if data["rows"] is not None:
+            self.buffer = (0, [Customer(*row) for row in data["rows"]])
+        self.reusable = data["reusable"]
+        return self
+
+    def fetch(self, api, op=None, anchor=None, order="DESC", limit=customers.PAGE_SIZE, offset=0):
+        return [Customer(*row) for row in self.fetch_rows(api, op, anchor, order, limit, offset)]
+
+    def fetch_rows(self, api, op=None, anchor=None, order="DESC", limit=customers.PAGE_SIZE, offset=0):
+        """与 fetch 相同，但返回按 repository.FIELDS 顺序排列的元组"""
+        # 排序键可能是 (值, id)，以 JSON 传给服务器
+        params = self._params(op=op, anchor=json.dumps(anchor, ensure_ascii=False) if op else None,
+                              order=order, limit=limit, offset=offset)
+        return [tuple(row) for row in api.request("GET", "/api/customers", params)["rows"]]
+
+    def locate(self, api, offset):
+        rows = self.fetch(api, limit=1, offset=offset)
+        return self.query.key(rows[0]) if rows else None
+
+
+# ---- 与本地模块同名的操作 ----
+
+def check_login(api, username, password):
+    """登录服务器，成功后之后的请求都带上令牌"""
+    try:
+        api.token = api.request("POST", "/api/login", body={"username": username, "password": password})["token"]
+    except ApiError as e:
+        if e.status == 401:
+            return False
+        raise
+    return True
+
+
+def set_password(api, username, password):
+    api.request("POST", "/api/password", body={"password": password})
+
+
+def load_stats(api):
+    data = api.request("GET", "/api/stats")
+    data["recent"] = [Customer(*row) for row in data["recent"]]
+    return data
+
+
+def report(api):
+    return api.request("GET", "/api/analytics")
+
+
+def query_customers(api, customer_filter):
+    return RemotePager(customer_filter).count(api)
+
+
+def search_customers(api, text, customer_type=None, limit=50):
+    params = {"q": text, "type": customer_type, "limit": limit}
+    return [Customer(*row) for row in api.request("GET", "/api/customers/search", params)["rows"]]
+
+
+def get_customer(api, customer_id):
+    try:
+        return Customer(*api.request("GET", f"/api/customers/{customer_id}")["customer"])
+    except ApiError as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+def find_duplicates(api, data, exclude_id=None):
+    params = {field: data.get(field, "") for field in ("company_name", "contact_name", "phone")}
+    params["exclude"] = exclude_id
+    return [(Customer(*row), score, reasons)
+            for row, score, reasons in api.request("GET", "/api/customers/duplicates", params)["duplicates"]]
+
+
+def duplicate_report(api):
+    return [[Customer(*row) for row in group] for group in api.request("GET", "/api/duplicates")["groups"]]
+
+
+def _report_changes(result):
+    """把服务器返回的逐行修改报告给界面，与本地写操作相同"""
+    for values in result.get("changes", ()):
+        report_change(CustomerChange.fromtuple(values))
+    return result
+
+
+def add_customer(api, data):
+    return _report_changes(api.request("POST", "/api/customers", body=data))["id"]
+
+
+def update_customer(api, customer_id, data):
+    _report_changes(api.request("PUT", f"/api/customers/{customer_id}", body=data))
+
+
+def delete_customer(api, customer_id):
+    return _report_changes(api.request("DELETE", f"/api/customers/{customer_id}"))["deleted"]
+
+
+def customer_ids(api, customer_filter):
+    return api.request("GET", "/api/customers/ids", customer_filter.params())["ids"]
+
+
+def _batch(api, action, ids, value=None):
+    """批量操作，与本地版本一样返回修改前的客户"""
+    result = _report_changes(api.request("POST", "/api/customers/batch",
+                                         body={"action": action, "ids": list(ids), "value": value}))
+    return [Customer(*before) for kind, customer_id, before, after in result["changes"] if before is not None]
+
+
+def delete_customers(api, ids):
+    return _batch(api, "delete", ids)
+
+
+def set_customers_type(api, ids, customer_type):
+    return _batch(api, "type", ids, customer_type)
+
+
+def append_customers_notes(api, ids, text):
+    return _batch(api, "notes", ids, text)
+
+
+def restore_customers(api, customers):
+    body = {"customers": [customer.astuple() for customer in customers]}
+    return _report_changes(api.request("POST", "/api/customers/restore", body=body))["count"]
+
+
+def changed_since(api, as_of):
+    pairs = api.request("GET", "/api/history/changes", {"as_of": as_of})["changes"]
+    return [(then and Customer(*then), now and Customer(*now)) for then, now in pairs]
+
+
+def deleted_customers(api):
+    return [(changed_at, Customer(*row)) for changed_at, row in api.request("GET", "/api/history/deleted")["deleted"]]
+
+
+def timeline(api, customer_id):
+    entries = api.request("GET", f"/api/customers/{customer_id}/history")["entries"]
+    return [(changed_at, action, {field: tuple(values) for field, values in fields.items()})
+            for changed_at, action, fields in entries]
+
+
+def undelete(api, ids):
+    return _report_changes(api.request("POST", "/api/history/undelete", body={"ids": list(ids)}))["count"]
+
+
+def revert(api, ids, as_of):
+    body = {"ids": list(ids), "as_of": as_of}
+    return _report_changes(api.request("POST", "/api/history/revert", body=body))["count"]
+
+
+def export_customers(api, path, customer_filter, chunk_size=exporter.CHUNK_SIZE):
+    """按键集分页逐块下载并写入本地文件，返回导出的行数"""
+    pager = RemotePager(customer_filter)
+    total = api.request("GET", "/api/customers/count", pager._params())["total"]
+
+    def chunks():
+        anchor = None
+        while True:
+            rows = pager.fetch_rows(api, "<" if anchor is not None else None, anchor, limit=chunk_size)
+            if not rows:
+                return
+            anchor = pager.query.key(Customer(*rows[-1]))
+            yield rows
+
+    return exporter.write_file(path, chunks(), total)
@@ -0,0 +1,255 @@
+"""客户数据操作：搜索、分页读取和增删改（本地界面和局域网服务器共用）
+
+SQL 都在 repository.CustomerRepository 中，这里的函数以 (conn, ...) 为参数，
+可以直接交给工作线程执行；client 模块提供同名的远程版本。写操作不提交事务，由调用方提交：
+界面的写线程在任务成功后提交，服务器把同一批写请求合并在一个事务中提交。
+
+写操作把逐行的修改（repository.CustomerChange）交给 on_change，默认用 db_worker.report_change
+报告给界面，界面据此只更新变化的行。
+"""
+import datetime
+
+from db_worker import report_change
+import exporter
+from repository import CustomerError, CustomerQuery, CustomerRepository
+import search
+from validation import CUSTOMER_TYPES
+
+# 客户列表每次从数据库预取的行数（可见窗口之外的缓冲）
+PAGE_SIZE = 100
+
+# 结果不超过这么多行时整体读入内存，继续输入缩小范围时直接在内存中过滤
+MATERIALIZE_LIMIT = 2000
+
+
+class CustomerPager:
+    """客户列表数据源：按查询的排序键做键集分页，只缓存可见窗口附近的 Customer
+
+    count() 和 window() 需要数据库连接，在后台线程调用；cached() 只读缓冲区，
+    供主线程判断是否需要再查询。缓冲区以 (起始位置, 行列表) 整体替换，跨线程读取是安全的。
+    """
+
+    def __init__(self, query=None):
+        self.query = query if query is not None else CustomerQuery()
+        self.total = 0
+        # (缓冲区第一行在整个结果集中的位置, 缓冲区中的行)
+        self.buffer = (0, [])
+        # 结果能否在内存中按子串继续过滤
+        self.reusable = False
+
+    def fetch(self, conn, op=None, anchor=None, order="DESC", limit=PAGE_SIZE, offset=0):
+        """按结果顺序读取，op 为 "<="、"<" 或 ">" 时只读取从排序键 anchor 开始、之后或之前的行"""
+        return CustomerRepository(conn).page(self.query, op, anchor, order, limit, offset)
+
+    def locate(self, conn, offset):
+        """结果集中第 offset 行的排序键"""
+        return CustomerRepository(conn).key_at(self.query, offset)
+
+    @classmethod
+    def from_rows(cls, rows, query=None):
+        """用已经在内存中的完整结果构造数据源，不再访问数据库；query 给出行的排序方式"""
+        pager = cls(query)
+        pager.total = len(rows)
+        pager.buffer = (0, list(rows))
+        return pager
+
+    @property
+    def complete(self):
+        """缓冲区是否包含了整个结果集"""
+        start, rows = self.buffer
+        return start == 0 and len(rows) == self.total
+
+    def count(self, conn):
+        """统计结果总数，结果较少时顺便整体读入"""
+        self.total = CustomerRepository(conn).count(self.query)
+        if self.total <= MATERIALIZE_LIMIT:
+            self.buffer = (0, self.fetch(conn, limit=self.total))
+        return self
+
+    def cached(self, offset, size):
+        """缓冲区已包含所需窗口时直接返回，否则返回 None"""
+        start, rows = self.buffer
+        end = min(offset + size, self.total)
+        if end <= offset:
+            return []
+        if start <= offset and end <= start + len(rows):
+            return rows[offset - start:end - start]
+        return None
+
+    def window(self, conn, offset, size):
+        """返回结果集中 [offset, offset + size) 的行"""
+        start, rows = self.buffer
+        end = min(offset + size, self.total)
+        buffer_end = start + len(rows)
+        key = self.query.key
+
+        if not rows or offset > buffer_end + PAGE_SIZE or end < start - PAGE_SIZE:
+            # 跳转到任意位置：先定位锚点的排序键，再从锚点开始按键集读取
+            anchor = self.locate(conn, offset)
+            start = offset
+            rows = self.fetch(conn, "<=", anchor, limit=size + PAGE_SIZE) if anchor is not None else []
+        else:
+            # 向后滚动：读取排在缓冲区最后一行之后的行
+            if end > buffer_end:
+                need = end - buffer_end + PAGE_SIZE
+                rows = rows + self.fetch(conn, "<", key(rows[-1]), limit=need)
+            # 向前滚动：读取排在缓冲区第一行之前的行
+            if offset < start:
+                need = start - offset + PAGE_SIZE
+                older = self.fetch(conn, ">", key(rows[0]), "ASC", need)
+                older.reverse()
+                rows = older + rows
+                start = start - len(older) if len(older) == need else 0
+
+        # 丢弃离可见窗口太远的行，保持内存占用恒定
+        keep_from = max(offset - PAGE_SIZE - start, 0)
+        rows = rows[keep_from:end + PAGE_SIZE - start]
+        start += keep_from
+        self.buffer = (start, rows)
+
+        return rows[max(offset - start, 0):end - start]
+
+    # 以下三个方法在主线程中调用，不访问数据库：把已提交的单行修改直接应用到缓冲区。
+    # 调用方负责判断该行修改前后是否属于结果集，并且只在没有后台读取进行中时调用。
+
+    def _precedes(self, customer, row):
+        """customer 在结果中是否排在 row 之前"""
+        key = self.query.key
+        return key(customer) > key(row) if self.query.descending else key(customer) < key(row)
+
+    def insert(self, customer, offset=0):
+        """结果集中多了一行，返回原来的第 offset 行是否因此后移了一位"""
+        start, rows = self.buffer
+        self.total += 1
+        if not rows:
+            if self.total == 1:
+                self.buffer = (0, [customer])
+            return False
+        if self._precedes(customer, rows[0]):
+            if start == 0:
+                self.buffer = (0, [customer] + rows)
+                return True
+            # 排在缓冲区之前，具体位置不需要知道
+            self.buffer = (start + 1, rows)
+            return offset >= start
+        if self._precedes(rows[-1], customer):
+            if start + len(rows) == self.total - 1:
+                self.buffer = (start, rows + [customer])
+            return start + len(rows) <= offset
+        index = next(i for i, row in enumerate(rows) if self._precedes(customer, row))
+        self.buffer = (start, rows[:index] + [customer] + rows[index:])
+        return start + index <= offset
+
+    def remove(self, customer, offset=0):
+        """结果集中少了一行（customer 是它修改前的内容），返回原来的第 offset 行是否因此前移了一位"""
+        start, rows = self.buffer
+        self.total = max(self.total - 1, 0)
+        if rows and self._precedes(customer, rows[0]):
+            self.buffer = (max(start - 1, 0), rows)
+            return offset >= start
+        for index, row in enumerate(rows):
+            if row.id == customer.id:
+                self.buffer = (start, rows[:index] + rows[index + 1:])
+                return start + index < offset
+        return False
+
+    def replace(self, customer):
+        """结果集中一行的内容变了（仍属于结果集，排序键不变）"""
+        start, rows = self.buffer
+        for index, row in enumerate(rows):
+            if row.id == customer.id:
+                self.buffer = (start, rows[:index] + [customer] + rows[index + 1:])
+                return
+
+
+def query_customers(conn, customer_filter):
+    """按 CustomerFilter 统计客户，返回 CustomerPager，具体的行在滚动时按页读取"""
+    pager = CustomerPager(CustomerRepository(conn).compile(customer_filter)).count(conn)
+    # unicode61 分词是按词前缀匹配，内存中的子串过滤与之不一致
+    pager.reusable = search.fts_tokenizer(conn) != "unicode61"
+    return pager
+
+
+def search_customers(conn, text, customer_type=None, limit=50):
+    """按相关度返回最匹配的客户"""
+    return CustomerRepository(conn).search(text, customer_type, limit)
+
+
+def get_customer(conn, customer_id):
+    """读取一个客户，不存在时返回 None"""
+    return CustomerRepository(conn).get(customer_id)
+
+
+def add_customer(conn, data, registration_date=None, on_change=report_change):
+    """校验并添加客户，返回新客户的 id"""
+    if registration_date is None:
+        registration_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    return CustomerRepository(conn, on_change).add(data, registration_date)
+
+
+def update_customer(conn, customer_id, data, on_change=report_change):
+    """校验并修改客户资料（登记日期不变）"""
+    CustomerRepository(conn, on_change).update(customer_id, data)
+
+
+def delete_customer(conn, customer_id, on_change=report_change):
+    """删除客户，返回是否真的删除了一行"""
+    return CustomerRepository(conn, on_change).delete(customer_id)
+
+
+def customer_ids(conn, customer_filter):
+    """符合条件的全部客户 id（界面“全选”用）"""
+    repo = CustomerRepository(conn)
+    return repo.ids(repo.compile(customer_filter))
+
+
+# 以下批量操作都在调用方的一个事务中完成；前三个返回修改前的客户，交给 restore_customers 即可撤销
+
+def delete_customers(conn, ids, on_change=report_change):
+    """批量删除客户"""
+    before, collect = _collect_before(on_change)
+    CustomerRepository(conn, collect).delete_many(ids)
+    return before
+
+
+def set_customers_type(conn, ids, customer_type, on_change=report_change):
+    """把一批客户改成同一个客户类型"""
+    if customer_type not in CUSTOMER_TYPES:
+        raise CustomerError("客户类型只能是" + "或".join(CUSTOMER_TYPES))
+    before, collect = _collect_before(on_change)
+    CustomerRepository(conn, collect).update_many(ids, {"customer_type": customer_type})
+    return before
+
+
+def append_customers_notes(conn, ids, text, on_change=report_change):
+    """在一批客户的备注末尾追加同一段文字"""
+    text = text.strip()
+    if not text:
+        raise CustomerError("追加的备注不能为空")
+    before, collect = _collect_before(on_change)
+    CustomerRepository(conn, collect).append_notes(ids, text)
+    return before
+
+
+def restore_customers(conn, customers, on_change=report_change):
+    """把客户恢复成批量操作之前的内容，返回恢复的行数"""
+    return CustomerRepository(conn, on_change).restore(customers)
+
+
+def _collect_before(on_change):
+    """包装 on_change，同时收集每一行修改前的客户"""
+    before = []
+
+    def collect(change):
+        before.append(change.before)
+        if on_change is not None:
+            on_change(change)
+
+    return before, collect
+
+
+def export_customers(conn, path, customer_filter):
+    """按 CustomerFilter 把客户导出到文件（顺序与列表相同），返回导出的行数"""
+    repo = CustomerRepository(conn)
+    query = repo.compile(customer_filter)
+    return exporter.write_file(path, repo.iter_rows(query, exporter.CHUNK_SIZE), repo.count(query))
@@ -0,0 +1,165 @@
+"""数据库连接管理：WAL 模式、连接参数调优，一个写连接加一组只读连接
+
+WAL 模式下读不阻塞写、写也不阻塞读；synchronous=NORMAL 时提交不再等待磁盘同步，
+只在检查点时同步，断电最多丢失最近几次提交，但数据库不会损坏。
+"""
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+
+# 等待其他连接释放锁的最长时间（秒）
+BUSY_TIMEOUT = 30
+
+# 只读连接数量
+READER_COUNT = 2
+
+# 每个连接的页缓存（负数表示 KiB）
+CACHE_SIZE_KIB = 16 * 1024
+
+# 内存映射读取的上限（字节）
+MMAP_SIZE = 256 * 1024 * 1024
+
+# 每个连接缓存的已编译语句数（sqlite3 默认 128）；客户列表的筛选条件、排序列、
+# 方向和分页方式组合出的语句较多，缓存不够时会反复编译
+STATEMENT_CACHE_SIZE = 512
+
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KIB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class PoolClosed(Exception):
+    """连接池已关闭"""
+
+
+def configure(conn, readonly=False):
+    """设置连接参数；journal_mode 写在数据库文件里，由写连接设置一次即可"""
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def connect(path, readonly=False):
+    """打开一个调优过的连接（不经过连接池，供命令行工具和脚本使用）"""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    if not readonly:
+        conn.execute("PRAGMA journal_mode = WAL")
+    return configure(conn, readonly)
+
+
+def remove_wal_files(db_path):
+    """删除数据库旁残留的 -wal / -shm 文件，只能在没有任何连接时调用"""
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def checkpoint(db_path):
+    """把 WAL 中的内容全部写回数据库文件，之后单独复制数据库文件也是完整的"""
+    if not os.path.exists(db_path):
+        return
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+class ConnectionPool:
+    """一个写连接和最多 readers 个只读连接
+
+    writer() 同一时间只借给一个线程，保证写操作串行；reader() 从空闲连接中取一个，
+    没有空闲且未达上限时新建，否则等待归还。连接跨线程借用，每次只有一个线程使用。
+    """
+
+    def __init__(self, path, readers=READER_COUNT):
+        self.path = path
+        self.max_readers = readers
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        # 写连接打开后数据库已是 WAL 模式，只读连接才可以打开
+        self._ready = threading.Event()
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @contextlib.contextmanager
+    def writer(self):
+        """借出唯一的写连接"""
+        with self._writer_lock:
+            if self._closed:
+                raise PoolClosed("连接池已关闭")
+            if self._writer is None:
+                self._writer = connect(self.path)
+                self._ready.set()
+            yield self._writer
+
+    @contextlib.contextmanager
+    def reader(self):
+        """借出一个只读连接，用完自动归还"""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def _acquire_reader(self):
+        if self._closed:
+            raise PoolClosed("连接池已关闭")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._opened < self.max_readers
+            if create:
+                self._opened += 1
+        if create:
+            try:
+                if not self._ready.is_set():
+                    with self.writer():
+                        pass
+                return connect(self.path, readonly=True)
+            except BaseException:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return self._idle.get()
+
+    def close(self):
+        """关闭全部空闲连接和写连接；借出中的只读连接归还时关闭
+
+        最后一个连接关闭时 SQLite 会做检查点并删除 -wal 文件。
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            if self._writer is not None:
+                try:
+                    self._writer.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,203 @@
+"""后台数据库线程：所有 SQL 都在工作线程执行，结果回到 Tk 主线程"""
+import contextlib
+import queue
+import threading
+import time
+
+import db_pool
+import perf
+
+# 每执行多少条 SQLite 虚拟机指令检查一次取消标记
+PROGRESS_INTERVAL = 1000
+
+_local = threading.local()
+
+
+class TaskCancelled(Exception):
+    """任务已被取消"""
+
+
+class Task:
+    """提交给后台线程的一次数据库操作"""
+
+    def __init__(self, func, args, callback, errback, progress):
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.errback = errback
+        self.progress = progress
+        self.cancelled = False
+        self.done = False
+        # 任务中报告的数据修改，提交后交给主线程
+        self.changes = []
+
+    def cancel(self):
+        """取消任务：排队中的不再执行，执行中的查询会在下一个检查点中断"""
+        self.cancelled = True
+
+
+def current_task():
+    """返回当前工作线程正在执行的任务（在工作函数内部调用）"""
+    return getattr(_local, "task", None)
+
+
+def report_progress(done, total=None):
+    """在工作函数中汇报进度，主线程会调用提交任务时给出的 progress 回调"""
+    task = current_task()
+    if task is None:
+        return
+    if task.cancelled:
+        raise TaskCancelled()
+    if task.progress is not None:
+        _local.executor._results.put((task, "progress", (done, total)))
+
+
+def report_change(change):
+    """在工作函数中报告一次数据修改；任务提交后，主线程把本次任务的全部修改交给 subscribe 的监听函数
+
+    不在工作线程中调用时（例如服务器的写线程）什么也不做。
+    """
+    task = current_task()
+    if task is not None:
+        task.changes.append(change)
+
+
+class DBExecutor:
+    """专用数据库工作线程
+
+    一个写线程按提交顺序执行写任务，另有几个读线程并发执行只读任务，各自从连接池借用连接；
+    WAL 模式下读任务不会被写任务阻塞。主线程用 root.after 轮询结果队列并调用回调，
+    因此回调里可以直接操作界面。任务用 report_change 报告的数据修改在提交后
+    交给 subscribe 注册的监听函数，先于任务自己的回调。
+    """
+
+    def __init__(self, root, path, poll_interval=30, readers=db_pool.READER_COUNT):
+        self.path = path
+        self.pool = db_pool.ConnectionPool(path, readers)
+        self._start(root, poll_interval, self.pool.writer, self.pool.reader, readers)
+
+    def _start(self, root, poll_interval, borrow_writer, borrow_reader, readers):
+        """启动工作线程；borrow_writer / borrow_reader 是借出连接的上下文管理器工厂"""
+        self.root = root
+        self.poll_interval = poll_interval
+        self._tasks = queue.Queue()
+        self._read_tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._closed = False
+        self._listeners = []
+
+        self._threads = [threading.Thread(target=self._run, args=(self._tasks, borrow_writer),
+                                          name="db-writer", daemon=True)]
+        for index in range(readers):
+            self._threads.append(threading.Thread(target=self._run, args=(self._read_tasks, borrow_reader),
+                                                  name=f"db-reader-{index}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, func, *args, callback=None, errback=None, progress=None, readonly=False):
+        """在工作线程中执行 func(conn, *args)，func 返回后自动提交
+
+        readonly 为 True 时在读线程中用只读连接执行，不排在写任务后面，
+        只能看到提交时已经提交的数据；否则在写线程中按提交顺序执行。
+        callback(result)、errback(exception) 和 progress(done, total) 都在主线程调用；
+        被取消的任务不会调用任何回调。
+        """
+        if self._closed:
+            raise RuntimeError("数据库线程已关闭")
+        task = Task(func, args, callback, errback, progress)
+        (self._read_tasks if readonly and len(self._threads) > 1 else self._tasks).put(task)
+        return task
+
+    def subscribe(self, listener):
+        """任务提交的数据修改在主线程中交给 listener(changes)，changes 是按发生顺序排列的列表"""
+        self._listeners.append(listener)
+
+    @property
+    def closed(self):
+        """close() 之后为 True"""
+        return self._closed
+
+    def close(self):
+        """等待正在执行的任务结束并关闭所有连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._tasks.put(None)
+        for _ in self._threads[1:]:
+            self._read_tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._release()
+        self.root.after_cancel(self._poll_id)
+
+    def _release(self):
+        """所有工作线程结束后释放连接"""
+        self.pool.close()
+
+    def _run(self, tasks, borrow):
+        _local.executor = self
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            if task.cancelled:
+                continue
+            try:
+                with borrow() as conn:
+                    self._execute(conn, task)
+            except Exception as e:
+                # 连接打不开时同样交给 errback
+                self._results.put((task, "error", e))
+
+    def _execute(self, conn, task):
+        """执行任务：成功时提交任务留下的事务，失败时回滚"""
+        _local.task = task
+        conn.set_progress_handler(lambda: 1 if task.cancelled else 0, PROGRESS_INTERVAL)
+        started = time.perf_counter()
+        # 带进度的批量任务（导入、导出、备份等）只记录整个任务的耗时，逐条记录语句会明显拖慢它们
+        trace = perf.traced(conn) if task.progress is None else contextlib.nullcontext()
+        try:
+            with trace:
+                result = task.func(conn, *task.args)
+                if conn.in_transaction:
+                    conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            task.changes = []
+            if not task.cancelled and not isinstance(e, TaskCancelled):
+                self._results.put((task, "error", e))
+        else:
+            # 修改已经提交，即使任务在这期间被取消也要通知
+            if task.changes:
+                self._results.put((task, "changes", task.changes))
+            if not task.cancelled:
+                self._results.put((task, "done", result))
+        finally:
+            conn.set_progress_handler(None, 0)
+            _local.task = None
+            perf.STATS.record(perf.TASK, perf.task_name(task.func), (time.perf_counter() - started) * 1000)
+
+    def _poll(self):
+        # 先安排下一次轮询，回调抛出异常也不会让轮询停止
+        self._poll_id = self.root.after(self.poll_interval, self._poll)
+        while True:
+            try:
+                task, kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "changes":
+                for listener in self._listeners:
+                    listener(value)
+                continue
+            if task.cancelled:
+                continue
+            if kind == "progress":
+                task.progress(*value)
+                continue
+            task.done = True
+            if kind == "done" and task.callback is not None:
+                task.callback(value)
+            elif kind == "error" and task.errback is not None:
+                task.errback(value)
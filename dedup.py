@@ -0,0 +1,274 @@
+"""重复客户检测：同一家公司名称写法略有不同或电话相同
+
+- 电话：手机号经过校验、格式统一，直接用 idx_customers_phone 精确查找和分组；
+- 公司名称：去掉“有限公司”等后缀后取相邻两个字（bigram），用 MinHash 估计两个名称的相似度，
+  再按 LSH 分段（BANDS 段，每段 ROWS 个值）得到分桶键存入 customer_name_keys。相似的名称大概率
+  至少有一段相同，查找候选只需按键查表，不必与每个客户比较；候选再用真实的 bigram 相似度确认。
+
+分桶键要在 Python 中计算，触发器只把新增和改名的客户记入 customer_name_dirty（删除时直接删掉键），
+由 refresh() 分批补算。检查新客户时未补算的客户逐个比较，结果不受影响。修改 NUM_HASHES、BANDS、ROWS、
+NGRAM 或名称规范化规则后需要调用 rebuild()。
+"""
+import functools
+import hashlib
+import random
+import re
+import struct
+import unicodedata
+
+from db_worker import report_progress
+from repository import ID_CHUNK_SIZE, CustomerRepository
+
+# 名称切分的字数
+NGRAM = 2
+
+# MinHash 分 BANDS 段、每段 ROWS 个值：相似度 0.7 的名称约 92% 至少有一段相同，0.3 的约 15%
+BANDS = 6
+ROWS = 3
+NUM_HASHES = BANDS * ROWS
+
+# 公司名称 bigram 相似度（Jaccard）达到这个值才算可能重复
+NAME_SIMILARITY = 0.7
+
+# 名称末尾去掉的通用后缀，按长度从长到短排列
+COMPANY_SUFFIXES = ("股份有限公司", "有限责任公司", "集团有限公司", "有限公司", "集团", "公司")
+NAME_NOISE = re.compile(r"[\s\W_]+")
+
+# 检查一个新客户时每个分桶最多确认的候选数、最多逐个比较的未补算客户数，以及最多返回的结果数
+CANDIDATE_LIMIT = 20
+DIRTY_SCAN_LIMIT = 2000
+DUPLICATE_LIMIT = 10
+
+# refresh() 每批补算的客户数
+REFRESH_CHUNK = 5000
+
+# MinHash 的哈希函数 h(x) = (a * x + b) mod P，参数固定，保存的分桶键才能一直使用
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_HASH_PARAMS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(NUM_HASHES)]
+del _rng
+
+
+def install(conn):
+    """创建分桶键表及维护触发器，现有客户全部记为待补算（由调用方提交事务）"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS customer_name_keys (
+        key INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        PRIMARY KEY (key, customer_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customer_name_keys_customer ON customer_name_keys (customer_id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS customer_name_dirty (customer_id INTEGER PRIMARY KEY)")
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_name_keys_ai AFTER INSERT ON customers BEGIN
+        INSERT OR IGNORE INTO customer_name_dirty (customer_id) VALUES (new.id);
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_name_keys_ad AFTER DELETE ON customers BEGIN
+        DELETE FROM customer_name_keys WHERE customer_id = old.id;
+        DELETE FROM customer_name_dirty WHERE customer_id = old.id;
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_name_keys_au AFTER UPDATE OF company_name ON customers
+    WHEN old.company_name IS NOT new.company_name BEGIN
+        DELETE FROM customer_name_keys WHERE customer_id = old.id;
+        INSERT OR IGNORE INTO customer_name_dirty (customer_id) VALUES (new.id);
+    END''')
+
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """清空分桶键，全部客户记为待补算"""
+    conn.execute("DELETE FROM customer_name_keys")
+    conn.execute("INSERT OR IGNORE INTO customer_name_dirty (customer_id) SELECT id FROM customers")
+
+
+def normalize_name(name):
+    """统一全角半角和大小写，去掉空白、标点和通用后缀"""
+    name = NAME_NOISE.sub("", unicodedata.normalize("NFKC", name or "").lower())
+    for suffix in COMPANY_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def name_grams(name):
+    """规范化后的名称切成的 bigram 集合，不足两个字时就是名称本身"""
+    name = normalize_name(name)
+    if len(name) <= NGRAM:
+        return {name} if name else set()
+    return {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}
+
+
+def similarity(grams, other):
+    """两个 bigram 集合的 Jaccard 相似度"""
+    if not grams or not other:
+        return 0.0
+    return len(grams & other) / len(grams | other)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _gram_hashes(gram):
+    # bigram 在每个哈希函数下的值；常用字组合有限，缓存后签名只需逐列取最小值
+    value = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "little")
+    return tuple((a * value + b) % _PRIME for a, b in _HASH_PARAMS)
+
+
+def name_keys(grams):
+    """bigram 集合的 LSH 分桶键（BANDS 个 64 位整数），名称为空时没有键"""
+    if not grams:
+        return []
+    signature = [min(column) for column in zip(*map(_gram_hashes, grams))]
+    keys = []
+    for band in range(BANDS):
+        packed = struct.pack(f"<B{ROWS}Q", band, *signature[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "little", signed=True))
+    return keys
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def company_grams(company_name):
+    """公司名称的 bigram 集合；同名的客户很多，缓存后每个名称只切分一次"""
+    return frozenset(name_grams(company_name))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def company_keys(company_name):
+    """公司名称的分桶键，同样按名称缓存"""
+    return tuple(name_keys(company_grams(company_name)))
+
+
+def refresh(conn, limit=None):
+    """补算待补算客户的分桶键（由调用方提交），limit 为本次最多处理的客户数，返回处理的客户数"""
+    total = conn.execute("SELECT COUNT(*) FROM customer_name_dirty").fetchone()[0]
+    if limit is not None:
+        total = min(total, limit)
+    done = 0
+    while done < total:
+        rows = conn.execute('''
+        SELECT d.customer_id, c.company_name FROM customer_name_dirty AS d
+        LEFT JOIN customers AS c ON c.id = d.customer_id
+        ORDER BY d.customer_id LIMIT ?
+        ''', (min(REFRESH_CHUNK, total - done),)).fetchall()
+        if not rows:
+            break
+        ids = [(customer_id,) for customer_id, company_name in rows]
+        conn.executemany("DELETE FROM customer_name_keys WHERE customer_id = ?", ids)
+        conn.executemany("INSERT OR IGNORE INTO customer_name_keys (key, customer_id) VALUES (?, ?)",
+                         [(key, customer_id) for customer_id, company_name in rows if company_name is not None
+                          for key in company_keys(company_name)])
+        conn.executemany("DELETE FROM customer_name_dirty WHERE customer_id = ?", ids)
+        done += len(rows)
+        report_progress(done, total)
+    return done
+
+
+def find_duplicates(conn, data, exclude_id=None, limit=DUPLICATE_LIMIT):
+    """查找与 data（公司名称、客户名称、电话）可能重复的客户（只读）
+
+    返回 [(客户, 公司名称相似度, 原因)]，原因是“电话相同”“公司名称相似”“客户名称相同”的列表，
+    电话相同的排在前面，其余按相似度从高到低。
+    """
+    grams = company_grams(data.get("company_name", ""))
+    phone = (data.get("phone") or "").strip()
+    contact = normalize_name(data.get("contact_name", ""))
+
+    candidates = set()
+    if phone:
+        candidates.update(row[0] for row in conn.execute("SELECT id FROM customers WHERE phone = ?", (phone,)))
+    for key in company_keys(data.get("company_name", "")):
+        # 同名客户很多时桶会很大，每个桶只沿主键索引取最新的一批
+        candidates.update(row[0] for row in conn.execute(
+            "SELECT customer_id FROM customer_name_keys WHERE key = ? ORDER BY customer_id DESC LIMIT ?",
+            (key, CANDIDATE_LIMIT)))
+    if grams:
+        candidates.update(row[0] for row in conn.execute(
+            "SELECT customer_id FROM customer_name_dirty ORDER BY customer_id DESC LIMIT ?", (DIRTY_SCAN_LIMIT,)))
+    candidates.discard(exclude_id)
+
+    results = []
+    for customer in CustomerRepository(conn).get_many(candidates).values():
+        score = similarity(grams, company_grams(customer.company_name))
+        reasons = []
+        if phone and customer.phone == phone:
+            reasons.append("电话相同")
+        if score >= NAME_SIMILARITY:
+            reasons.append("公司名称相似")
+        if not reasons:
+            continue
+        if contact and normalize_name(customer.contact_name) == contact:
+            reasons.append("客户名称相同")
+        results.append((customer, score, reasons))
+    results.sort(key=lambda item: ("电话相同" not in item[2], -item[1], -item[0].id))
+    return results[:limit]
+
+
+class _Clusters:
+    """并查集，把两两判定为重复的客户合并成组"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        while parent != item:
+            grandparent = self.parent[parent]
+            self.parent[item] = grandparent
+            item, parent = parent, self.parent.setdefault(grandparent, grandparent)
+        return item
+
+    def union(self, item, other):
+        root, other_root = self.find(item), self.find(other)
+        if root != other_root:
+            self.parent[max(root, other_root)] = min(root, other_root)
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [sorted(members) for members in groups.values() if len(members) > 1]
+
+
+def duplicate_report(conn):
+    """全表查重：补算分桶键后（需要可写的连接，由调用方提交）返回重复客户组 [[客户, ...], ...]
+
+    电话相同的客户按电话索引分组；名称只在同一个分桶内比较，桶内只比较不同的写法，
+    总耗时与客户数大致成正比。组按人数从多到少排列，组内按 id 排列。
+    """
+    refresh(conn)
+    clusters = _Clusters()
+
+    for (ids,) in conn.execute("SELECT group_concat(id) FROM customers GROUP BY phone HAVING COUNT(*) > 1"):
+        ids = [int(customer_id) for customer_id in ids.split(",")]
+        for customer_id in ids[1:]:
+            clusters.union(ids[0], customer_id)
+
+    buckets = [[int(customer_id) for customer_id in ids.split(",")] for (ids,) in conn.execute(
+        "SELECT group_concat(customer_id) FROM customer_name_keys GROUP BY key HAVING COUNT(*) > 1")]
+    grams = {}
+    needed = sorted({customer_id for bucket in buckets for customer_id in bucket})
+    for start in range(0, len(needed), ID_CHUNK_SIZE):
+        chunk = needed[start:start + ID_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        for customer_id, company_name in conn.execute(
+                f"SELECT id, company_name FROM customers WHERE id IN ({placeholders})", chunk):
+            grams[customer_id] = company_grams(company_name)
+    for bucket in buckets:
+        # 同一个桶里多是规范化后完全相同的名称，直接合并；不同写法之间才逐对比较
+        variants = {}
+        for customer_id in bucket:
+            first = variants.setdefault(grams[customer_id], customer_id)
+            clusters.union(first, customer_id)
+        variants = list(variants.items())
+        for index, (variant, first) in enumerate(variants):
+            for other, other_first in variants[index + 1:]:
+                if similarity(variant, other) >= NAME_SIMILARITY:
+                    clusters.union(first, other_first)
+
+    groups = clusters.groups()
+    customers = CustomerRepository(conn).get_many(customer_id for group in groups for customer_id in group)
+    groups.sort(key=lambda group: (-len(group), group[0]))
+    return [[customers[customer_id] for customer_id in group] for group in groups]
@@ -0,0 +1,94 @@
+"""把客户列表流式导出为 CSV / Excel"""
+import csv
+import os
+
+from db_worker import report_progress
+
+# 每次从游标取出的行数
+CHUNK_SIZE = 5000
+
+# Excel 单个工作表最多 1048576 行（含表头），超出后自动换到新的工作表
+XLSX_SHEET_ROWS = 1048575
+
+EXPORT_COLUMNS = (
+    ("id", "id"),
+    ("company_name", "公司名称"),
+    ("contact_name", "客户名称"),
+    ("phone", "联系电话"),
+    ("customer_type", "客户类型"),
+    ("notes", "备注"),
+    ("registration_date", "登记日期"),
+)
+
+
+class CsvSink:
+    """CSV 写入器，带 BOM 以便 Excel 直接打开不乱码"""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([title for _, title in EXPORT_COLUMNS])
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxSink:
+    """Excel 写入器，使用 openpyxl 的 write_only 模式逐行写出"""
+
+    def __init__(self, path):
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("导出 Excel 文件需要安装 openpyxl: pip install openpyxl")
+        self.path = path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        index = len(self.workbook.worksheets) + 1
+        self.sheet = self.workbook.create_sheet("客户" if index == 1 else f"客户{index}")
+        self.sheet.append([title for _, title in EXPORT_COLUMNS])
+        self.sheet_rows = 0
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.sheet_rows >= XLSX_SHEET_ROWS:
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+def write_file(path, chunks, total=None):
+    """把一块块的行写入 path（按扩展名选择 CSV 或 XLSX），返回写出的行数
+
+    先写入临时文件，完成后再改名，中途失败或被取消时不会留下不完整的文件。
+    """
+    temp_path = path + ".part"
+    ext = os.path.splitext(path)[1].lower()
+    sink = XlsxSink(temp_path) if ext in (".xlsx", ".xlsm") else CsvSink(temp_path)
+    exported = 0
+    try:
+        # 无论写入是否成功都只关闭一次：openpyxl 的 write_only 工作簿不能保存两次
+        try:
+            for rows in chunks:
+                sink.write_rows(rows)
+                exported += len(rows)
+                report_progress(exported, total)
+        finally:
+            sink.close()
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return exported
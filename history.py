@@ -0,0 +1,240 @@
+"""客户修改历史：触发器把每次添加、修改、删除追加到 customer_history，用于查看历史状态和恢复误删
+
+每条记录只保存“修改前”的内容（反向差异），界面和服务器的写操作都不需要改动：
+
+    I  添加，data 为空（在此之前该客户不存在）
+    U  修改，data 为被修改的字段修改前的值，例如 {"phone": "13800000000"}
+    D  删除，data 为删除前的整行
+
+从当前数据出发，按时间倒序撤回某一时刻之后的记录就得到当时的状态，耗时只与那之后的修改数量有关，
+与历史总量无关。历史记录写在与修改相同的事务中，随写线程的批量提交一起落盘。
+安装之前的修改没有记录，这些客户在更早的时间点上按当前内容显示。
+"""
+import datetime
+import json
+
+from db_worker import report_change
+from repository import FIELDS, Customer, CustomerRepository
+
+# 单个客户的修改记录最多读取的条数
+TIMELINE_LIMIT = 200
+
+# 某一时刻之后修改过、以及已删除的客户最多列出的个数
+CHANGES_LIMIT = 5000
+
+ACTIONS = {"I": "添加", "U": "修改", "D": "删除"}
+
+# 历史记录中的时间精确到毫秒，与登记日期一样用本地时间
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+_EDITABLE = [field for field in FIELDS if field != "id"]
+
+
+def _row_json(prefix):
+    """触发器中把 old/new 整行转成 JSON 的表达式"""
+    return "json_object(" + ", ".join(f"'{field}', {prefix}.{field}" for field in _EDITABLE) + ")"
+
+
+def _diff_json():
+    """触发器中只包含被修改字段修改前的值的 JSON 表达式"""
+    parts = " UNION ALL ".join(f"SELECT '{field}' AS field, old.{field} AS value WHERE old.{field} IS NOT new.{field}"
+                               for field in _EDITABLE)
+    return f"(SELECT json_group_object(field, value) FROM ({parts}))"
+
+
+def install(conn):
+    """创建历史表、索引和触发器（由调用方提交事务）"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS customer_history (
+        id INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        changed_at TEXT NOT NULL,
+        action TEXT NOT NULL,
+        data TEXT
+    )
+    ''')
+    # 按客户查看记录、按时间撤回修改，以及列出已删除的客户
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customer_history_customer ON customer_history (customer_id, changed_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customer_history_time ON customer_history (changed_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customer_history_deleted ON customer_history (changed_at)"
+                 " WHERE action = 'D'")
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS customer_history_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customer_history (customer_id, changed_at, action) VALUES (new.id, {NOW}, 'I');
+    END''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS customer_history_ad AFTER DELETE ON customers BEGIN
+        INSERT INTO customer_history (customer_id, changed_at, action, data)
+        VALUES (old.id, {NOW}, 'D', {_row_json("old")});
+    END''')
+    changed = " OR ".join(f"old.{field} IS NOT new.{field}" for field in _EDITABLE)
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS customer_history_au AFTER UPDATE ON customers WHEN {changed} BEGIN
+        INSERT INTO customer_history (customer_id, changed_at, action, data)
+        VALUES (new.id, {NOW}, 'U', {_diff_json()});
+    END''')
+
+
+def _apply(state, customer_id, action, data):
+    """把一条记录撤回到 state（Customer 或 None）上，得到这条记录之前的状态"""
+    if action == "I":
+        return None
+    if action == "D":
+        return Customer(customer_id, **json.loads(data))
+    if state is None:
+        # 历史不完整（例如恢复了别处的备份），无法撤回修改
+        return None
+    values = dict(zip(FIELDS, state.astuple()))
+    values.update(json.loads(data))
+    return Customer(**values)
+
+
+def parse_as_of(text):
+    """检查时间点的格式（YYYY-MM-DD 或 YYYY-MM-DD HH:MM[:SS]），返回去掉首尾空白的字符串
+
+    格式不对时抛出 ValueError。
+    """
+    text = text.strip()
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"):
+        try:
+            datetime.datetime.strptime(text, fmt)
+            return text
+        except ValueError:
+            pass
+    raise ValueError("时间格式应为 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS")
+
+
+def _cutoff(as_of):
+    """只有日期时表示当天结束时的状态，只到分钟时表示这一分钟结束时"""
+    if len(as_of) == 10:
+        return as_of + " 23:59:59.999"
+    if len(as_of) == 16:
+        return as_of + ":59.999"
+    return as_of + ".999" if len(as_of) == 19 else as_of
+
+
+def timeline(conn, customer_id, limit=TIMELINE_LIMIT):
+    """客户的修改记录，最新的在前：[(时间, 动作, {字段: (修改前, 修改后)})]"""
+    state = CustomerRepository(conn).get(customer_id)
+    entries = []
+    for changed_at, action, data in conn.execute(
+            "SELECT changed_at, action, data FROM customer_history WHERE customer_id = ?"
+            " ORDER BY changed_at DESC, id DESC LIMIT ?", (customer_id, limit)):
+        before = _apply(state, customer_id, action, data)
+        old = dict(zip(FIELDS, before.astuple())) if before is not None else {}
+        new = dict(zip(FIELDS, state.astuple())) if state is not None else {}
+        entries.append((changed_at, action, {field: (old.get(field), new.get(field)) for field in _EDITABLE
+                                             if old.get(field) != new.get(field)}))
+        state = before
+    return entries
+
+
+def customer_as_of(conn, customer_id, as_of):
+    """客户在 as_of（YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS）时的内容，当时不存在时返回 None"""
+    state = CustomerRepository(conn).get(customer_id)
+    for action, data in conn.execute(
+            "SELECT action, data FROM customer_history WHERE customer_id = ? AND changed_at > ?"
+            " ORDER BY changed_at DESC, id DESC", (customer_id, _cutoff(as_of))):
+        state = _apply(state, customer_id, action, data)
+    return state
+
+
+def changed_since(conn, as_of, limit=CHANGES_LIMIT):
+    """as_of 之后有过修改的客户：[(当时的内容, 现在的内容)]，不存在时为 None，按客户 id 倒序
+
+    只读取 as_of 之后的历史记录，时间点越近越快。
+    """
+    cursor = conn.execute("SELECT customer_id, action, data FROM customer_history WHERE changed_at > ?"
+                          " ORDER BY changed_at DESC, id DESC", (_cutoff(as_of),))
+    entries = cursor.fetchall()
+    ids = sorted({customer_id for customer_id, action, data in entries}, reverse=True)[:limit]
+    current = CustomerRepository(conn).get_many(ids)
+    states = {customer_id: current.get(customer_id) for customer_id in ids}
+    for customer_id, action, data in entries:
+        if customer_id in states:
+            states[customer_id] = _apply(states[customer_id], customer_id, action, data)
+    return [(states[customer_id], current.get(customer_id)) for customer_id in ids
+            if states[customer_id] is not None or current.get(customer_id) is not None]
+
+
+def deleted_customers(conn, limit=CHANGES_LIMIT):
+    """已删除（且没有恢复）的客户：[(删除时间, 删除前的内容)]，最近删除的在前"""
+    result = []
+    seen = set()
+    for customer_id, changed_at, data in conn.execute('''
+    SELECT h.customer_id, h.changed_at, h.data FROM customer_history AS h
+    WHERE h.action = 'D' AND NOT EXISTS (SELECT 1 FROM customers AS c WHERE c.id = h.customer_id)
+    ORDER BY h.changed_at DESC
+    '''):
+        if customer_id in seen:
+            continue
+        seen.add(customer_id)
+        result.append((changed_at, Customer(customer_id, **json.loads(data))))
+        if len(result) >= limit:
+            break
+    return result
+
+
+def undelete(conn, ids, on_change=report_change):
+    """按最近一次删除前的内容恢复已删除的客户（原 id 不变），返回恢复的客户数"""
+    customers = []
+    for customer_id in ids:
+        row = conn.execute("SELECT data FROM customer_history WHERE customer_id = ? AND action = 'D'"
+                           " ORDER BY changed_at DESC, id DESC LIMIT 1", (customer_id,)).fetchone()
+        if row is not None and conn.execute("SELECT 1 FROM customers WHERE id = ?", (customer_id,)).fetchone() is None:
+            customers.append(Customer(customer_id, **json.loads(row[0])))
+    return CustomerRepository(conn, on_change).restore(customers)
+
+
+def revert(conn, ids, as_of, on_change=report_change):
+    """把客户改回 as_of 时的内容：当时已删除的重新插入，当时还不存在的删除，返回改动的客户数"""
+    repo = CustomerRepository(conn, on_change)
+    restore, delete = [], []
+    for customer_id in ids:
+        then = customer_as_of(conn, customer_id, as_of)
+        if then is not None:
+            restore.append(then)
+        else:
+            delete.append(customer_id)
+    return repo.restore(restore) + repo.delete_many(delete)
+
+
+def carry_over(conn, current_path):
+    """恢复备份时把正在使用的数据库的历史接到还原出来的数据库 conn 上并提交（只读取当前数据库）
+
+    conn 中的历史换成当前数据库的完整历史，再把这次恢复造成的差异按恢复时间记录下来：
+    恢复后消失的客户记为删除，内容不同的记为修改，多出来的记为添加。之后可以查看恢复前的状态，
+    或者把误恢复覆盖掉的客户找回来。当前数据库没有历史表（更早的版本）时只记录恢复造成的差异。
+    """
+    conn.execute("ATTACH DATABASE ? AS current", (current_path,))
+    try:
+        has_history = conn.execute("SELECT 1 FROM current.sqlite_master WHERE type = 'table'"
+                                   " AND name = 'customer_history'").fetchone() is not None
+        conn.execute("DELETE FROM main.customer_history")
+        if has_history:
+            conn.execute("INSERT INTO main.customer_history SELECT * FROM current.customer_history")
+
+        now = conn.execute(f"SELECT {NOW}").fetchone()[0]
+        conn.execute(f'''
+        INSERT INTO main.customer_history (customer_id, changed_at, action, data)
+        SELECT c.id, ?, 'D', {_row_json("c")} FROM current.customers AS c
+        WHERE NOT EXISTS (SELECT 1 FROM main.customers AS m WHERE m.id = c.id)
+        ''', (now,))
+        changed = " OR ".join(f"c.{field} IS NOT m.{field}" for field in _EDITABLE)
+        diff = " UNION ALL ".join(f"SELECT '{field}' AS field, c.{field} AS value WHERE c.{field} IS NOT m.{field}"
+                                  for field in _EDITABLE)
+        conn.execute(f'''
+        INSERT INTO main.customer_history (customer_id, changed_at, action, data)
+        SELECT c.id, ?, 'U', (SELECT json_group_object(field, value) FROM ({diff}))
+        FROM current.customers AS c JOIN main.customers AS m ON m.id = c.id
+        WHERE {changed}
+        ''', (now,))
+        conn.execute('''
+        INSERT INTO main.customer_history (customer_id, changed_at, action)
+        SELECT m.id, ?, 'I' FROM main.customers AS m
+        WHERE NOT EXISTS (SELECT 1 FROM current.customers AS c WHERE c.id = m.id)
+        ''', (now,))
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE current")
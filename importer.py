@@ -0,0 +1,241 @@
+"""从 CSV / Excel 批量导入客户"""
+import csv
+import datetime
+import io
+import os
+import time
+
+from db_worker import report_progress
+from repository import CustomerRepository
+import search
+from validation import validate_customer
+
+# 每批 executemany 的行数，所有批次在同一个事务中
+BATCH_SIZE = 5000
+
+# 表头到字段的映射，中英文表头都可以识别
+HEADER_ALIASES = {
+    "company_name": ("公司名称", "公司", "company_name", "company"),
+    "contact_name": ("客户名称", "联系人", "contact_name", "contact"),
+    "phone": ("联系电话", "电话", "手机", "phone"),
+    "customer_type": ("客户类型", "类型", "customer_type", "type"),
+    "notes": ("备注", "notes"),
+    "registration_date": ("登记日期", "registration_date", "date"),
+}
+
+
+class ImportFormatError(Exception):
+    """文件格式无法识别"""
+
+
+def map_header(header):
+    """返回 {字段: 列序号}，缺少必填列时抛出 ImportFormatError"""
+    normalized = [str(name).strip().lower() if name is not None else "" for name in header]
+    columns = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias.lower() in normalized:
+                columns[field] = normalized.index(alias.lower())
+                break
+
+    missing = [HEADER_ALIASES[field][0] for field in ("company_name", "contact_name", "phone")
+               if field not in columns]
+    if missing:
+        raise ImportFormatError("文件缺少必需的列: " + "、".join(missing))
+    return columns
+
+
+def cell_text(value):
+    """单元格转文本：Excel 会把手机号存成数字，日期存成 datetime"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value).strip()
+
+
+def detect_encoding(path):
+    """CSV 可能是 UTF-8（含 BOM）或 Excel 另存的 GBK"""
+    with open(path, "rb") as f:
+        sample = f.read(65536)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # 样本末尾被截断的多字节字符不算
+        if e.start < len(sample) - 3:
+            return "gbk"
+    return "utf-8-sig"
+
+
+def read_csv(path):
+    """逐行读取 CSV，产出 (行, 已读字节, 总字节)"""
+    total = os.path.getsize(path)
+    raw = open(path, "rb")
+    try:
+        text = io.TextIOWrapper(raw, encoding=detect_encoding(path), newline="")
+        for row in csv.reader(text):
+            yield row, raw.tell(), total
+    finally:
+        raw.close()
+
+
+def read_xlsx(path):
+    """以只读模式逐行读取第一个工作表，产出 (行, 已读行数, 总行数)"""
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFormatError("导入 Excel 文件需要安装 openpyxl: pip install openpyxl")
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = sheet.max_row or 0
+        for index, row in enumerate(sheet.iter_rows(values_only=True), 1):
+            yield row, index, total
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """按扩展名选择读取方式"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return read_csv(path)
+    if ext in (".xlsx", ".xlsm"):
+        return read_xlsx(path)
+    raise ImportFormatError("只支持 .csv 和 .xlsx 文件")
+
+
+def import_customers(conn, path, rejects_path=None, batch_size=BATCH_SIZE):
+    """把文件中的客户导入数据库，返回导入结果统计
+
+    文件逐行流式读取，内存占用与文件大小无关；校验不通过的行连同原因写入 rejects_path
+    （默认为源文件旁的 *.rejects.csv）。全部行在一个事务中提交，中途出错或被取消时不会留下半批数据。
+    """
+    if rejects_path is None:
+        rejects_path = os.path.splitext(path)[0] + ".rejects.csv"
+
+    started = time.perf_counter()
+    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    imported = 0
+    rejected = 0
+    batch = []
+    rejects_file = None
+    rejects_writer = None
+
+    rows = read_rows(path)
+    try:
+        first = next(rows, None)
+        if first is None:
+            raise ImportFormatError("文件是空的")
+        header = first[0]
+        columns = map_header(header)
+
+        repo = CustomerRepository(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        # 逐行维护全文索引是导入的主要开销，改为导入结束后整批写入
+        fts_state = search.pause_sync(conn)
+        for line, (row, done, total) in enumerate(rows, 2):
+            if not any(cell_text(value) for value in row):
+                continue
+            values = {field: cell_text(row[index]) if index < len(row) else ""
+                      for field, index in columns.items()}
+
+            values.setdefault("customer_type", "精煤")
+            values.setdefault("notes", "")
+            # 没有登记日期列或单元格为空时按导入当天登记；填了但格式不对的行不导入
+            if not values.get("registration_date"):
+                values["registration_date"] = today
+
+            error = validate_customer(values)
+            if not error and not _valid_date(values["registration_date"]):
+                error = "登记日期格式应为 YYYY-MM-DD"
+            if error:
+                if rejects_writer is None:
+                    rejects_file = open(rejects_path, "w", encoding="utf-8-sig", newline="")
+                    rejects_writer = csv.writer(rejects_file)
+                    rejects_writer.writerow(["行号"] + [cell_text(name) for name in header] + ["错误原因"])
+                rejects_writer.writerow([line] + [cell_text(value) for value in row] + [error])
+                rejected += 1
+                continue
+
+            batch.append((values["company_name"], values["contact_name"], values["phone"],
+                          values["customer_type"], values["notes"], values["registration_date"]))
+            if len(batch) >= batch_size:
+                imported += repo.insert_many(batch)
+                batch = []
+                report_progress(done, total)
+
+        if batch:
+            imported += repo.insert_many(batch)
+        search.resume_sync(conn, fts_state)
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        rows.close()
+        if rejects_file is not None:
+            rejects_file.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "imported": imported,
+        "rejected": rejected,
+        "rejects_path": rejects_path if rejected else None,
+        "seconds": seconds,
+        "rows_per_sec": imported / seconds if seconds > 0 else 0.0,
+    }
+
+
+def _valid_date(text):
+    try:
+        datetime.datetime.strptime(text, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+def benchmark(rows=50000, workdir=None):
+    """生成 rows 行的 CSV 导入临时数据库，返回导入统计（含每秒行数）"""
+    import random
+    import tempfile
+
+    import db_pool
+    import migrations
+
+    workdir = workdir or tempfile.mkdtemp(prefix="customer_import_")
+    csv_path = os.path.join(workdir, "customers.csv")
+    db_path = os.path.join(workdir, "customers.db")
+
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["公司名称", "客户名称", "联系电话", "客户类型", "备注"])
+        for i in range(rows):
+            # 约 1% 的行电话无效，用来检验拒绝文件
+            phone = "1%d%09d" % (random.randint(3, 9), i) if i % 100 else "12345"
+            writer.writerow([f"测试煤业{i}有限公司", f"联系人{i}", phone,
+                             random.choice(["精煤", "中煤"]), "批量导入测试"])
+
+    conn = db_pool.connect(db_path)
+    try:
+        migrations.migrate(conn)
+        return import_customers(conn, csv_path)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # python importer.py bench [行数]：导入速度基准测试
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+        result = benchmark(count)
+        print(f"导入 {result['imported']} 行，拒绝 {result['rejected']} 行，"
+              f"耗时 {result['seconds']:.2f} 秒，{result['rows_per_sec']:.0f} 行/秒")
+    else:
+        print("用法: python importer.py bench [行数]")
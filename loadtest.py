@@ -0,0 +1,158 @@
+"""局域网服务器压力测试
+
+    python loadtest.py [--clients 8] [--seconds 10] [--writes 0.1] [--rows 20000]
+    python loadtest.py --url http://服务器地址:8765
+
+不指定 --url 时在临时目录生成测试数据库并在本进程中启动服务器。每个模拟客户端用自己的
+keep-alive 连接循环发送请求（首页统计、翻页、搜索、查看、添加、修改），最后按请求类型
+打印吞吐量和延迟分位数。
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+
+import accounts
+import client
+import db_pool
+import migrations
+from repository import CustomerFilter
+import server
+
+SEARCH_TERMS = ("煤业", "测试", "联系人1", "138", "有限公司", "精煤")
+
+
+def seed(db_path, rows):
+    """生成测试数据库"""
+    conn = db_pool.connect(db_path)
+    try:
+        migrations.migrate(conn)
+        accounts.ensure_admin(conn)
+        conn.executemany("""
+        INSERT INTO customers (company_name, contact_name, phone, customer_type, notes, registration_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, ((f"测试煤业{i}有限公司", f"联系人{i}", "1%d%09d" % (random.randint(3, 9), i),
+               random.choice(("精煤", "中煤")), "压力测试", "2024-01-01") for i in range(rows)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def start_local_server(db_path):
+    """在后台线程中启动服务器，返回 (地址, 停止函数)"""
+    loop = asyncio.new_event_loop()
+    api_server = server.CustomerServer(db_path)
+    listener = loop.run_until_complete(api_server.start("127.0.0.1", 0, auto_backup=False))
+    port = listener.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(api_server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        writes = api_server.writes
+        return writes.requests, writes.batches
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def worker(url, deadline, write_ratio, results, max_id):
+    api = client.ApiClient(url)
+    client.check_login(api, accounts.ADMIN_USERNAME, accounts.DEFAULT_PASSWORD)
+    rng = random.Random()
+    pager = client.RemotePager()
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                if rng.random() < 0.5:
+                    name = "add"
+                    call = lambda: client.add_customer(api, {
+                        "company_name": "压测新增公司", "contact_name": "压测", "phone": "13900000000",
+                        "customer_type": "精煤", "notes": ""})
+                else:
+                    name = "update"
+                    customer_id = rng.randint(1, max_id)
+                    call = lambda: client.update_customer(api, customer_id, {
+                        "company_name": f"测试煤业{customer_id}有限公司", "contact_name": "压测修改",
+                        "phone": "13900000001", "customer_type": rng.choice(("精煤", "中煤")), "notes": "修改"})
+            else:
+                name = rng.choice(("stats", "page", "search", "get"))
+                if name == "stats":
+                    call = lambda: client.load_stats(api)
+                elif name == "page":
+                    offset = rng.randint(0, max_id)
+                    call = lambda: pager.fetch(api, offset=offset)
+                elif name == "search":
+                    term = rng.choice(SEARCH_TERMS)
+                    call = lambda: client.query_customers(api, CustomerFilter(term))
+                else:
+                    customer_id = rng.randint(1, max_id)
+                    call = lambda: client.get_customer(api, customer_id)
+
+            started = time.perf_counter()
+            try:
+                call()
+                ok = True
+            except client.ApiError:
+                ok = False
+            results.append((name, time.perf_counter() - started, ok))
+    finally:
+        api.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="局域网服务器压力测试")
+    parser.add_argument("--url", help="已运行的服务器地址，不指定时启动本地测试服务器")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数量")
+    parser.add_argument("--seconds", type=float, default=10, help="测试时长（秒）")
+    parser.add_argument("--writes", type=float, default=0.1, help="写请求所占比例")
+    parser.add_argument("--rows", type=int, default=20000, help="测试数据库中的客户数量")
+    args = parser.parse_args()
+
+    stop = None
+    if args.url:
+        url = args.url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="customer_load_"), "customer_data.db")
+        seed(db_path, args.rows)
+        url, stop = start_local_server(db_path)
+
+    results = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=worker, args=(url, deadline, args.writes, results, args.rows))
+               for _ in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.clients} 个客户端，{elapsed:.1f} 秒，共 {len(results)} 个请求，{len(results) / elapsed:.0f} 请求/秒")
+    print(f"{'请求':<8}{'次数':>8}{'请求/秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'失败':>6}")
+    for name in ("stats", "page", "search", "get", "add", "update"):
+        latencies = [seconds * 1000 for kind, seconds, _ in results if kind == name]
+        if not latencies:
+            continue
+        failed = sum(1 for kind, _, ok in results if kind == name and not ok)
+        print(f"{name:<8}{len(latencies):>8}{len(latencies) / elapsed:>10.0f}{percentile(latencies, 0.5):>10.1f}"
+              f"{percentile(latencies, 0.95):>10.1f}{percentile(latencies, 0.99):>10.1f}{failed:>6}")
+
+    if stop is not None:
+        requests, batches = stop()
+        if batches:
+            print(f"写请求 {requests} 个，合并为 {batches} 次提交（平均每次 {requests / batches:.1f} 个）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,232 @@
+# 最先导入，从这里开始计算启动耗时
+import startup
+if startup.requested():
+    startup.PROFILE.track_imports()
+
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog, scrolledtext
-import sqlite3
-import hashlib
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import argparse
 import datetime
 import os
-import re
-from PIL import Image, ImageTk
-import sv_ttk
+import time
+
+import accounts
+import analytics
+import backup
+import customers
+import dedup
+import history
+from customers import CustomerPager
+from db_worker import DBExecutor
+from exporter import EXPORT_COLUMNS
+import migrations
+import perf
+from repository import CustomerFilter, CustomerQuery
+import stats
+from validation import CUSTOMER_TYPES, validate_customer
+
+# client、importer、sv_ttk 和 tkinter.scrolledtext 在用到时才导入，缩短启动时间
+
+# 数据库文件位置
+DB_PATH = "data/customer_data.db"
+
+# 输入停止多久后自动搜索（毫秒）
+SEARCH_DELAY = 300
+
+# 登录后第一次检查自动备份的延迟，以及之后的检查间隔（毫秒）
+AUTO_BACKUP_FIRST_CHECK_MS = 60 * 1000
+AUTO_BACKUP_CHECK_MS = 60 * 60 * 1000
+
+# 客户修改后多久在后台补算查重索引（毫秒）
+DEDUP_REFRESH_DELAY = 2000
+
+# 添加客户时最多列出的可能重复的客户数
+DUPLICATE_PREVIEW = 3
+
+# 查重结果窗口最多显示的组数
+DUPLICATE_REPORT_GROUPS = 200
+
+# 历史记录窗口的查询方式
+HISTORY_CHANGES = "某时刻之后的修改"
+HISTORY_DELETED = "已删除的客户"
+
+# 性能统计页面的刷新间隔（毫秒）和最多显示的统计项数
+PERF_REFRESH_MS = 2000
+PERF_ROWS = 200
+
+# 性能统计表格的列：(标题, 统计字段, 宽度)
+PERF_COLUMNS = (
+    ("类别", "category", 60),
+    ("项目", "name", 420),
+    ("次数", "count", 70),
+    ("平均 ms", "mean_ms", 80),
+    ("p50 ms", "p50_ms", 80),
+    ("p95 ms", "p95_ms", 80),
+    ("p99 ms", "p99_ms", 80),
+    ("最大 ms", "max_ms", 80),
+    ("合计 ms", "total_ms", 90),
+)
+
+# 一次提交修改的行数超过这么多时重新查询列表，比逐行更新缓冲区更快
+PATCH_LIMIT = 200
+
+# 最多保留的可撤销批量操作数
+UNDO_LIMIT = 20
+
+# 事件 state 中 Shift / Control 键的标志位
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+# 客户列表的列：(标题, 点击标题时排序的字段)，备注不能排序
+CUSTOMER_COLUMNS = (
+    ("id", "id"),
+    ("公司名称", "company_name"),
+    ("客户名称", "contact_name"),
+    ("联系电话", "phone"),
+    ("客户类型", "customer_type"),
+    ("备注", None),
+)
+
+# 高级筛选的输入框：(标签, CustomerFilter 的字段, 宽度)
+FILTER_FIELDS = (
+    ("登记日期从", "date_from", 12),
+    ("到", "date_to", 12),
+    ("电话前缀", "phone_prefix", 14),
+    ("备注关键词", "notes", 16),
+)
+
+# 客户类型颜色映射
+TYPE_COLORS = {
+    "精煤": "#e74c3c",  # 红色
+    "中煤": "#2ecc71"   # 绿色
+}
+
+# 报表图表中其他类型的颜色，以及图表四周留给坐标文字的边距（像素）
+OTHER_TYPE_COLOR = "#95a5a6"
+CHART_MARGIN = 40
+
+
+def parse_filter_date(text):
+    """把筛选框中的日期规范成 YYYY-MM-DD，空白或不是有效日期时返回空字符串"""
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return ""
+
+
+class TreeRows:
+    """按 iid 增量更新 Treeview 的行
+
+    每次给出完整的新行列表，只删除消失的行、插入新出现的行、修改内容变了的行，
+    没有变化的行不碰，选中状态也随之保留。表格的行只能通过这里修改。
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        # {iid: (values, tags)}，与表格中的内容一致
+        self.shown = {}
+        self.order = []
+
+    def update(self, rows):
+        """rows 为 [(iid, values, tags), ...]，按显示顺序排列"""
+        tree = self.tree
+        new_order = [iid for iid, values, tags in rows]
+        keep = set(new_order)
+        removed = [iid for iid in self.order if iid not in keep]
+        if removed:
+            tree.delete(*removed)
+
+        # 保留下来的行相对顺序不变时（通常如此），按位置插入新行即可，不需要移动
+        reorder = ([iid for iid in self.order if iid in keep]
+                   != [iid for iid in new_order if iid in self.shown])
+        shown = {}
+        for index, (iid, values, tags) in enumerate(rows):
+            old = self.shown.get(iid)
+            if old is None:
+                tree.insert("", index, iid=iid, values=values, tags=tags)
+            else:
+                if old != (values, tags):
+                    tree.item(iid, values=values, tags=tags)
+                if reorder:
+                    tree.move(iid, "", index)
+            shown[iid] = (values, tags)
+
+        self.shown = shown
+        self.order = new_order
+
 
 class ModernCustomerManagementSystem:
-    def __init__(self, root):
+    def __init__(self, root, server_url=None):
         self.root = root
         self.root.title("凯川矿客户管理系统 V1.0")
         self.root.geometry("1200x700")
         self.root.minsize(1000, 600)
         
-        # 应用现代主题
+        # 应用现代主题（在第一帧之前设置，避免界面先按默认主题绘制再闪烁）
+        import sv_ttk
         sv_ttk.set_theme("light")
         
         # 自定义样式
         self.setup_styles()
+        startup.mark("主题和样式")
         
         # 确保数据目录存在
         if not os.path.exists("data"):
             os.makedirs("data")
             
-        # 初始化数据库
-        self.conn = sqlite3.connect("data/customer_data.db")
-        self.create_tables()
-        
-        # 检查是否有管理员账户，没有则创建
-        self.check_admin_account()
+        self.server_url = server_url
+        self.busy_tasks = {}
+        # 已经创建的页面 {名称: Frame}，切换页面时只隐藏不销毁
+        self.pages = {}
+        self.current_page = None
+        # 启动报告要等到这些节点都到达后再输出
+        self.startup_pending = {"首帧"}
+        # 可撤销的批量操作 [(说明, 修改前的客户)]，最近的在最后
+        self.undo_stack = []
+        self.dedup_refresh_after_id = None
+        self.perf_refresh_after_id = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # 主线程卡顿记在当时所在的页面上
+        self.stall_monitor = perf.StallMonitor(self.root, lambda: self.current_page or "login")
+        self.stall_monitor.start()
+        
+        if server_url:
+            # 客户端模式：数据在服务器上，工作线程通过 HTTP 接口读写
+            import client
+            self.db = client.RemoteExecutor(self.root, client.ApiClient(server_url))
+            self.customers = self.accounts = self.analytics = self.dedup = self.history = client
+            self.dashboard_stats = stats.DashboardStats(client.load_stats)
+        else:
+            # 后台数据库线程，界面线程不直接执行 SQL；连接在第一个任务执行时才打开
+            self.db = DBExecutor(self.root, DB_PATH)
+            self.customers = customers
+            self.accounts = accounts
+            self.analytics = analytics
+            self.dedup = dedup
+            self.history = history
+            # 首页统计缓存，客户数据修改后失效
+            self.dashboard_stats = stats.DashboardStats()
+        # 写任务提交的逐行修改
+        self.db.subscribe(self.apply_customer_changes)
         
         # 初始显示登录界面
         self.show_login_page()
+        startup.mark("登录页面")
+        self.root.after_idle(lambda: self.startup_step("首帧"))
+        
+        if not server_url:
+            # 登录页面已经建好，再在写线程中检查表结构并确保管理员账户存在；
+            # 登录查询排在它后面，一定在建表之后执行
+            self.startup_pending.add("数据库就绪")
+            self.run_db(self.prepare_database, callback=lambda result: self.startup_step("数据库就绪"))
+    
+    def startup_step(self, label):
+        """记录启动节点，全部到达后按需输出启动报告"""
+        startup.mark(label)
+        self.startup_pending.discard(label)
+        if not self.startup_pending and startup.requested():
+            startup.PROFILE.stop_tracking()
+            print(startup.PROFILE.report())
     
     def setup_styles(self):
         """设置自定义样式"""
@@ -59,52 +252,87 @@ class ModernCustomerManagementSystem:
         style.configure("Nav.TButton", font=("Arial", 10), padding=10)
         style.map("Nav.TButton", background=[("active", "#ecf0f1")])
     
-    def create_tables(self):
-        """创建数据库表"""
-        cursor = self.conn.cursor()
-        
-        # 用户表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
-        )
-        ''')
-        
-        # 客户表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY,
-            company_name TEXT NOT NULL,
-            contact_name TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            customer_type TEXT NOT NULL,
-            notes TEXT,
-            registration_date TEXT NOT NULL
-        )
-        ''')
-        
-        self.conn.commit()
+    def run_db(self, func, *args, callback=None, errback=None, message=None, progress=False, readonly=False):
+        """在后台线程执行 func(conn, *args)，完成后在界面线程调用 callback(result)
+        
+        message 不为空时在状态栏显示进度并允许取消；未指定 errback 时弹出错误提示。
+        只读查询传 readonly=True，用只读连接并发执行，不必等待导入、备份等写任务。
+        """
+        def done(result):
+            self.finish_task(task)
+            if callback is not None:
+                callback(result)
+        
+        def failed(error):
+            self.finish_task(task)
+            if errback is not None:
+                errback(error)
+            else:
+                messagebox.showerror("错误", f"数据库操作失败: {str(error)}")
+        
+        task = self.db.submit(func, *args, callback=done, errback=failed,
+                              progress=self.show_task_progress if progress else None, readonly=readonly)
+        if message:
+            self.busy_tasks[task] = message
+            self.update_status()
+        return task
+    
+    def finish_task(self, task):
+        """任务结束，更新状态栏"""
+        if self.busy_tasks.pop(task, None) is not None:
+            self.update_status()
     
-    def check_admin_account(self):
-        """检查并创建管理员账户"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE username = ?", ("jirowang",))
-        if cursor.fetchone() is None:
-            # 创建管理员账户
-            password_hash = self.hash_password("123456")
-            cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-                          ("jirowang", password_hash))
-            self.conn.commit()
+    def cancel_tasks(self):
+        """取消状态栏中所有正在执行的任务"""
+        for task in self.busy_tasks:
+            task.cancel()
+        self.busy_tasks.clear()
+        self.update_status()
     
-    def hash_password(self, password):
-        """哈希密码"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def status_bar_ready(self):
+        """状态栏只在主页面存在"""
+        return hasattr(self, "status_label") and self.status_label.winfo_exists()
     
-    def verify_password(self, password, hashed_password):
-        """验证密码"""
-        return self.hash_password(password) == hashed_password
+    def update_status(self):
+        """根据正在执行的任务刷新状态栏"""
+        if not self.status_bar_ready():
+            return
+        if self.busy_tasks:
+            self.status_label.configure(text=list(self.busy_tasks.values())[-1])
+            self.status_progress.configure(mode="indeterminate")
+            self.status_progress.start(10)
+            self.cancel_button.state(["!disabled"])
+        else:
+            self.status_label.configure(text="就绪")
+            self.status_progress.stop()
+            self.status_progress.configure(mode="determinate", value=0)
+            self.cancel_button.state(["disabled"])
+    
+    def show_task_progress(self, done, total):
+        """显示后台任务汇报的进度"""
+        if not self.status_bar_ready() or not total:
+            return
+        self.status_progress.stop()
+        self.status_progress.configure(mode="determinate", maximum=total, value=done)
+    
+    def on_close(self):
+        """关闭窗口前结束数据库线程"""
+        self.stall_monitor.stop()
+        self.cancel_tasks()
+        self.db.close()
+        self.root.destroy()
+    
+    def prepare_database(self, conn):
+        """创建数据库表（旧版本数据库自动升级到最新结构），没有管理员账户时创建"""
+        migrations.migrate(conn)
+        accounts.ensure_admin(conn)
+    
+    def local_only(self, action):
+        """客户端模式下导入、备份、恢复要在服务器上进行，返回是否可以继续"""
+        if self.server_url:
+            messagebox.showinfo("提示", f"当前连接的是服务器 {self.server_url}，请在服务器电脑上{action}")
+            return False
+        return True
     
     def show_login_page(self):
         """显示登录页面"""
@@ -159,15 +387,16 @@ class ModernCustomerManagementSystem:
             username = username_entry.get()
             password = password_entry.get()
             
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-            user = cursor.fetchone()
+            def check_user(ok):
+                if ok:
+                    messagebox.showinfo("登录成功", f"欢迎回来，{username}！")
+                    if password == accounts.DEFAULT_PASSWORD:
+                        messagebox.showwarning("安全提醒", "当前仍在使用默认密码，请尽快在“系统设置”中修改")
+                    self.show_main_page()
+                else:
+                    messagebox.showerror("登录失败", "用户名或密码错误")
             
-            if user and self.verify_password(password, user[2]):
-                messagebox.showinfo("登录成功", f"欢迎回来，{username}！")
-                self.show_main_page()
-            else:
-                messagebox.showerror("登录失败", "用户名或密码错误")
+            self.run_db(self.accounts.check_login, username, password, callback=check_user)
         
         login_button = ttk.Button(form_frame, text="登录", command=login, style="Accent.TButton", width=15)
         login_button.grid(row=2, column=0, columnspan=2, pady=20)
@@ -200,6 +429,7 @@ class ModernCustomerManagementSystem:
         buttons = [
             ("首页", self.show_dashboard),
             ("客户管理", self.show_customer_management),
+            ("报表", self.show_reports),
             ("系统设置", self.show_system_settings)
         ]
         
@@ -216,7 +446,8 @@ class ModernCustomerManagementSystem:
         
         ttk.Label(search_frame, text="搜索:").pack(side="left", padx=5)
         
-        self.search_entry = ttk.Entry(search_frame, width=30)
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
         self.search_entry.pack(side="left", padx=5)
         
         # 添加客户类型筛选
@@ -233,62 +464,129 @@ class ModernCustomerManagementSystem:
         customer_type_combobox.pack(side="left", padx=5)
         customer_type_combobox.current(0)  # 默认选择"所有"
         
+        # 边输入边搜索：停止输入一小段时间后才查询，避免每个按键都查一次数据库
+        self.search_after_id = None
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        customer_type_combobox.bind("<<ComboboxSelected>>", lambda event: self.schedule_search(0))
+        
         search_button = ttk.Button(search_frame, text="搜索", command=self.perform_search, width=10)
         search_button.pack(side="left", padx=5)
         
         reset_button = ttk.Button(search_frame, text="重置", command=self.reset_search, width=10)
         reset_button.pack(side="left", padx=5)
         
+        self.filter_button = ttk.Button(search_frame, text="高级筛选", command=self.toggle_filter_panel, width=14)
+        self.filter_button.pack(side="left", padx=5)
+        
+        # 高级筛选面板，默认收起；收起后已填写的条件仍然有效
+        self.filter_frame = ttk.Frame(main_frame)
+        self.filter_vars = {}
+        for label, field, width in FILTER_FIELDS:
+            ttk.Label(self.filter_frame, text=label + ":").pack(side="left", padx=5)
+            var = tk.StringVar()
+            ttk.Entry(self.filter_frame, textvariable=var, width=width).pack(side="left", padx=5)
+            var.trace_add("write", lambda *args: self.filter_changed())
+            self.filter_vars[field] = var
+        ttk.Label(self.filter_frame, text="（日期格式 2024-01-31）").pack(side="left", padx=5)
+        
+        # 列标题排序：(字段, 是否倒序)，默认最新添加的在前
+        self.customer_sort = ("id", True)
+        
+        # 底部状态栏：显示后台任务进度，可取消耗时查询
+        status_frame = ttk.Frame(main_frame)
+        status_frame.pack(side="bottom", fill="x", padx=20, pady=(0, 10))
+        
+        self.status_label = ttk.Label(status_frame, text="就绪")
+        self.status_label.pack(side="left")
+        
+        self.cancel_button = ttk.Button(status_frame, text="取消", command=self.cancel_tasks, width=8)
+        self.cancel_button.pack(side="right", padx=5)
+        
+        self.status_progress = ttk.Progressbar(status_frame, length=200)
+        self.status_progress.pack(side="right", padx=5)
+        
         # 创建主内容区域
         self.content_frame = ttk.Frame(main_frame)
-        self.content_frame.pack(fill="both", expand=True, padx=20, pady=(0, 20))
+        self.content_frame.pack(fill="both", expand=True, padx=20, pady=(0, 10))
+        self.pages = {}
+        self.current_page = None
+        
+        self.update_status()
+        
+        # 登录后开始定时检查自动备份（客户端模式下由服务器负责）
+        if not self.server_url:
+            self.schedule_auto_backup(AUTO_BACKUP_FIRST_CHECK_MS)
+            self.schedule_dedup_refresh()
         
         # 默认显示首页
         self.show_dashboard()
     
+    def show_page(self, name, build):
+        """显示内容区的一个页面：第一次显示时调用 build(frame) 创建，之后直接复用"""
+        page = self.pages.get(name)
+        if page is None:
+            page = ttk.Frame(self.content_frame)
+            with perf.STATS.timer(perf.PAGE, build.__name__):
+                build(page)
+            self.pages[name] = page
+        if self.current_page != name:
+            if self.current_page is not None:
+                self.pages[self.current_page].pack_forget()
+            page.pack(fill="both", expand=True)
+            self.current_page = name
+        return page
+    
     def show_dashboard(self):
-        """显示首页仪表盘"""
-        # 清除当前内容
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
+        """显示首页仪表盘并刷新统计数据"""
+        with perf.STATS.timer(perf.PAGE, "show_dashboard"):
+            self.show_page("dashboard", self.build_dashboard)
+            
+            # 统计数据来自计数表和内存缓存，与客户数量无关
+            if self.dashboard_stats.cached is not None:
+                self.fill_dashboard(self.dashboard_stats.cached)
+            else:
+                self.run_db(self.dashboard_stats.get, callback=self.fill_dashboard, message="正在加载统计数据…",
+                            readonly=True)
+    
+    def fill_dashboard(self, data):
+        """显示统计数据，最近添加的客户只更新有变化的行"""
+        for value_label, customer_type in self.stat_value_labels:
+            value = data["total"] if customer_type is None else data["by_type"].get(customer_type, 0)
+            value_label.configure(text=str(value))
+        
+        self.recent_rows.update([
+            (str(customer.id), (customer.id, customer.company_name, customer.contact_name,
+                                customer.phone, customer.customer_type, customer.registration_date), ())
+            for customer in data["recent"]])
+    
+    def build_dashboard(self, page):
+        """创建首页仪表盘"""
         # 创建标题
-        ttk.Label(self.content_frame, text="数据概览", style="Title.TLabel").pack(pady=(0, 20), anchor="w")
+        ttk.Label(page, text="数据概览", style="Title.TLabel").pack(pady=(0, 20), anchor="w")
         
         # 创建统计卡片框架
-        stats_frame = ttk.Frame(self.content_frame)
+        stats_frame = ttk.Frame(page)
         stats_frame.pack(fill="x", pady=10)
         
-        # 客户总数
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM customers")
-        total_customers = cursor.fetchone()[0]
-        
-        # 精煤客户数
-        cursor.execute("SELECT COUNT(*) FROM customers WHERE customer_type = ?", ("精煤",))
-        jingmei_count = cursor.fetchone()[0]
-        
-        # 中煤客户数
-        cursor.execute("SELECT COUNT(*) FROM customers WHERE customer_type = ?", ("中煤",))
-        zhongmei_count = cursor.fetchone()[0]
-        
-        # 创建统计卡片
-        stats = [
-            {"title": "总客户数", "value": total_customers, "color": "#3498db"},
-            {"title": "精煤客户", "value": jingmei_count, "color": "#e74c3c"},
-            {"title": "中煤客户", "value": zhongmei_count, "color": "#2ecc71"}
+        # 创建统计卡片（customer_type 为 None 表示客户总数）
+        stat_cards = [
+            {"title": "总客户数", "customer_type": None, "color": "#3498db"},
+            {"title": "精煤客户", "customer_type": "精煤", "color": "#e74c3c"},
+            {"title": "中煤客户", "customer_type": "中煤", "color": "#2ecc71"}
         ]
         
-        for stat in stats:
+        self.stat_value_labels = []
+        for stat in stat_cards:
             card = ttk.Frame(stats_frame, style="Card.TFrame")
             card.pack(side="left", fill="both", expand=True, padx=10, ipady=10)
             
             ttk.Label(card, text=stat["title"], style="CardHeader.TLabel").pack(pady=5)
-            ttk.Label(card, text=str(stat["value"]), style="CardValue.TLabel", 
-                     foreground=stat["color"]).pack(pady=10)
+            value_label = ttk.Label(card, text="…", style="CardValue.TLabel", foreground=stat["color"])
+            value_label.pack(pady=10)
+            self.stat_value_labels.append((value_label, stat["customer_type"]))
         
         # 最近添加的客户
-        recent_frame = ttk.LabelFrame(self.content_frame, text="最近添加的客户")
+        recent_frame = ttk.LabelFrame(page, text="最近添加的客户")
         recent_frame.pack(fill="both", expand=True, pady=20)
         
         # 创建表格
@@ -305,20 +603,181 @@ class ModernCustomerManagementSystem:
         
         self.recent_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
-        
-        # 加载最近5个客户
-        cursor.execute("SELECT id, company_name, contact_name, phone, customer_type, registration_date FROM customers ORDER BY id DESC LIMIT 5")
-        for row in cursor.fetchall():
-            self.recent_tree.insert("", "end", values=row)
+        self.recent_rows = TreeRows(self.recent_tree)
+    
+    def show_reports(self):
+        """显示报表页面并在后台刷新报表数据"""
+        self.show_page("reports", self.build_reports)
+        if self.report_task is not None and not self.report_task.done:
+            # 正在生成，完成后再取一次最新数据
+            self.report_pending = True
+            return
+        self.report_pending = False
+        # 有客户变动的年份要重新统计备注，放在写线程中执行；界面先显示上一次的结果
+        self.report_task = self.run_db(self.analytics.report, callback=self.fill_reports,
+                                       message="正在生成报表…")
+    
+    def build_reports(self, page):
+        """创建报表页面：每月新增、客户总数趋势两张图和按年统计、备注关键词两张表"""
+        header = ttk.Frame(page)
+        header.pack(fill="x", pady=(0, 10))
+        ttk.Label(header, text="客户报表", style="Title.TLabel").pack(side="left")
+        ttk.Button(header, text="刷新", command=self.show_reports, width=10).pack(side="right")
+        
+        charts = ttk.Frame(page)
+        charts.pack(fill="both", expand=True)
+        self.report_canvases = {}
+        for name, title in (("monthly", f"每月新增客户（近 {analytics.REPORT_MONTHS} 个月）"),
+                            ("growth", "客户总数趋势")):
+            frame = ttk.LabelFrame(charts, text=title)
+            frame.pack(side="left", fill="both", expand=True, padx=5)
+            canvas = tk.Canvas(frame, background="white", height=240, highlightthickness=0)
+            canvas.pack(fill="both", expand=True)
+            canvas.bind("<Configure>", lambda event: self.draw_reports())
+            self.report_canvases[name] = canvas
+        
+        tables = ttk.Frame(page)
+        tables.pack(fill="both", expand=True, pady=(10, 0))
+        self.report_tables = {}
+        for name, title in (("yearly", "按年新增客户"), ("notes", f"备注关键词（近 {analytics.REPORT_YEARS} 年）")):
+            frame = ttk.LabelFrame(tables, text=title)
+            frame.pack(side="left", fill="both", expand=True, padx=5)
+            tree = ttk.Treeview(frame, show="headings", selectmode="browse", height=6)
+            scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            tree.configure(yscroll=scrollbar.set)
+            tree.pack(side="left", fill="both", expand=True)
+            scrollbar.pack(side="right", fill="y")
+            self.report_tables[name] = TreeRows(tree)
+        
+        self.report_data = None
+        self.report_task = None
+        self.report_pending = False
+    
+    def fill_reports(self, data):
+        """显示报表数据；生成期间又有客户变动时重新生成"""
+        self.report_data = data
+        types = data["types"]
+        
+        yearly = []
+        previous = None
+        for index, year in enumerate(data["years"]):
+            counts = [data["yearly"][customer_type][index] for customer_type in types]
+            total = sum(counts)
+            growth = f"{(total - previous) / previous:+.0%}" if previous else ""
+            yearly.append((year, (year, *counts, total, growth), ()))
+            previous = total
+        yearly.reverse()
+        self.set_report_columns("yearly", ("年份", *types, "合计", "同比"))
+        self.report_tables["yearly"].update(yearly)
+        
+        self.set_report_columns("notes", ("关键词", *data["note_years"], "合计"))
+        self.report_tables["notes"].update([(phrase, (phrase, *counts, total), ())
+                                            for phrase, counts, total in data["notes"]])
+        
+        self.draw_reports()
+        if self.report_pending and self.current_page == "reports":
+            self.show_reports()
+    
+    def set_report_columns(self, name, columns):
+        """报表的列随客户类型和年份变化，变了才重新设置"""
+        tree = self.report_tables[name].tree
+        if tuple(tree["columns"]) == columns:
+            return
+        tree.configure(columns=columns)
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=80, anchor="center")
+    
+    def draw_reports(self):
+        """按画布当前大小重画两张图"""
+        data = self.report_data
+        if data is None:
+            return
+        months = data["months"]
+        types = data["types"]
+        totals = [sum(data["monthly"][customer_type][index] for customer_type in types)
+                  for index in range(len(months))]
+        
+        canvas = self.report_canvases["monthly"]
+        area = self.chart_area(canvas, months, max(totals, default=0))
+        if area is not None:
+            x_of, y_of, slot = area
+            width = max(slot * 0.7, 1)
+            for index in range(len(months)):
+                x = x_of(index) - width / 2
+                stacked = 0
+                for customer_type in types:
+                    count = data["monthly"][customer_type][index]
+                    if count:
+                        canvas.create_rectangle(x, y_of(stacked + count), x + width, y_of(stacked),
+                                                fill=TYPE_COLORS.get(customer_type, OTHER_TYPE_COLOR), outline="")
+                    stacked += count
+            # 图例
+            x = canvas.winfo_width() - CHART_MARGIN
+            for customer_type in reversed(types):
+                item = canvas.create_text(x, CHART_MARGIN / 2, text=customer_type, anchor="e")
+                x = canvas.bbox(item)[0] - 4
+                canvas.create_rectangle(x - 10, CHART_MARGIN / 2 - 5, x, CHART_MARGIN / 2 + 5,
+                                        fill=TYPE_COLORS.get(customer_type, OTHER_TYPE_COLOR), outline="")
+                x -= 20
+        
+        cumulative = []
+        running = data["base_total"]
+        for total in totals:
+            running += total
+            cumulative.append(running)
+        canvas = self.report_canvases["growth"]
+        area = self.chart_area(canvas, months, max(cumulative, default=0))
+        if area is not None:
+            x_of, y_of, slot = area
+            points = [coordinate for index, value in enumerate(cumulative)
+                      for coordinate in (x_of(index), y_of(value))]
+            if len(points) >= 4:
+                canvas.create_line(*points, fill="#3498db", width=2)
+    
+    def chart_area(self, canvas, months, top):
+        """清空画布并画出坐标轴，返回 (月份序号 -> x, 数值 -> y, 每月宽度)；画布太小时返回 None"""
+        canvas.delete("all")
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        left, right = CHART_MARGIN, width - CHART_MARGIN / 2
+        upper, bottom = CHART_MARGIN, height - CHART_MARGIN / 2
+        if right <= left or bottom <= upper or not months:
+            return None
+        top = max(top, 1)
+        slot = (right - left) / len(months)
+        
+        def x_of(index):
+            return left + (index + 0.5) * slot
+        
+        def y_of(value):
+            return bottom - value / top * (bottom - upper)
+        
+        canvas.create_line(left, bottom, right, bottom, fill="#7f8c8d")
+        canvas.create_line(left, upper, left, bottom, fill="#7f8c8d")
+        canvas.create_text(left - 4, upper, text=str(top), anchor="e", font=("Arial", 8))
+        canvas.create_text(left - 4, bottom, text="0", anchor="e", font=("Arial", 8))
+        # 月份标签大约 40 像素宽，放不下时隔几个月标一次
+        step = int(40 / slot) + 1
+        for index in range(len(months) - 1, -1, -step):
+            canvas.create_text(x_of(index), bottom + 2, text=months[index][2:], anchor="n", font=("Arial", 8))
+        return x_of, y_of, slot
     
     def show_customer_management(self):
-        """显示客户管理页面"""
-        # 清除当前内容
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
+        """显示客户管理页面并按当前搜索条件刷新"""
+        with perf.STATS.timer(perf.PAGE, "show_customer_management"):
+            returning = "customers" in self.pages
+            self.show_page("customers", self.build_customer_management)
+            if returning:
+                # 先用缓冲区立即显示离开时的位置，再在后台重新查询，只更新有变化的行
+                self.render_customer_window()
+                self.load_customer_data(keep_offset=True)
+            else:
+                self.load_customer_data()
+    
+    def build_customer_management(self, page):
+        """创建客户管理页面"""
         # 创建标题和按钮
-        header_frame = ttk.Frame(self.content_frame)
+        header_frame = ttk.Frame(page)
         header_frame.pack(fill="x", pady=(0, 10))
         
         ttk.Label(header_frame, text="客户管理", style="Title.TLabel").pack(side="left")
@@ -332,79 +791,361 @@ class ModernCustomerManagementSystem:
                   style="Accent.TButton").pack(side="left", padx=5)
         ttk.Button(button_frame, text="删除客户", command=self.delete_customer, 
                   style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="修改类型", command=self.change_customers_type, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="追加备注", command=self.append_customers_notes, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="撤销", command=self.undo_customer_batch, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="批量导入", command=self.import_customers, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="导出列表", command=self.export_customers, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="查重", command=self.find_duplicate_customers, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="历史记录", command=self.show_customer_history, 
+                  style="Accent.TButton").pack(side="left", padx=5)
         
         # 创建表格
-        table_frame = ttk.Frame(self.content_frame)
+        table_frame = ttk.Frame(page)
         table_frame.pack(fill="both", expand=True)
         
         # 修改列名：备注替换注册日期
-        columns = ("id", "公司名称", "客户名称", "联系电话", "客户类型", "备注")
-        self.customer_tree = ttk.Treeview(table_frame, columns=columns, show="headings", selectmode="browse")
+        columns = [title for title, field in CUSTOMER_COLUMNS]
+        self.customer_tree = ttk.Treeview(table_frame, columns=columns, show="headings", selectmode="extended")
         
-        for col in columns:
-            self.customer_tree.heading(col, text=col)
-            self.customer_tree.column(col, width=120, anchor="center")
+        # 点击列标题按该列排序，再次点击切换升序/降序，排序在数据库中完成
+        for title, field in CUSTOMER_COLUMNS:
+            command = (lambda field=field: self.sort_customers(field)) if field else ""
+            self.customer_tree.heading(title, text=title, command=command)
+            self.customer_tree.column(title, width=120, anchor="center")
+        self.update_sort_headings()
         
-        # 添加滚动条
-        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.customer_tree.yview)
-        self.customer_tree.configure(yscroll=scrollbar.set)
+        for ctype, color in TYPE_COLORS.items():
+            self.customer_tree.tag_configure(ctype, foreground=color)
         
-        self.customer_tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        # 滚动条按整个结果集定位，表格中只保留可见行
+        self.customer_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.scroll_customers)
+        
+        self.customer_rows = TreeRows(self.customer_tree)
         
-        # 加载客户数据
-        self.load_customer_data()
+        # 表格中只有可见行，选中的客户 id 另外记录，滚出窗口后仍保持选中（Ctrl/Shift 可多选，Ctrl+A 全选结果）
+        self.customer_selection = set()
+        self.customer_select_extend = False
+        self.selection_label = ttk.Label(header_frame, text="")
+        self.selection_label.pack(side="left", padx=20)
+        
+        self.customer_tree.pack(side="left", fill="both", expand=True)
+        self.customer_scrollbar.pack(side="right", fill="y")
+        
+        self.customer_tree.bind("<Configure>", lambda event: self.render_customer_window())
+        self.customer_tree.bind("<MouseWheel>", lambda event: self.scroll_customers("scroll", -3 if event.delta > 0 else 3, "units"))
+        self.customer_tree.bind("<Button-4>", lambda event: self.scroll_customers("scroll", -3, "units"))
+        self.customer_tree.bind("<Button-5>", lambda event: self.scroll_customers("scroll", 3, "units"))
+        self.customer_tree.bind("<Up>", lambda event: self.move_customer_focus(-1, event.state))
+        self.customer_tree.bind("<Down>", lambda event: self.move_customer_focus(1, event.state))
+        self.customer_tree.bind("<Shift-Up>", lambda event: self.move_customer_focus(-1, event.state))
+        self.customer_tree.bind("<Shift-Down>", lambda event: self.move_customer_focus(1, event.state))
+        self.customer_tree.bind("<ButtonPress-1>", self.customer_tree_clicked)
+        self.customer_tree.bind("<<TreeviewSelect>>", lambda event: self.customer_selection_changed())
+        self.customer_tree.bind("<Control-a>", lambda event: self.select_all_customers())
+        self.customer_tree.bind("<Prior>", lambda event: self.scroll_customers("scroll", -1, "pages"))
+        self.customer_tree.bind("<Next>", lambda event: self.scroll_customers("scroll", 1, "pages"))
     
-    def load_customer_data(self):
-        """加载客户数据到表格"""
-        # 清空表格
-        for item in self.customer_tree.get_children():
-            self.customer_tree.delete(item)
+    def load_customer_data(self, reuse=False, keep_offset=False):
+        """加载客户数据到表格
         
+        reuse 为 True 时，如果新条件只是缩小了上一次已整体读入内存的结果，直接在内存中过滤。
+        数据修改后刷新列表时不能复用。keep_offset 为 True 且条件没变时保持当前滚动位置。
+        """
         # 获取搜索条件
-        search_text = self.search_entry.get().strip().lower()
-        customer_type = self.customer_type_var.get()
+        query = self.current_customer_filter()
+        # 记录从发起查询到结果显示出来的耗时，包括后台查询
+        started = time.perf_counter()
+        
+        def shown():
+            perf.STATS.record(perf.PAGE, "load_customer_data", (time.perf_counter() - started) * 1000)
+        
+        previous = getattr(self, "customer_pager", None)
+        if (reuse and previous is not None and previous.reusable and previous.complete
+                and query.narrows(self.customer_query)):
+            # 只换了排序时也不必查询，在内存中重新排序
+            order = CustomerQuery(sort=query.sort, descending=query.descending)
+            rows = [customer for customer in previous.buffer[1] if query.matches(customer)]
+            if (query.sort, query.descending) != (self.customer_query.sort, self.customer_query.descending):
+                rows.sort(key=order.key, reverse=query.descending)
+            pager = CustomerPager.from_rows(rows, order)
+            pager.reusable = True
+            self.cancel_customer_load()
+            self.show_customer_pager(pager, query)
+            shown()
+            return
         
-        cursor = self.conn.cursor()
+        def loaded(pager):
+            self.show_customer_pager(pager, query, keep_offset)
+            shown()
         
-        # 构建SQL查询，显示 notes 而非 registration_date
-        query = "SELECT id, company_name, contact_name, phone, customer_type, notes FROM customers"
-        conditions = []
-        params = []
+        # 新的查询开始后，旧查询的结果已经没有用了，正在执行的 SQL 会被中断
+        self.cancel_customer_load()
+        self.customer_load_task = self.run_db(self.customers.query_customers, query, callback=loaded,
+                                              message="正在查询客户…", readonly=True)
+    
+    def cancel_customer_load(self):
+        """放弃尚未完成的客户查询"""
+        task = getattr(self, "customer_load_task", None)
+        if task is not None and not task.done:
+            task.cancel()
+            self.finish_task(task)
+        self.customer_load_task = None
+    
+    def show_customer_pager(self, pager, query, keep_offset=False):
+        """切换到新的查询结果并显示第一页（keep_offset 为 True 且条件没变时停在原位置）"""
+        if not keep_offset or query != getattr(self, "customer_query", None):
+            self.customer_offset = 0
+        if query != getattr(self, "customer_query", None):
+            # 条件变了，看不到的客户不能再留在选中范围里
+            self.set_customer_selection(set())
+        self.customer_pager = pager
+        self.customer_query = query
+        self.render_customer_window()
+    
+    def apply_customer_changes(self, changes):
+        """写任务提交后逐行更新首页统计和客户列表，不重新查询"""
+        self.dashboard_stats.apply(changes)
+        self.schedule_dedup_refresh()
+        if self.current_page == "dashboard":
+            self.show_dashboard()
+        elif self.current_page == "reports":
+            self.show_reports()
         
-        if search_text:
-            conditions.append("(LOWER(company_name) LIKE ? OR LOWER(contact_name) LIKE ?)")
-            params.extend([f"%{search_text}%", f"%{search_text}%"])
+        pager = getattr(self, "customer_pager", None)
+        if pager is None:
+            return
         
-        if customer_type != "所有":
-            conditions.append("customer_type = ?")
-            params.append(customer_type)
+        # 删除的和不再符合条件的客户不再选中
+        for change in changes:
+            if change.id in self.customer_selection and self.customer_matches(pager, change.after) is False:
+                self.customer_selection.discard(change.id)
+        self.update_selection_label()
         
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+        # 后台读取随时会整体替换缓冲区，批量修改时逐行更新也不划算，这两种情况改为重新查询
+        tasks = (getattr(self, "customer_load_task", None), getattr(self, "customer_window_task", None))
+        if len(changes) > PATCH_LIMIT or any(task is not None and not task.done for task in tasks):
+            self.load_customer_data(keep_offset=True)
+            return
         
-        query += " ORDER BY id DESC"
+        offset = self.customer_offset
+        for change in changes:
+            was = self.customer_matches(pager, change.before)
+            now = self.customer_matches(pager, change.after)
+            if was is None or now is None:
+                # 无法在内存中判断是否符合搜索条件
+                self.load_customer_data(keep_offset=True)
+                return
+            if was and now and pager.query.key(change.before) == pager.query.key(change.after):
+                pager.replace(change.after)
+                continue
+            if was:
+                if pager.remove(change.before, offset):
+                    offset -= 1
+            if now:
+                # 停在最上面时让新客户出现在第一行，否则保持看到的行不动
+                if pager.insert(change.after, offset) and offset > 0:
+                    offset += 1
+        self.customer_offset = max(offset, 0)
+        
+        if self.customer_page_visible():
+            self.render_customer_window()
+    
+    def customer_matches(self, pager, customer):
+        """客户是否符合当前列表的条件；customer 为 None 时为 False，无法在内存中判断时返回 None"""
+        if customer is None:
+            return False
+        return self.customer_query.matches(customer, pager.reusable)
+    
+    def current_customer_filter(self):
+        """由搜索栏、高级筛选和列标题排序组成当前的筛选条件"""
+        values = {field: var.get().strip() for field, var in self.filter_vars.items()}
+        # 日期没有输完或格式不对时先不按日期筛选
+        for field in ("date_from", "date_to"):
+            values[field] = parse_filter_date(values[field])
+        sort, descending = self.customer_sort
+        return CustomerFilter(self.search_entry.get().strip().lower(), self.customer_type_var.get(),
+                              values["date_from"], values["date_to"], values["phone_prefix"],
+                              values["notes"].lower(), sort, descending)
+    
+    def sort_customers(self, field):
+        """点击列标题：换列时 id 默认倒序、其他列默认升序，同一列再点切换方向"""
+        sort, descending = self.customer_sort
+        self.customer_sort = (field, not descending) if field == sort else (field, field == "id")
+        self.update_sort_headings()
+        self.load_customer_data(reuse=True)
+    
+    def update_sort_headings(self):
+        """在排序列的标题上显示方向箭头"""
+        sort, descending = self.customer_sort
+        for title, field in CUSTOMER_COLUMNS:
+            arrow = (" ▼" if descending else " ▲") if field == sort else ""
+            self.customer_tree.heading(title, text=title + arrow)
+    
+    def toggle_filter_panel(self):
+        """展开/收起高级筛选面板"""
+        if self.filter_frame.winfo_ismapped():
+            self.filter_frame.pack_forget()
+        else:
+            self.filter_frame.pack(fill="x", padx=20, pady=(0, 10), after=self.filter_button.master)
+        self.update_filter_button()
+    
+    def filter_changed(self):
+        self.update_filter_button()
+        self.schedule_search()
+    
+    def update_filter_button(self):
+        """收起面板后在按钮上显示仍在生效的高级筛选条件数"""
+        active = sum(1 for var in self.filter_vars.values() if var.get().strip())
+        self.filter_button.configure(text=f"高级筛选（{active} 项）" if active else "高级筛选")
+    
+    def visible_customer_rows(self):
+        """表格当前能显示的行数"""
+        height = self.customer_tree.winfo_height()
+        if height <= 1:
+            return int(self.customer_tree.cget("height"))
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 25)
+        # 减去表头的高度
+        return max(1, (height - row_height) // row_height)
+    
+    def render_customer_window(self, focus_edge=None):
+        """只把可见窗口内的客户行放进表格，缓冲区没有的行到后台线程读取"""
+        pager = getattr(self, "customer_pager", None)
+        if pager is None or not hasattr(self, "customer_tree") or not self.customer_tree.winfo_exists():
+            return
         
-        cursor.execute(query, params)
+        visible = self.visible_customer_rows()
+        self.customer_offset = offset = max(0, min(self.customer_offset, pager.total - visible))
+        rows = pager.cached(offset, visible)
+        if rows is not None:
+            self.fill_customer_rows(rows, focus_edge)
+            return
         
-        # 客户类型颜色映射
-        type_colors = {
-            "精煤": "#e74c3c",  # 红色
-            "中煤": "#2ecc71"   # 绿色
-        }
+        def fetched(rows):
+            if pager is not self.customer_pager or not self.customer_tree.winfo_exists():
+                return
+            if offset == self.customer_offset:
+                self.fill_customer_rows(rows, focus_edge)
+            else:
+                # 等待期间用户又滚动过了
+                self.render_customer_window(focus_edge)
         
-        for row in cursor.fetchall():
-            item = self.customer_tree.insert("", "end", values=row)
-            ctype = row[4]
-            if ctype in type_colors:
-                self.customer_tree.tag_configure(ctype, foreground=type_colors[ctype])
-                self.customer_tree.item(item, tags=(ctype,))
+        # 快速拖动滚动条时只保留最后一次读取
+        if getattr(self, "customer_window_task", None) is not None:
+            self.customer_window_task.cancel()
+        self.customer_window_task = self.run_db(pager.window, offset, visible, callback=fetched, readonly=True)
+    
+    def fill_customer_rows(self, rows, focus_edge=None):
+        """用给定的行替换表格内容并同步滚动条"""
+        tree = self.customer_tree
+        total = self.customer_pager.total
+        
+        # 只更新有变化的行，仍在窗口中的行保持选中
+        with perf.STATS.timer(perf.PAGE, "fill_customer_rows"):
+            self.customer_rows.update([(str(customer.id), customer.list_values(), (customer.customer_type,))
+                                       for customer in rows])
+        
+        # 键盘滚动后把焦点放到新出现的那一行
+        children = self.customer_rows.order
+        if focus_edge is not None and children:
+            target = children[0 if focus_edge < 0 else -1]
+            tree.focus(target)
+            if not self.customer_select_extend:
+                self.customer_selection = set()
+            self.customer_selection.add(int(target))
+        
+        # 滚回窗口的行恢复选中状态
+        selected = [iid for iid in children if int(iid) in self.customer_selection]
+        if set(tree.selection()) != set(selected):
+            tree.selection_set(selected)
+        self.update_selection_label()
+        
+        if total:
+            self.customer_scrollbar.set(self.customer_offset / total, (self.customer_offset + len(rows)) / total)
+        else:
+            self.customer_scrollbar.set(0, 1)
+    
+    def scroll_customers(self, action, amount, unit=None):
+        """滚动条及滚轮回调"""
+        if getattr(self, "customer_pager", None) is None:
+            return "break"
+        if action == "moveto":
+            self.customer_offset = int(float(amount) * self.customer_pager.total)
+        elif action == "scroll":
+            step = self.visible_customer_rows() if unit == "pages" else 1
+            self.customer_offset += int(amount) * step
+        self.render_customer_window()
+        return "break"
+    
+    def move_customer_focus(self, delta, state=0):
+        """键盘上下移动到窗口边缘时滚动一行（按住 Shift 时扩展选中范围）"""
+        tree = self.customer_tree
+        self.customer_select_extend = bool(state & SHIFT_MASK)
+        if not self.customer_select_extend:
+            # 与单击一样只选中新的一行
+            self.customer_selection = set()
+        children = tree.get_children()
+        focus = tree.focus()
+        if not children or focus != children[0 if delta < 0 else -1]:
+            return None
+        
+        self.customer_offset += delta
+        self.render_customer_window(focus_edge=delta)
+        return "break"
+    
+    def customer_tree_clicked(self, event):
+        """不按 Ctrl/Shift 单击一行时只选中这一行，滚出窗口的选中也一并取消"""
+        if not event.state & (SHIFT_MASK | CONTROL_MASK) and self.customer_tree.identify_row(event.y):
+            self.customer_selection = set()
+    
+    def customer_selection_changed(self):
+        """表格选中变化：窗口外的选中保持不变，窗口内以表格为准"""
+        visible = {int(iid) for iid in self.customer_rows.order}
+        selected = {int(iid) for iid in self.customer_tree.selection()}
+        self.customer_selection = (self.customer_selection - visible) | selected
+        self.update_selection_label()
+    
+    def set_customer_selection(self, ids):
+        self.customer_selection = set(ids)
+        if self.customer_tree.winfo_exists():
+            selected = [iid for iid in self.customer_rows.order if int(iid) in self.customer_selection]
+            self.customer_tree.selection_set(selected)
+        self.update_selection_label()
+    
+    def update_selection_label(self):
+        count = len(self.customer_selection)
+        self.selection_label.configure(text=f"已选 {count} 个客户" if count > 1 else "")
+    
+    def select_all_customers(self):
+        """选中当前条件下的全部客户（包括没有显示出来的）"""
+        query = self.customer_query
+        
+        def loaded(ids):
+            if query == self.customer_query:
+                self.set_customer_selection(ids)
+        
+        self.run_db(self.customers.customer_ids, query, callback=loaded, message="正在选择客户…", readonly=True)
+        return "break"
+    
+    def selected_customer_ids(self, action):
+        """选中客户的 id，没有选中时提示并返回空列表"""
+        if not self.customer_selection:
+            messagebox.showinfo("提示", f"请先选择要{action}的客户")
+        return sorted(self.customer_selection)
     
     def add_customer(self):
         """添加新客户"""
+        from tkinter import scrolledtext
+        
         dialog = tk.Toplevel(self.root)
         dialog.title("添加新客户")
-        dialog.geometry("500x500")
+        dialog.geometry("500x580")
         dialog.resizable(False, False)
         dialog.transient(self.root)
         dialog.grab_set()
@@ -460,6 +1201,11 @@ class ModernCustomerManagementSystem:
         notes_text.pack(side="right", fill="x", expand=True)
         fields.append(("notes", notes_text))
         
+        # 边输入边查重
+        duplicate_label = ttk.Label(form_frame, text="", foreground="#e74c3c", wraplength=440, justify="left")
+        duplicate_label.pack(fill="x", pady=(5, 0))
+        duplicates = self.watch_duplicates(dialog, fields, duplicate_label)
+        
         button_frame = ttk.Frame(form_frame)
         button_frame.pack(fill="x", pady=20)
         
@@ -471,46 +1217,110 @@ class ModernCustomerManagementSystem:
                 else:
                     data[name] = field.get().strip()
             
-            if not data["company_name"] or not data["contact_name"] or not data["phone"]:
-                messagebox.showerror("错误", "公司名称、客户名称和联系电话不能为空")
+            error = validate_customer(data)
+            if error:
+                messagebox.showerror("错误", error)
                 return
             
-            if not re.match(r'^1[3-9]\d{9}$', data["phone"]):
-                messagebox.showerror("错误", "请输入有效的手机号码")
+            if duplicates and not messagebox.askyesno(
+                    "可能重复", f"已有与该客户相似的客户，例如“{duplicates[0][0].company_name}”"
+                    f"（{'、'.join(duplicates[0][2])}），仍然添加吗？", parent=dialog):
                 return
             
-            reg_date = datetime.datetime.now().strftime("%Y-%m-%d")
+            # 新客户由数据修改通知逐行放进列表和首页统计，不重新查询
+            def saved(result):
+                messagebox.showinfo("成功", "客户添加成功")
+                dialog.destroy()
             
-            cursor = self.conn.cursor()
-            cursor.execute("""
-            INSERT INTO customers (company_name, contact_name, phone, customer_type, notes, registration_date)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """, (data["company_name"], data["contact_name"], data["phone"], 
-                 data["customer_type"], data["notes"], reg_date))
-            self.conn.commit()
+            def failed(error):
+                save_button.state(["!disabled"])
+                messagebox.showerror("错误", f"添加失败: {str(error)}")
             
-            messagebox.showinfo("成功", "客户添加成功")
-            dialog.destroy()
-            self.load_customer_data()
+            # 防止保存过程中重复点击
+            save_button.state(["disabled"])
+            self.run_db(self.customers.add_customer, data, callback=saved, errback=failed, message="正在保存客户…")
         
         save_button = ttk.Button(button_frame, text="保存", command=save_customer, style="Accent.TButton")
         save_button.pack(side="right", padx=5)
         cancel_button = ttk.Button(button_frame, text="取消", command=dialog.destroy)
         cancel_button.pack(side="right", padx=5)
     
+    def watch_duplicates(self, dialog, fields, label, exclude_id=None):
+        """公司名称、客户名称、电话停止输入一小段时间后在后台查重，结果显示在 label 中
+        
+        返回随查重结果更新的列表 [(客户, 相似度, 原因)]，保存前据此提醒。
+        """
+        watched = [(name, var) for name, var in fields if name in ("company_name", "contact_name", "phone")]
+        found = []
+        after_id = None
+        
+        def show(results):
+            if not dialog.winfo_exists():
+                return
+            found[:] = results
+            lines = [f"{customer.company_name}（{customer.contact_name}，{customer.phone}）：{'、'.join(reasons)}"
+                     for customer, score, reasons in results[:DUPLICATE_PREVIEW]]
+            if len(results) > DUPLICATE_PREVIEW:
+                lines.append(f"等 {len(results)} 个")
+            label.configure(text="可能重复的客户：\n" + "\n".join(lines) if lines else "")
+        
+        def check():
+            nonlocal after_id
+            after_id = None
+            data = {name: var.get().strip() for name, var in watched}
+            # 查重失败不影响添加，不弹出提示
+            self.run_db(self.dedup.find_duplicates, data, exclude_id, callback=show, errback=lambda error: None,
+                        readonly=True)
+        
+        def schedule(*args):
+            nonlocal after_id
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+            after_id = self.root.after(SEARCH_DELAY, check)
+        
+        for name, var in watched:
+            var.trace_add("write", schedule)
+        return found
+    
+    def schedule_dedup_refresh(self, delay=DEDUP_REFRESH_DELAY):
+        """新增、改名的客户稍后在写线程中补算查重索引（客户端模式下由服务器负责）"""
+        if self.server_url or self.dedup_refresh_after_id is not None:
+            return
+        self.dedup_refresh_after_id = self.root.after(delay, self.refresh_dedup_index)
+    
+    def refresh_dedup_index(self):
+        """补算一批查重索引，每批单独提交；还有剩余时接着补算下一批"""
+        self.dedup_refresh_after_id = None
+        
+        def refreshed(done):
+            if done >= dedup.REFRESH_CHUNK:
+                self.schedule_dedup_refresh(0)
+        
+        # 后台维护任务，失败时下次修改客户后再试
+        self.run_db(dedup.refresh, dedup.REFRESH_CHUNK, callback=refreshed, errback=lambda error: None)
+    
     def edit_customer(self):
         """编辑选中的客户"""
-        selected_item = self.customer_tree.selection()
-        if not selected_item:
-            messagebox.showinfo("提示", "请先选择要编辑的客户")
+        ids = self.selected_customer_ids("编辑")
+        if not ids:
+            return
+        if len(ids) > 1:
+            messagebox.showinfo("提示", "一次只能编辑一个客户，批量修改请用“修改类型”或“追加备注”")
             return
+        customer_id = ids[0]
         
-        item = selected_item[0]
-        customer_id = self.customer_tree.item(item, "values")[0]
+        def fetched(customer):
+            if customer is None:
+                messagebox.showerror("错误", "该客户已不存在")
+                self.load_customer_data()
+                return
+            self.show_edit_dialog(customer)
         
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM customers WHERE id = ?", (customer_id,))
-        customer_data = cursor.fetchone()
+        self.run_db(self.customers.get_customer, customer_id, callback=fetched, readonly=True)
+    
+    def show_edit_dialog(self, customer):
+        """显示编辑客户对话框"""
+        from tkinter import scrolledtext
         
         dialog = tk.Toplevel(self.root)
         dialog.title("编辑客户信息")
@@ -527,7 +1337,7 @@ class ModernCustomerManagementSystem:
         company_frame = ttk.Frame(form_frame)
         company_frame.pack(fill="x", pady=5)
         ttk.Label(company_frame, text="公司名称*:").pack(side="left", padx=5)
-        company_var = tk.StringVar(value=customer_data[1])
+        company_var = tk.StringVar(value=customer.company_name)
         company_entry = ttk.Entry(company_frame, textvariable=company_var, width=30)
         company_entry.pack(side="right", fill="x", expand=True)
         fields.append(("company_name", company_var))
@@ -535,7 +1345,7 @@ class ModernCustomerManagementSystem:
         contact_frame = ttk.Frame(form_frame)
         contact_frame.pack(fill="x", pady=5)
         ttk.Label(contact_frame, text="客户名称*:").pack(side="left", padx=5)
-        contact_var = tk.StringVar(value=customer_data[2])
+        contact_var = tk.StringVar(value=customer.contact_name)
         contact_entry = ttk.Entry(contact_frame, textvariable=contact_var, width=30)
         contact_entry.pack(side="right", fill="x", expand=True)
         fields.append(("contact_name", contact_var))
@@ -543,7 +1353,7 @@ class ModernCustomerManagementSystem:
         phone_frame = ttk.Frame(form_frame)
         phone_frame.pack(fill="x", pady=5)
         ttk.Label(phone_frame, text="联系电话*:").pack(side="left", padx=5)
-        phone_var = tk.StringVar(value=customer_data[3])
+        phone_var = tk.StringVar(value=customer.phone)
         phone_entry = ttk.Entry(phone_frame, textvariable=phone_var, width=30)
         phone_entry.pack(side="right", fill="x", expand=True)
         fields.append(("phone", phone_var))
@@ -551,7 +1361,7 @@ class ModernCustomerManagementSystem:
         type_frame = ttk.Frame(form_frame)
         type_frame.pack(fill="x", pady=5)
         ttk.Label(type_frame, text="客户类型*:").pack(side="left", padx=5)
-        type_var = tk.StringVar(value=customer_data[4])
+        type_var = tk.StringVar(value=customer.customer_type)
         type_combobox = ttk.Combobox(type_frame, textvariable=type_var, 
                                     values=["精煤", "中煤"], state="readonly", width=28)
         type_combobox.pack(side="right", fill="x", expand=True)
@@ -560,7 +1370,7 @@ class ModernCustomerManagementSystem:
         date_frame = ttk.Frame(form_frame)
         date_frame.pack(fill="x", pady=5)
         ttk.Label(date_frame, text="登记日期:").pack(side="left", padx=5)
-        date_var = tk.StringVar(value=customer_data[5])
+        date_var = tk.StringVar(value=customer.registration_date)
         date_entry = ttk.Entry(date_frame, textvariable=date_var, state="readonly", width=30)
         date_entry.pack(side="right", fill="x", expand=True)
         
@@ -568,7 +1378,7 @@ class ModernCustomerManagementSystem:
         notes_frame.pack(fill="x", pady=5)
         ttk.Label(notes_frame, text="备注:").pack(side="left", padx=5, anchor="n")
         notes_text = scrolledtext.ScrolledText(notes_frame, width=30, height=5)
-        notes_text.insert("1.0", customer_data[6] or "")
+        notes_text.insert("1.0", customer.notes)
         notes_text.pack(side="right", fill="x", expand=True)
         fields.append(("notes", notes_text))
         
@@ -583,26 +1393,22 @@ class ModernCustomerManagementSystem:
                 else:
                     data[name] = field.get().strip()
             
-            if not data["company_name"] or not data["contact_name"] or not data["phone"]:
-                messagebox.showerror("错误", "公司名称、客户名称和联系电话不能为空")
+            error = validate_customer(data)
+            if error:
+                messagebox.showerror("错误", error)
                 return
             
-            if not re.match(r'^1[3-9]\d{9}$', data["phone"]):
-                messagebox.showerror("错误", "请输入有效的手机号码")
-                return
+            def saved(result):
+                messagebox.showinfo("成功", "客户信息更新成功")
+                dialog.destroy()
             
-            cursor = self.conn.cursor()
-            cursor.execute("""
-            UPDATE customers 
-            SET company_name = ?, contact_name = ?, phone = ?, customer_type = ?, notes = ?
-            WHERE id = ?
-            """, (data["company_name"], data["contact_name"], data["phone"], 
-                 data["customer_type"], data["notes"], customer_id))
-            self.conn.commit()
+            def failed(error):
+                save_button.state(["!disabled"])
+                messagebox.showerror("错误", f"更新失败: {str(error)}")
             
-            messagebox.showinfo("成功", "客户信息更新成功")
-            dialog.destroy()
-            self.load_customer_data()
+            save_button.state(["disabled"])
+            self.run_db(self.customers.update_customer, customer.id, data, callback=saved, errback=failed,
+                        message="正在保存客户…")
         
         save_button = ttk.Button(button_frame, text="保存", command=update_customer, style="Accent.TButton")
         save_button.pack(side="right", padx=5)
@@ -610,36 +1416,373 @@ class ModernCustomerManagementSystem:
         cancel_button.pack(side="right", padx=5)
     
     def delete_customer(self):
-        """删除选中的客户"""
-        selected_item = self.customer_tree.selection()
-        if not selected_item:
-            messagebox.showinfo("提示", "请先选择要删除的客户")
+        """删除选中的客户（可以多选），在一个事务中完成，可以撤销"""
+        ids = self.selected_customer_ids("删除")
+        if not ids:
+            return
+        
+        if len(ids) == 1 and self.customer_tree.exists(str(ids[0])):
+            company_name = self.customer_tree.item(str(ids[0]), "values")[1]
+            prompt = f"确定要删除客户 '{company_name}' 吗？"
+        else:
+            prompt = f"确定要删除选中的 {len(ids)} 个客户吗？"
+        if messagebox.askyesno("确认删除", prompt):
+            self.run_customer_batch(f"删除 {len(ids)} 个客户", self.customers.delete_customers, ids,
+                                    message="正在删除客户…")
+    
+    def change_customers_type(self):
+        """把选中的客户改成同一个客户类型"""
+        ids = self.selected_customer_ids("修改类型")
+        if not ids:
             return
         
-        item = selected_item[0]
-        customer_id = self.customer_tree.item(item, "values")[0]
-        company_name = self.customer_tree.item(item, "values")[1]
+        dialog = tk.Toplevel(self.root)
+        dialog.title("修改客户类型")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        form_frame = ttk.Frame(dialog)
+        form_frame.pack(fill="both", expand=True, padx=20, pady=20)
+        ttk.Label(form_frame, text=f"把选中的 {len(ids)} 个客户改为:").pack(side="top", anchor="w", pady=5)
+        type_var = tk.StringVar(value=CUSTOMER_TYPES[0])
+        ttk.Combobox(form_frame, textvariable=type_var, values=CUSTOMER_TYPES,
+                     state="readonly", width=20).pack(side="top", fill="x", pady=5)
+        
+        def confirm():
+            customer_type = type_var.get()
+            dialog.destroy()
+            self.run_customer_batch(f"把 {len(ids)} 个客户改为{customer_type}", self.customers.set_customers_type,
+                                    ids, customer_type, message="正在修改客户类型…")
+        
+        button_frame = ttk.Frame(form_frame)
+        button_frame.pack(fill="x", pady=(15, 0))
+        ttk.Button(button_frame, text="确定", command=confirm, style="Accent.TButton").pack(side="right", padx=5)
+        ttk.Button(button_frame, text="取消", command=dialog.destroy).pack(side="right", padx=5)
+    
+    def append_customers_notes(self):
+        """在选中客户的备注末尾追加同一段文字"""
+        ids = self.selected_customer_ids("追加备注")
+        if not ids:
+            return
+        text = simpledialog.askstring("追加备注", f"追加到选中的 {len(ids)} 个客户备注末尾的内容:",
+                                      parent=self.root)
+        if not text or not text.strip():
+            return
+        self.run_customer_batch(f"给 {len(ids)} 个客户追加备注", self.customers.append_customers_notes,
+                                ids, text.strip(), message="正在追加备注…")
+    
+    def run_customer_batch(self, label, func, *args, message=None):
+        """在写线程上执行一个批量操作，成功后记入撤销栈；列表由数据修改通知更新"""
+        def done(before):
+            self.undo_stack.append((label, before))
+            del self.undo_stack[:-UNDO_LIMIT]
+            messagebox.showinfo("成功", f"已{label}，可以点击“撤销”恢复")
+        
+        def failed(error):
+            messagebox.showerror("错误", f"{label}失败: {str(error)}")
+        
+        self.run_db(func, *args, callback=done, errback=failed, message=message)
+    
+    def undo_customer_batch(self):
+        """撤销最近一次批量操作：删除的客户按原 id 恢复，修改过的客户改回原样"""
+        if not self.undo_stack:
+            messagebox.showinfo("提示", "没有可以撤销的批量操作")
+            return
+        label, before = self.undo_stack[-1]
+        if not messagebox.askyesno("确认撤销", f"撤销“{label}”？之后对这些客户做的修改也会被覆盖。"):
+            return
+        self.undo_stack.pop()
+        
+        def failed(error):
+            self.undo_stack.append((label, before))
+            messagebox.showerror("错误", f"撤销失败: {str(error)}")
+        
+        self.run_db(self.customers.restore_customers, before,
+                    callback=lambda count: messagebox.showinfo("成功", f"已撤销“{label}”"),
+                    errback=failed, message="正在撤销…")
+    
+    def import_customers(self):
+        """从 CSV/Excel 文件批量导入客户"""
+        if not self.local_only("批量导入"):
+            return
+        
+        path = filedialog.askopenfilename(
+            title="选择要导入的文件",
+            filetypes=[("客户数据", "*.csv *.xlsx"), ("CSV 文件", "*.csv"), ("Excel 文件", "*.xlsx")],
+            parent=self.root
+        )
+        if not path:
+            return
+        
+        def imported(result):
+            self.dashboard_stats.invalidate()
+            self.schedule_dedup_refresh()
+            self.load_customer_data()
+            message = f"成功导入 {result['imported']} 个客户（{result['rows_per_sec']:.0f} 行/秒）"
+            if result["rejected"]:
+                message += f"\n{result['rejected']} 行未通过校验，已写入: {result['rejects_path']}"
+            messagebox.showinfo("导入完成", message)
+        
+        def failed(error):
+            messagebox.showerror("错误", f"导入失败，未导入任何数据: {str(error)}")
+        
+        import importer
+        self.run_db(importer.import_customers, path, callback=imported, errback=failed,
+                    message="正在导入客户…", progress=True)
+    
+    def find_duplicate_customers(self):
+        """全表查重，按组列出可能重复的客户"""
+        self.run_db(self.dedup.duplicate_report, callback=self.show_duplicate_groups,
+                    message="正在查找重复客户…", progress=True)
+    
+    def show_duplicate_groups(self, groups):
+        """显示查重结果，选中的客户可以放到列表的选中范围里统一删除或修改"""
+        if not groups:
+            messagebox.showinfo("查重", "没有发现可能重复的客户")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        title = f"可能重复的客户（{len(groups)} 组"
+        if len(groups) > DUPLICATE_REPORT_GROUPS:
+            title += f"，显示人数最多的 {DUPLICATE_REPORT_GROUPS} 组"
+        dialog.title(title + "）")
+        dialog.geometry("900x500")
+        dialog.transient(self.root)
+        
+        table_frame = ttk.Frame(dialog)
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        columns = ("id", "公司名称", "客户名称", "联系电话", "客户类型", "登记日期")
+        tree = ttk.Treeview(table_frame, columns=columns, show="tree headings", selectmode="extended")
+        tree.heading("#0", text="分组")
+        tree.column("#0", width=120)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120, anchor="center")
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        for number, group in enumerate(groups[:DUPLICATE_REPORT_GROUPS], 1):
+            parent = tree.insert("", "end", text=f"第 {number} 组（{len(group)} 个）", open=number == 1)
+            for customer in group:
+                tree.insert(parent, "end", iid=str(customer.id), values=(
+                    customer.id, customer.company_name, customer.contact_name, customer.phone,
+                    customer.customer_type, customer.registration_date))
+        
+        def select_in_list():
+            ids = [int(iid) for iid in tree.selection() if tree.parent(iid)]
+            if not ids:
+                messagebox.showinfo("提示", "请先选中要处理的客户（不是分组）", parent=dialog)
+                return
+            dialog.destroy()
+            self.show_customer_management()
+            self.set_customer_selection(ids)
+            messagebox.showinfo("提示", f"已在客户列表中选中 {len(ids)} 个客户，可以删除、修改类型或追加备注")
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill="x", padx=10, pady=(0, 10))
+        ttk.Button(button_frame, text="关闭", command=dialog.destroy).pack(side="right", padx=5)
+        ttk.Button(button_frame, text="在列表中选中", command=select_in_list,
+                   style="Accent.TButton").pack(side="right", padx=5)
+    
+    def show_customer_history(self):
+        """查看某一时刻之后修改过的客户或已删除的客户，选中的可以恢复成当时（删除前）的内容"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("历史记录")
+        dialog.geometry("1000x520")
+        dialog.transient(self.root)
         
-        if messagebox.askyesno("确认删除", f"确定要删除客户 '{company_name}' 吗？"):
+        query_frame = ttk.Frame(dialog)
+        query_frame.pack(fill="x", padx=10, pady=(10, 0))
+        mode_var = tk.StringVar(value=HISTORY_CHANGES)
+        ttk.Combobox(query_frame, textvariable=mode_var, values=(HISTORY_CHANGES, HISTORY_DELETED),
+                     state="readonly", width=16).pack(side="left", padx=5)
+        ttk.Label(query_frame, text="时间（YYYY-MM-DD [HH:MM:SS]）:").pack(side="left", padx=(10, 0))
+        # 默认查看今天的修改，即昨天结束时之后的修改
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        as_of_var = tk.StringVar(value=yesterday.strftime("%Y-%m-%d"))
+        ttk.Entry(query_frame, textvariable=as_of_var, width=20).pack(side="left", padx=5)
+        status_label = ttk.Label(query_frame, text="")
+        
+        table_frame = ttk.Frame(dialog)
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        columns = ("id", "公司名称", "客户名称", "联系电话", "客户类型", "备注", "变化")
+        tree = ttk.Treeview(table_frame, columns=columns, show="headings", selectmode="extended")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=220 if col == "变化" else 120, anchor="center")
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        # 当前列表对应的查询，恢复时按它而不是输入框中改过的内容
+        shown = {"mode": None, "as_of": None}
+        
+        def fill(mode, as_of, rows):
+            if not dialog.winfo_exists():
+                return
+            shown.update(mode=mode, as_of=as_of)
+            tree.delete(*tree.get_children())
+            for customer, change in rows:
+                tree.insert("", "end", iid=str(customer.id), values=(
+                    customer.id, customer.company_name, customer.contact_name, customer.phone,
+                    customer.customer_type, customer.notes, change))
+            text = f"共 {len(rows)} 个客户"
+            if len(rows) >= history.CHANGES_LIMIT:
+                text += f"（只列出 {history.CHANGES_LIMIT} 个）"
+            status_label.configure(text=text)
+        
+        def changed_rows(pairs):
+            rows = []
+            for then, now in pairs:
+                if then is None:
+                    rows.append((now, "之后添加"))
+                elif now is None:
+                    rows.append((then, "之后删除"))
+                else:
+                    fields = [title for title, value, current in zip(columns[1:6], then.list_values()[1:],
+                                                                      now.list_values()[1:]) if value != current]
+                    rows.append((then, "之后修改: " + "、".join(fields) if fields else "之后修改过，已改回"))
+            return rows
+        
+        def query():
+            mode = mode_var.get()
             try:
-                cursor = self.conn.cursor()
-                cursor.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
-                self.conn.commit()
-                
-                messagebox.showinfo("成功", "客户已删除")
-                self.load_customer_data()
-            except Exception as e:
-                messagebox.showerror("错误", f"删除失败: {str(e)}")
+                as_of = history.parse_as_of(as_of_var.get())
+            except ValueError as e:
+                messagebox.showerror("错误", str(e), parent=dialog)
+                return
+            
+            def failed(error):
+                messagebox.showerror("错误", f"读取历史记录失败: {str(error)}", parent=dialog)
+            
+            if mode == HISTORY_DELETED:
+                self.run_db(self.history.deleted_customers, errback=failed, readonly=True,
+                            callback=lambda deleted: fill(mode, None, [
+                                (customer, f"删除于 {changed_at[:19]}") for changed_at, customer in deleted]))
+            else:
+                self.run_db(self.history.changed_since, as_of, errback=failed, readonly=True,
+                            message="正在读取历史记录…",
+                            callback=lambda pairs: fill(mode, as_of, changed_rows(pairs)))
+        
+        def restore():
+            ids = [int(iid) for iid in tree.selection()]
+            if not ids:
+                messagebox.showinfo("提示", "请先选中要恢复的客户", parent=dialog)
+                return
+            if shown["mode"] == HISTORY_DELETED:
+                func, args = self.history.undelete, (ids,)
+                prompt = f"按删除前的内容恢复选中的 {len(ids)} 个客户？"
+            else:
+                func, args = self.history.revert, (ids, shown["as_of"])
+                prompt = (f"把选中的 {len(ids)} 个客户改回 {shown['as_of']} 时的内容？"
+                          "当时已删除的会重新添加，当时还不存在的会被删除。")
+            if not messagebox.askyesno("确认恢复", prompt, parent=dialog):
+                return
+            
+            def done(count):
+                # 恢复本身也记入历史，改错了可以再按时间恢复回来
+                messagebox.showinfo("成功", f"已恢复 {count} 个客户", parent=dialog)
+                if dialog.winfo_exists():
+                    query()
+            
+            def failed(error):
+                messagebox.showerror("错误", f"恢复失败: {str(error)}", parent=dialog)
+            
+            self.run_db(func, *args, callback=done, errback=failed, message="正在恢复客户…")
+        
+        def show_timeline():
+            ids = tree.selection()
+            if len(ids) != 1:
+                messagebox.showinfo("提示", "请选中一个客户", parent=dialog)
+                return
+            customer_id = int(ids[0])
+            self.run_db(self.history.timeline, customer_id, readonly=True,
+                        callback=lambda entries: self.show_customer_timeline(customer_id, entries, dialog))
+        
+        ttk.Button(query_frame, text="查询", command=query, style="Accent.TButton").pack(side="left", padx=5)
+        status_label.pack(side="left", padx=10)
+        tree.bind("<Double-1>", lambda event: show_timeline())
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill="x", padx=10, pady=(0, 10))
+        ttk.Button(button_frame, text="关闭", command=dialog.destroy).pack(side="right", padx=5)
+        ttk.Button(button_frame, text="查看修改记录", command=show_timeline).pack(side="right", padx=5)
+        ttk.Button(button_frame, text="恢复选中客户", command=restore,
+                   style="Accent.TButton").pack(side="right", padx=5)
+        query()
+    
+    def show_customer_timeline(self, customer_id, entries, parent):
+        """显示一个客户的修改记录，最新的在前"""
+        titles = dict(EXPORT_COLUMNS)
+        
+        dialog = tk.Toplevel(parent)
+        dialog.title(f"客户 {customer_id} 的修改记录")
+        dialog.geometry("800x400")
+        dialog.transient(parent)
+        
+        table_frame = ttk.Frame(dialog)
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        columns = ("时间", "操作", "内容")
+        tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+        tree.heading("时间", text="时间")
+        tree.column("时间", width=160, anchor="center")
+        tree.heading("操作", text="操作")
+        tree.column("操作", width=60, anchor="center")
+        tree.heading("内容", text="内容")
+        tree.column("内容", width=560, anchor="w")
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        for changed_at, action, fields in entries:
+            if action == "U":
+                text = "；".join(f"{titles.get(field, field)}: {old} → {new}" for field, (old, new) in fields.items())
+            else:
+                # 添加和删除显示当时的公司名称
+                old, new = fields.get("company_name", (None, None))
+                text = new if action == "I" else old
+            tree.insert("", "end", values=(changed_at[:19], history.ACTIONS.get(action, action), text or ""))
+        if not entries:
+            tree.insert("", "end", values=("", "", "没有修改记录（可能是启用历史记录之前添加的）"))
+        
+        ttk.Button(dialog, text="关闭", command=dialog.destroy).pack(side="right", padx=10, pady=(0, 10))
+    
+    def export_customers(self):
+        """把当前搜索条件下的客户列表按列表的顺序导出为 CSV/Excel"""
+        query = self.current_customer_filter()
+        
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = filedialog.asksaveasfilename(
+            title="导出客户列表",
+            initialfile=f"客户列表_{timestamp}.csv",
+            defaultextension=".csv",
+            filetypes=[("CSV 文件", "*.csv"), ("Excel 文件", "*.xlsx")],
+            parent=self.root
+        )
+        if not path:
+            return
+        
+        def failed(error):
+            messagebox.showerror("错误", f"导出失败: {str(error)}")
+        
+        self.run_db(self.customers.export_customers, path, query,
+                    callback=lambda count: messagebox.showinfo("导出完成", f"已导出 {count} 个客户到: {path}"),
+                    errback=failed, message="正在导出客户…", progress=True, readonly=True)
     
     def show_system_settings(self):
         """显示系统设置页面"""
-        # 清除当前内容
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
-        ttk.Label(self.content_frame, text="系统设置", style="Title.TLabel").pack(anchor="w", pady=(0, 20))
+        self.show_page("settings", self.build_system_settings)
+    
+    def build_system_settings(self, page):
+        """创建系统设置页面"""
+        ttk.Label(page, text="系统设置", style="Title.TLabel").pack(anchor="w", pady=(0, 20))
         
-        settings_frame = ttk.LabelFrame(self.content_frame, text="系统管理")
+        settings_frame = ttk.LabelFrame(page, text="系统管理")
         settings_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
         ttk.Button(settings_frame, text="更改管理员密码", command=self.change_admin_password, 
@@ -648,104 +1791,363 @@ class ModernCustomerManagementSystem:
                   width=20).pack(anchor="w", padx=20, pady=10)
         ttk.Button(settings_frame, text="恢复数据库", command=self.restore_database, 
                   width=20).pack(anchor="w", padx=20, pady=10)
+        ttk.Button(settings_frame, text="性能统计", command=self.show_performance, 
+                  width=20).pack(anchor="w", padx=20, pady=10)
         
-        info_frame = ttk.LabelFrame(self.content_frame, text="系统信息")
+        info_frame = ttk.LabelFrame(page, text="系统信息")
         info_frame.pack(fill="x", padx=10, pady=10)
         
         info_text = (
             "凯川矿客户管理系统 v1.0\n\n"
             "开发人员: 王杰\n"
             "开发日期: 2025-06-24\n"
-            "数据库位置: data/customer_data.db"
+            f"数据库位置: {self.server_url or DB_PATH}\n"
+            f"自动备份: 每 {backup.AUTO_BACKUP_INTERVAL.days} 天一次（gzip 压缩，数据无变化时跳过）\n"
+            f"备份保留: 最近 {backup.KEEP_LAST} 份，以及最近 {backup.KEEP_DAILY} 天每天、"
+            f"{backup.KEEP_WEEKLY} 周每周各一份"
         )
+        first_frame = startup.PROFILE.elapsed("首帧")
+        if first_frame is not None:
+            info_text += f"\n启动耗时: {first_frame:.2f} 秒显示登录页面（--startup-report 查看详情）"
         
         ttk.Label(info_frame, text=info_text, justify="left").pack(padx=20, pady=20)
     
-    def change_admin_password(self):
-        """更改管理员密码"""
-        current_password = simpledialog.askstring("密码验证", "请输入当前密码:", show='*', parent=self.root)
-        if current_password is None:
-            return
+    def show_performance(self):
+        """显示性能统计页面，停留在页面上时定时刷新"""
+        self.show_page("performance", self.build_performance)
+        self.fill_performance()
+    
+    def build_performance(self, page):
+        """创建性能统计页面：各项耗时的百分位数和最近的界面卡顿"""
+        header_frame = ttk.Frame(page)
+        header_frame.pack(fill="x", pady=(0, 10))
+        ttk.Label(header_frame, text="性能统计", style="Title.TLabel").pack(side="left")
         
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT password_hash FROM users WHERE username = ?", ("jirowang",))
-        result = cursor.fetchone()
-        if not result or not self.verify_password(current_password, result[0]):
-            messagebox.showerror("错误", "当前密码不正确")
+        button_frame = ttk.Frame(header_frame)
+        button_frame.pack(side="right")
+        ttk.Button(button_frame, text="导出 JSON", command=self.export_performance, 
+                  style="Accent.TButton").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="清空", command=self.reset_performance).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="返回系统设置", command=self.show_system_settings).pack(side="left", padx=5)
+        
+        filter_frame = ttk.Frame(page)
+        filter_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(filter_frame, text="类别:").pack(side="left")
+        self.perf_category = tk.StringVar(value="全部")
+        category_combobox = ttk.Combobox(filter_frame, textvariable=self.perf_category,
+                                         values=("全部",) + perf.CATEGORIES, state="readonly", width=8)
+        category_combobox.pack(side="left", padx=5)
+        category_combobox.bind("<<ComboboxSelected>>", lambda event: self.fill_performance())
+        self.perf_trace_sql = tk.BooleanVar(value=perf.STATS.trace_sql)
+        ttk.Checkbutton(filter_frame, text="逐条记录 SQL 语句", variable=self.perf_trace_sql,
+                        command=lambda: setattr(perf.STATS, "trace_sql", self.perf_trace_sql.get())
+                        ).pack(side="left", padx=15)
+        self.perf_summary_label = ttk.Label(filter_frame, text="")
+        self.perf_summary_label.pack(side="left", padx=10)
+        
+        table_frame = ttk.Frame(page)
+        table_frame.pack(fill="both", expand=True)
+        columns = [title for title, field, width in PERF_COLUMNS]
+        tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+        for title, field, width in PERF_COLUMNS:
+            tree.heading(title, text=title)
+            tree.column(title, width=width, anchor="w" if field == "name" else "center", stretch=field == "name")
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.perf_rows = TreeRows(tree)
+        # 统计项 -> 表格 iid，SQL 文本不直接当 iid
+        self.perf_iids = {}
+        
+        stall_frame = ttk.LabelFrame(page, text=f"最近的界面卡顿（主线程超过 {perf.STALL_THRESHOLD_MS} ms 没有响应）")
+        stall_frame.pack(fill="x", pady=(10, 0))
+        stall_tree = ttk.Treeview(stall_frame, columns=("时间", "卡顿 ms", "页面"), show="headings", height=5)
+        for col, width in (("时间", 160), ("卡顿 ms", 100), ("页面", 160)):
+            stall_tree.heading(col, text=col)
+            stall_tree.column(col, width=width, anchor="center")
+        stall_tree.pack(fill="x", padx=10, pady=10)
+        self.perf_stall_rows = TreeRows(stall_tree)
+    
+    def fill_performance(self):
+        """刷新性能统计表格，页面仍在显示时安排下一次刷新"""
+        if self.perf_refresh_after_id is not None:
+            self.root.after_cancel(self.perf_refresh_after_id)
+            self.perf_refresh_after_id = None
+        if self.current_page != "performance":
             return
         
-        new_password = simpledialog.askstring("更改密码", "请输入新密码:", show='*', parent=self.root)
-        if new_password is None:
+        category = self.perf_category.get()
+        items = perf.STATS.summary(None if category == "全部" else category)
+        rows = []
+        for item in items[:PERF_ROWS]:
+            key = (item["category"], item["name"])
+            iid = self.perf_iids.setdefault(key, f"perf{len(self.perf_iids)}")
+            rows.append((iid, tuple(f"{item[field]:.1f}" if field.endswith("_ms") else item[field]
+                                    for title, field, width in PERF_COLUMNS), ()))
+        self.perf_rows.update(rows)
+        
+        stalls = perf.STATS.recent_stalls()
+        self.perf_stall_rows.update([
+            (f"stall{when}", (datetime.datetime.fromtimestamp(when).strftime("%Y-%m-%d %H:%M:%S"),
+                              f"{ms:.0f}", page), ())
+            for when, ms, page in stalls])
+        
+        since = datetime.datetime.fromtimestamp(perf.STATS.started).strftime("%Y-%m-%d %H:%M:%S")
+        text = f"自 {since} 起，共 {len(items)} 项"
+        if len(items) > PERF_ROWS:
+            text += f"（显示合计耗时最多的 {PERF_ROWS} 项）"
+        text += f"，百分位数按每项最近 {perf.SAMPLE_SIZE} 次计算"
+        self.perf_summary_label.configure(text=text)
+        self.perf_refresh_after_id = self.root.after(PERF_REFRESH_MS, self.fill_performance)
+    
+    def reset_performance(self):
+        """清空性能统计"""
+        if messagebox.askyesno("确认清空", "清空目前为止的全部性能统计？"):
+            perf.STATS.reset()
+            self.fill_performance()
+    
+    def export_performance(self):
+        """把性能统计导出为 JSON 文件，可以附在问题报告中"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = filedialog.asksaveasfilename(
+            title="导出性能统计",
+            initialfile=f"性能统计_{timestamp}.json",
+            defaultextension=".json",
+            filetypes=[("JSON 文件", "*.json")],
+            parent=self.root
+        )
+        if not path:
             return
-        confirm_password = simpledialog.askstring("更改密码", "请再次输入新密码:", show='*', parent=self.root)
-        if confirm_password is None:
+        first_frame = startup.PROFILE.elapsed("首帧")
+        try:
+            perf.STATS.export(path, mode="客户端" if self.server_url else "单机",
+                              schema_version=migrations.SCHEMA_VERSION,
+                              startup_first_frame_ms=round(first_frame * 1000, 1) if first_frame is not None else None)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出失败: {str(e)}")
             return
-        if new_password != confirm_password:
-            messagebox.showerror("错误", "两次输入的新密码不一致")
+        messagebox.showinfo("导出完成", f"性能统计已导出到: {path}")
+    
+    def change_admin_password(self):
+        """更改管理员密码"""
+        current_password = simpledialog.askstring("密码验证", "请输入当前密码:", show='*', parent=self.root)
+        if current_password is None:
             return
         
-        password_hash = self.hash_password(new_password)
-        cursor.execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, "jirowang"))
-        self.conn.commit()
-        messagebox.showinfo("成功", "密码已更新")
+        def verified(ok):
+            if not ok:
+                messagebox.showerror("错误", "当前密码不正确")
+                return
+            
+            new_password = simpledialog.askstring("更改密码", "请输入新密码:", show='*', parent=self.root)
+            if new_password is None:
+                return
+            confirm_password = simpledialog.askstring("更改密码", "请再次输入新密码:", show='*', parent=self.root)
+            if confirm_password is None:
+                return
+            if new_password != confirm_password:
+                messagebox.showerror("错误", "两次输入的新密码不一致")
+                return
+            
+            self.run_db(self.accounts.set_password, accounts.ADMIN_USERNAME, new_password,
+                        callback=lambda result: messagebox.showinfo("成功", "密码已更新"))
+        
+        # 与登录相同在写线程执行：check_login 可能顺便升级旧格式的哈希
+        self.run_db(self.accounts.check_login, accounts.ADMIN_USERNAME, current_password, callback=verified)
     
     def backup_database(self):
         """备份数据库"""
-        try:
-            if not os.path.exists("data/backups"):
-                os.makedirs("data/backups")
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = f"data/backups/customer_data_backup_{timestamp}.db"
-            backup_conn = sqlite3.connect(backup_file)
-            with backup_conn:
-                self.conn.backup(backup_conn)
-            messagebox.showinfo("成功", f"数据库备份成功，备份文件位于: {backup_file}")
-        except Exception as e:
-            messagebox.showerror("错误", f"备份失败: {str(e)}")
+        if not self.local_only("备份数据库"):
+            return
+        
+        def done(result):
+            info, removed = result
+            message = (f"数据库备份成功，备份文件位于: {os.path.join(backup.BACKUP_DIR, info['file'])}\n"
+                       f"共 {info['customers']} 个客户，压缩后 {info['size'] / 1024 / 1024:.1f} MB")
+            if removed:
+                message += f"\n按保留策略清理了 {len(removed)} 份旧备份"
+            messagebox.showinfo("成功", message)
+        
+        def failed(error):
+            messagebox.showerror("错误", f"备份失败: {str(error)}")
+        
+        # 分页在线备份并压缩，在后台线程执行，界面可以继续使用
+        self.run_db(backup.run_backup, callback=done, errback=failed,
+                    message="正在备份数据库…", progress=True)
+    
+    def schedule_auto_backup(self, delay=AUTO_BACKUP_CHECK_MS):
+        """定时检查是否需要自动备份"""
+        if getattr(self, "auto_backup_after_id", None) is not None:
+            self.root.after_cancel(self.auto_backup_after_id)
+        self.auto_backup_after_id = self.root.after(delay, self.auto_backup)
+    
+    def auto_backup(self):
+        """到期时在后台自动备份，失败只提示在状态栏"""
+        def failed(error):
+            if self.status_bar_ready():
+                self.status_label.configure(text=f"自动备份失败: {str(error)}")
+        
+        self.run_db(backup.auto_backup, errback=failed, message="正在自动备份…", progress=True)
+        self.schedule_auto_backup()
     
     def restore_database(self):
         """恢复数据库"""
-        if not messagebox.askyesno("确认恢复", "恢复数据库将覆盖当前数据，是否继续？"):
+        if not self.local_only("恢复数据库"):
             return
-        try:
-            backup_dir = "data/backups"
-            if not os.path.exists(backup_dir) or not os.listdir(backup_dir):
+        
+        if not messagebox.askyesno("确认恢复", "恢复数据库将覆盖当前数据，是否继续？\n（当前数据会先自动保存为一份备份）"):
+            return
+        
+        def listed(backups):
+            if not backups:
                 messagebox.showinfo("提示", "没有找到备份文件")
                 return
-            backup_files = [f for f in os.listdir(backup_dir) if f.endswith(".db")]
-            backup_file = simpledialog.askstring("恢复数据库", "请输入要恢复的备份文件名:\n" + "\n".join(backup_files), parent=self.root)
-            if not backup_file:
-                return
-            backup_path = os.path.join(backup_dir, backup_file)
-            if not os.path.exists(backup_path):
-                messagebox.showerror("错误", "指定的备份文件不存在")
+            self.show_backup_picker(backups)
+        
+        self.run_db(lambda conn: backup.list_backups(), callback=listed, message="正在读取备份列表…",
+                    readonly=True)
+    
+    def show_backup_picker(self, backups):
+        """选择要恢复的备份，列表信息来自备份的元数据"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("选择要恢复的备份")
+        dialog.geometry("700x400")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        frame = ttk.Frame(dialog)
+        frame.pack(fill="both", expand=True, padx=20, pady=20)
+        
+        columns = ("备份时间", "类型", "客户数", "文件大小", "文件名")
+        tree = ttk.Treeview(frame, columns=columns, show="headings", selectmode="browse")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor="center")
+        tree.column("文件名", width=260)
+        
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        for index, item in enumerate(backups):
+            kind = item["note"] or ("自动" if item["automatic"] else "手动")
+            customers = "—" if item["customers"] is None else item["customers"]
+            size = f"{item['size'] / 1024 / 1024:.1f} MB"
+            tree.insert("", "end", iid=str(index), values=(
+                item["created"].strftime("%Y-%m-%d %H:%M:%S"), kind, customers, size, item["file"]))
+        tree.selection_set("0")
+        
+        def restore():
+            selected = tree.selection()
+            if not selected:
                 return
-            self.conn.close()
-            if os.path.exists("data/customer_data.db"):
-                os.remove("data/customer_data.db")
-            import shutil
-            shutil.copy2(backup_path, "data/customer_data.db")
-            messagebox.showinfo("成功", "数据库恢复成功")
-        except Exception as e:
-            messagebox.showerror("错误", f"恢复失败: {str(e)}")
-        finally:
-            self.conn = sqlite3.connect("data/customer_data.db")
-            if hasattr(self, 'customer_tree'):
-                self.load_customer_data()
+            item = backups[int(selected[0])]
+            dialog.destroy()
+            self.restore_backup(item["path"])
+        
+        tree.bind("<Double-1>", lambda event: restore())
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill="x", padx=20, pady=(0, 20))
+        ttk.Button(button_frame, text="恢复", command=restore, style="Accent.TButton").pack(side="right", padx=5)
+        ttk.Button(button_frame, text="取消", command=dialog.destroy).pack(side="right", padx=5)
+    
+    def restore_backup(self, backup_path):
+        """校验并还原备份，再原子替换正在使用的数据库"""
+        def prepare(conn):
+            # 在数据库旁的临时文件中还原、校验并升级结构，不影响当前数据
+            return backup.prepare_restore(backup_path, DB_PATH)
+        
+        def prepared(temp_path):
+            try:
+                # 结束数据库线程，确保没有连接占用数据库文件
+                self.cancel_tasks()
+                self.db.close()
+                saved = backup.swap_in(temp_path, DB_PATH)
+            except Exception as e:
+                messagebox.showerror("错误", f"恢复失败，当前数据未改变: {str(e)}")
+                saved = False
+            finally:
+                if self.db.closed:
+                    self.db = DBExecutor(self.root, DB_PATH)
+                    self.db.subscribe(self.apply_customer_changes)
+                self.after_restore()
+            if saved is not False:
+                message = "数据库恢复成功"
+                if saved:
+                    message += f"\n恢复前的数据已保存为备份: {saved}"
+                messagebox.showinfo("成功", message)
+        
+        def failed(error):
+            messagebox.showerror("错误", f"恢复失败，当前数据未改变: {str(error)}")
+        
+        self.run_db(prepare, callback=prepared, errback=failed, message="正在校验并还原备份…", progress=True)
+    
+    def after_restore(self):
+        """数据库替换后重置缓存并预先加载首页数据"""
+        self.dashboard_stats.invalidate()
+        # 恢复的是另一份数据，之前的批量操作不能再撤销
+        self.undo_stack = []
+        self.schedule_dedup_refresh()
+        self.customer_pager = None
+        self.customer_load_task = None
+        self.customer_window_task = None
+        # 预先加载首页统计，之后打开首页无需等待
+        self.run_db(self.dashboard_stats.get, readonly=True)
+        if self.customer_page_visible():
+            self.load_customer_data()
+        else:
             self.show_dashboard()
     
+    def schedule_search(self, delay=SEARCH_DELAY):
+        """输入变化后延迟搜索，连续输入时只执行最后一次"""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(delay, self.live_search)
+    
+    def live_search(self):
+        """自动搜索：条件没有变化时不重复查询"""
+        self.search_after_id = None
+        query = self.current_customer_filter()
+        if self.customer_page_visible() and query == getattr(self, "customer_query", None):
+            return
+        self.perform_search()
+    
+    def customer_page_visible(self):
+        """当前是否在客户管理页面"""
+        return self.current_page == "customers"
+    
     def perform_search(self):
         """执行搜索"""
-        # 直接刷新客户列表，无需跳转页面
-        self.load_customer_data()
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        
+        # 搜索结果显示在客户管理页面
+        if not self.customer_page_visible():
+            self.show_customer_management()
+            return
+        self.load_customer_data(reuse=True)
     
     def reset_search(self):
-        """重置搜索"""
+        """重置搜索和高级筛选（保留排序）"""
         self.search_entry.delete(0, tk.END)
         self.customer_type_var.set("所有")
+        for var in self.filter_vars.values():
+            var.set("")
         self.perform_search()
 
 if __name__ == "__main__":
+    startup.mark("导入模块")
+    parser = argparse.ArgumentParser(description="凯川矿客户管理系统")
+    parser.add_argument("--server", default=os.environ.get("CUSTOMER_SERVER"),
+                        help="连接局域网服务器（如 http://192.168.1.10:8765），不指定时使用本地数据库")
+    parser.add_argument(startup.REPORT_FLAG, action="store_true", help="启动后在控制台输出各阶段和模块导入耗时")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = ModernCustomerManagementSystem(root)
+    startup.mark("创建窗口")
+    app = ModernCustomerManagementSystem(root, server_url=args.server)
     root.mainloop()
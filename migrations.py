@@ -0,0 +1,197 @@
+"""数据库结构版本管理（基于 PRAGMA user_version）"""
+import sqlite3
+
+import analytics
+import dedup
+import history
+import search
+import stats
+
+
+def create_base_tables(conn):
+    """v1：用户表和客户表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS customers (
+        id INTEGER PRIMARY KEY,
+        company_name TEXT NOT NULL,
+        contact_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        customer_type TEXT NOT NULL,
+        notes TEXT,
+        registration_date TEXT NOT NULL
+    )
+    ''')
+
+
+def create_fts_index(conn):
+    """v2：全文检索索引"""
+    search.install(conn)
+
+
+def create_customer_indexes(conn):
+    """v3：类型统计/筛选、登记日期范围和电话查询的索引"""
+    # 类型统计只读索引即可完成；类型筛选按 id 倒序分页时无需再排序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_type_id ON customers (customer_type, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_registration_date ON customers (registration_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_phone ON customers (phone)")
+
+
+def create_customer_stats(conn):
+    """v4：首页分类计数表"""
+    stats.install(conn)
+
+
+def create_sort_indexes(conn):
+    """v5：客户列表按公司名称、客户名称排序的索引（电话、类型已有索引）"""
+    # 索引隐含 rowid，按 (列, id) 键集分页时可以直接沿索引读取
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_company_name ON customers (company_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_contact_name ON customers (contact_name)")
+
+
+def create_analytics_tables(conn):
+    """v6：报表用的每月新增计数表和备注关键词统计表"""
+    analytics.install(conn)
+
+
+def create_duplicate_index(conn):
+    """v7：查重用的公司名称分桶键表（键在 dedup.refresh 中补算）"""
+    dedup.install(conn)
+
+
+def create_customer_history(conn):
+    """v8：客户修改历史表"""
+    history.install(conn)
+
+
+# 按顺序排列，第 N 项把数据库从版本 N-1 升级到 N，只能追加不能修改
+MIGRATIONS = [
+    create_base_tables,
+    create_fts_index,
+    create_customer_indexes,
+    create_customer_stats,
+    create_sort_indexes,
+    create_analytics_tables,
+    create_duplicate_index,
+    create_customer_history,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+class SchemaVersionError(Exception):
+    """数据库版本比程序支持的更新"""
+
+
+def get_version(conn):
+    """读取数据库当前的结构版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """把数据库升级到最新版本，返回执行前的版本号
+
+    每个版本在单独的事务中执行并同时写入 user_version，中途失败会整体回滚，
+    旧数据库和恢复出来的旧备份都可以安全地反复执行。
+    """
+    version = get_version(conn)
+    if version > SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"数据库版本为 {version}，当前程序只支持到 {SCHEMA_VERSION}，请升级程序"
+        )
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    ensure_fts_index(conn)
+    return version
+
+
+def ensure_fts_index(conn):
+    """补建全文检索索引
+
+    没有 FTS5 的 SQLite 上 v2 只能退回 LIKE 查询，版本号却已经升级；之后用支持 FTS5 的 SQLite
+    打开同一个数据库时在这里补建索引和同步触发器。
+    """
+    if search.fts_tokenizer(conn) is not None or not search.fts5_available(conn):
+        return
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        search.install(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# 用于检查索引效果的热点查询：(名称, SQL, 参数)
+HOT_QUERIES = [
+    ("按类型统计", "SELECT COUNT(*) FROM customers WHERE customer_type = ?", ("精煤",)),
+    ("按类型分组统计", "SELECT customer_type, COUNT(*) FROM customers GROUP BY customer_type", ()),
+    ("类型筛选分页",
+     "SELECT id, company_name FROM customers WHERE customer_type = ? AND id < ? ORDER BY id DESC LIMIT 100",
+     ("精煤", 1 << 62)),
+    ("登记日期范围",
+     "SELECT COUNT(*) FROM customers WHERE registration_date BETWEEN ? AND ?",
+     ("2025-01-01", "2025-12-31")),
+    ("电话查询", "SELECT id FROM customers WHERE phone = ?", ("13800000000",)),
+    ("最近添加", "SELECT id FROM customers ORDER BY id DESC LIMIT 5", ()),
+    ("按公司名称排序分页",
+     "SELECT id FROM customers WHERE (company_name, id) > (?, ?) ORDER BY company_name, id LIMIT 100",
+     ("", 0)),
+    ("电话前缀",
+     "SELECT id FROM customers WHERE phone >= ? AND phone < ? ORDER BY id DESC LIMIT 100",
+     ("138", "139")),
+    ("按年统计备注", "SELECT notes FROM customers WHERE registration_date >= ? AND registration_date < ?",
+     ("2025", "2026")),
+    ("客户修改记录",
+     "SELECT changed_at, action, data FROM customer_history WHERE customer_id = ?"
+     " ORDER BY changed_at DESC, id DESC LIMIT 200", (1,)),
+    ("某时刻之后的修改",
+     "SELECT customer_id, action, data FROM customer_history WHERE changed_at > ? ORDER BY changed_at DESC, id DESC",
+     ("2025-01-01",)),
+    ("查重分桶",
+     "SELECT customer_id FROM customer_name_keys WHERE key = ? ORDER BY customer_id DESC LIMIT 20", (0,)),
+]
+
+
+def explain(conn, query, params=()):
+    """返回 SQLite 为查询选择的执行计划（EXPLAIN QUERY PLAN 的 detail 列）"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+
+
+def index_report(conn):
+    """列出热点查询各自使用的索引，返回 [(名称, [计划, ...]), ...]"""
+    return [(name, explain(conn, query, params)) for name, query, params in HOT_QUERIES]
+
+
+if __name__ == "__main__":
+    # python migrations.py [数据库路径]：升级数据库并打印热点查询的执行计划
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/customer_data.db"
+    conn = sqlite3.connect(path)
+    before = migrate(conn)
+    print(f"{path}: 版本 {before} -> {get_version(conn)}")
+    for name, plan in index_report(conn):
+        print(f"\n{name}:")
+        for detail in plan:
+            print(f"  {detail}")
+    conn.close()
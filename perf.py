@@ -0,0 +1,266 @@
+"""运行时性能统计：SQL 语句、后台任务、接口请求、页面和界面主线程卡顿的耗时
+
+每个统计项只在内存中保留最近 SAMPLE_SIZE 次的耗时（环形缓冲区），百分位数按这些样本计算，
+反映的是最近的情况；次数、合计和最大值从启动开始累计。“系统设置 - 性能统计”页面显示这些数据，
+并可以导出成 JSON 文件附在问题报告里。
+
+SQL 语句通过连接的 trace 回调计时：一条语句从开始执行算到同一连接上的下一条语句开始（或任务结束），
+包括在 Python 中逐行读取结果的时间。语句中的字面值替换成 ?，相同形状的语句合并成一项，
+导出的文件中也不会带有客户资料。
+"""
+import collections
+import contextlib
+import datetime
+import json
+import platform
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# 每个统计项保留的最近耗时样本数
+SAMPLE_SIZE = 256
+
+# 每一类最多的统计项数，超出后新出现的项合并到 OTHER
+MAX_ITEMS = 300
+OTHER = "（其他）"
+
+# 主线程心跳间隔，以及心跳晚到多久算一次卡顿（毫秒）
+STALL_INTERVAL_MS = 100
+STALL_THRESHOLD_MS = 200
+
+# 保留的最近卡顿记录数
+RECENT_STALLS = 50
+
+# 统计项中 SQL 语句的最大长度
+SQL_TEXT_LENGTH = 200
+
+SQL = "SQL"
+TASK = "任务"
+REQUEST = "接口"
+PAGE = "页面"
+STALL = "卡顿"
+CATEGORIES = (SQL, TASK, REQUEST, PAGE, STALL)
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"\bX'[0-9A-Fa-f]*'|'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?(?!\w)")
+# 负数替换后是 -?，减号前面是名称或右括号时是减法，不在此列
+_NEGATIVE = re.compile(r"(?<![\w)?\s])-\?|(?<=[(,=<>]\s)-\?")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def normalize_sql(sql):
+    """把语句中的字面值换成 ?，IN (...) 中的多个值合并，同一形状的语句得到同一个文本"""
+    sql = _NEGATIVE.sub("?", _LITERALS.sub("?", _WHITESPACE.sub(" ", sql).strip()))
+    return _PLACEHOLDER_LIST.sub("?, ...", sql)[:SQL_TEXT_LENGTH]
+
+
+def _percentile(samples, fraction):
+    """已排序样本的百分位数，与 bench.summarize 的取法相同"""
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Series:
+    """一个统计项：最近的耗时样本，以及累计的次数、合计和最大值"""
+
+    __slots__ = ("samples", "count", "total", "max")
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3),
+            "p50_ms": round(_percentile(samples, 0.5), 3),
+            "p95_ms": round(_percentile(samples, 0.95), 3),
+            "p99_ms": round(_percentile(samples, 0.99), 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class PerfStats:
+    """按 (类别, 名称) 汇总的耗时，可以在任意线程中记录"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        # 为 False 时 SqlTracer 不再逐条记录语句，其他类别照常记录
+        self.trace_sql = True
+        self._items = {category: {} for category in CATEGORIES}
+        # [(发生时间, 卡顿毫秒, 当时的页面)]
+        self.stalls = collections.deque(maxlen=RECENT_STALLS)
+
+    def record(self, category, name, ms):
+        """记录一次耗时（毫秒）"""
+        with self._lock:
+            items = self._items[category]
+            series = items.get(name)
+            if series is None:
+                if len(items) >= MAX_ITEMS:
+                    name = OTHER
+                series = items.get(name)
+                if series is None:
+                    series = items[name] = Series()
+            series.add(ms)
+
+    def record_stall(self, ms, context):
+        """记录一次主线程卡顿，context 是当时所在的页面"""
+        self.record(STALL, context, ms)
+        with self._lock:
+            self.stalls.append((time.time(), ms, context))
+
+    @contextlib.contextmanager
+    def timer(self, category, name):
+        """with 块的耗时记为一次"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, (time.perf_counter() - started) * 1000)
+
+    def summary(self, category=None):
+        """[{category, name, count, total_ms, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}]，按合计从多到少"""
+        with self._lock:
+            rows = [dict(series.summary(), category=item_category, name=name)
+                    for item_category, items in self._items.items()
+                    if category is None or item_category == category
+                    for name, series in items.items()]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+
+    def recent_stalls(self):
+        """最近的卡顿 [(发生时间, 卡顿毫秒, 当时的页面)]，最近的在前"""
+        with self._lock:
+            return list(reversed(self.stalls))
+
+    def reset(self):
+        """清空全部统计"""
+        with self._lock:
+            self.started = time.time()
+            self._items = {category: {} for category in CATEGORIES}
+            self.stalls.clear()
+
+    def snapshot(self, **extra):
+        """可以直接转成 JSON 的全部统计，extra 中的键一并写入（例如运行模式）"""
+        def timestamp(seconds):
+            return datetime.datetime.fromtimestamp(seconds).isoformat(timespec="seconds")
+
+        return dict({
+            "created": timestamp(time.time()),
+            "since": timestamp(self.started),
+            "python": sys.version.split()[0],
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "sample_size": SAMPLE_SIZE,
+            "stall_threshold_ms": STALL_THRESHOLD_MS,
+            "items": self.summary(),
+            "stalls": [{"time": timestamp(when), "ms": round(ms, 1), "page": page}
+                       for when, ms, page in self.recent_stalls()],
+        }, **extra)
+
+    def export(self, path, **extra):
+        """把 snapshot() 写成 JSON 文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(**extra), f, ensure_ascii=False, indent=2)
+
+
+STATS = PerfStats()
+
+
+class SqlTracer:
+    """连接的 trace 回调，给同一连接上先后执行的语句计时
+
+    触发器和 FTS5 等虚拟表内部执行的语句以 "--" 开头，或者重复报告触发它们的语句，
+    都算在触发它们的语句里。
+    """
+
+    def __init__(self, stats=STATS):
+        self.stats = stats
+        self.sql = None
+        self.started = 0.0
+
+    def __call__(self, sql):
+        if sql == self.sql or sql.startswith("--"):
+            return
+        now = time.perf_counter()
+        self.finish(now)
+        self.sql = sql
+        self.started = now
+
+    def finish(self, now=None):
+        """结束正在计时的语句"""
+        if self.sql is not None:
+            now = time.perf_counter() if now is None else now
+            self.stats.record(SQL, normalize_sql(self.sql), (now - self.started) * 1000)
+            self.sql = None
+
+
+@contextlib.contextmanager
+def traced(conn, stats=STATS):
+    """在 with 块中给 conn 上执行的每条语句计时；没有 trace 回调的连接（例如 ApiClient）不计时"""
+    if not stats.trace_sql or not hasattr(conn, "set_trace_callback"):
+        yield
+        return
+    tracer = SqlTracer(stats)
+    conn.set_trace_callback(tracer)
+    try:
+        yield
+    finally:
+        conn.set_trace_callback(None)
+        tracer.finish()
+
+
+def task_name(func):
+    """后台任务的统计名称：模块.函数"""
+    module = getattr(func, "__module__", None) or ""
+    name = getattr(func, "__qualname__", None) or type(func).__name__
+    return f"{module}.{name}" if module else name
+
+
+class StallMonitor:
+    """Tk 主线程卡顿监视：每隔 interval 毫秒安排一次回调，实际执行比预定时间晚 threshold 以上记为一次卡顿
+
+    卡顿时主线程在执行别的回调（例如填充大表格），界面不响应；context() 返回当时所在的页面。
+    """
+
+    def __init__(self, root, context, stats=STATS, interval=STALL_INTERVAL_MS, threshold=STALL_THRESHOLD_MS):
+        self.root = root
+        self.context = context
+        self.stats = stats
+        self.interval = interval
+        self.threshold = threshold
+        self._after_id = None
+        self._expected = 0.0
+
+    def start(self):
+        if self._after_id is None:
+            self._schedule()
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval / 1000
+        self._after_id = self.root.after(self.interval, self._tick)
+
+    def _tick(self):
+        late = (time.perf_counter() - self._expected) * 1000
+        if late >= self.threshold:
+            self.stats.record_stall(late, self.context())
+        self._schedule()
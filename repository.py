@@ -0,0 +1,500 @@
+"""客户数据访问层：所有读写 customers 表的 SQL 都在这里，不依赖界面
+
+    repo = CustomerRepository(conn)
+    query = repo.query("煤业", "精煤")
+    total = repo.count(query)
+    first_page = repo.page(query, limit=100)
+
+    # 高级筛选和列排序
+    query = repo.compile(CustomerFilter(phone_prefix="138", sort="company_name", descending=False))
+
+SQL 文本都是固定的（只随用到的筛选条件、搜索词个数和排序列变化，值都是参数），
+sqlite3 按连接缓存编译后的语句（见 db_pool.STATEMENT_CACHE_SIZE），同一个连接上反复调用不会重新编译。
+写方法不提交事务，由调用方提交。
+
+构造时给出 on_change 时，单行和按 id 的批量增删改每修改一行调用一次 on_change(CustomerChange)，
+界面据此只更新变化的行；insert_many 用于批量导入，不报告逐行修改。
+"""
+import search
+from validation import validate_customer
+
+# customers 表的列，Customer 的字段与之一一对应
+FIELDS = ("id", "company_name", "contact_name", "phone", "customer_type", "notes", "registration_date")
+COLUMNS = ", ".join(FIELDS)
+
+# 可以批量修改的字段
+EDITABLE_FIELDS = ("company_name", "contact_name", "phone", "customer_type", "notes")
+
+# 键集分页允许的比较方式（按结果顺序："<=" 从锚点开始，"<" 锚点之后，">" 锚点之前）
+KEYSET_OPERATORS = ("<=", "<", ">")
+
+# 结果按升序排列时 SQL 中实际使用的比较
+_ASCENDING_OPERATORS = {"<=": ">=", "<": ">", ">": "<"}
+
+# 客户列表可以排序的列，都有索引；值相同的行再按 id 排序
+SORT_FIELDS = ("id", "company_name", "contact_name", "phone", "customer_type")
+
+# 追加备注时与原备注之间的分隔符
+NOTES_SEPARATOR = "；"
+
+# 一条 IN (...) 语句中最多放的 id 数，低于旧版 SQLite 999 个参数的上限
+ID_CHUNK_SIZE = 500
+
+SELECT_BY_ID = f"SELECT {COLUMNS} FROM customers WHERE id = ?"
+INSERT = """
+INSERT INTO customers (company_name, contact_name, phone, customer_type, notes, registration_date)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+UPDATE = """
+UPDATE customers
+SET company_name = ?, contact_name = ?, phone = ?, customer_type = ?, notes = ?
+WHERE id = ?
+"""
+DELETE = "DELETE FROM customers WHERE id = ?"
+RESTORE = """
+INSERT INTO customers (id, company_name, contact_name, phone, customer_type, notes, registration_date)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+UPDATE_NOTES = "UPDATE customers SET notes = ? WHERE id = ?"
+COUNTS_BY_TYPE = "SELECT customer_type, count FROM customer_stats"
+RECENT = f"SELECT {COLUMNS} FROM customers ORDER BY id DESC LIMIT ?"
+
+
+class CustomerError(ValueError):
+    """客户资料不合法，或要修改的客户已不存在"""
+
+
+class Customer:
+    """一个客户"""
+
+    __slots__ = FIELDS
+
+    def __init__(self, id: int, company_name: str, contact_name: str, phone: str,
+                 customer_type: str, notes: str = "", registration_date: str = ""):
+        self.id = id
+        self.company_name = company_name
+        self.contact_name = contact_name
+        self.phone = phone
+        self.customer_type = customer_type
+        self.notes = notes or ""
+        self.registration_date = registration_date
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 的 row_factory，查询的列必须是 COLUMNS"""
+        return cls(*row)
+
+    def astuple(self):
+        """按 FIELDS 顺序返回全部字段"""
+        return (self.id, self.company_name, self.contact_name, self.phone,
+                self.customer_type, self.notes, self.registration_date)
+
+    def list_values(self):
+        """客户列表表格中显示的列"""
+        return (self.id, self.company_name, self.contact_name, self.phone, self.customer_type, self.notes)
+
+    def search_values(self):
+        """参与搜索的列，与 search.FTS_COLUMNS 对应"""
+        return (self.company_name, self.contact_name, self.phone, self.notes)
+
+    def __eq__(self, other):
+        return isinstance(other, Customer) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return f"Customer(id={self.id!r}, company_name={self.company_name!r}, customer_type={self.customer_type!r})"
+
+
+# CustomerChange.kind 的取值
+INSERTED = "inserted"
+UPDATED = "updated"
+DELETED = "deleted"
+
+
+class CustomerChange:
+    """一行客户数据的修改；before / after 是修改前后的 Customer，新增时 before 为 None，删除时 after 为 None"""
+
+    __slots__ = ("kind", "id", "before", "after")
+
+    def __init__(self, kind, customer_id, before=None, after=None):
+        self.kind = kind
+        self.id = customer_id
+        self.before = before
+        self.after = after
+
+    def astuple(self):
+        """(类型, id, 修改前的字段, 修改后的字段)，字段按 FIELDS 顺序，可以直接转成 JSON"""
+        return (self.kind, self.id,
+                self.before.astuple() if self.before is not None else None,
+                self.after.astuple() if self.after is not None else None)
+
+    @classmethod
+    def fromtuple(cls, values):
+        kind, customer_id, before, after = values
+        return cls(kind, customer_id,
+                   Customer(*before) if before is not None else None,
+                   Customer(*after) if after is not None else None)
+
+    def __repr__(self):
+        return f"CustomerChange({self.kind!r}, {self.id!r})"
+
+
+class CustomerFilter:
+    """客户列表的筛选和排序：搜索框、客户类型、高级筛选和列标题排序
+
+    空字符串表示不限；日期是 YYYY-MM-DD 格式的字符串，起止日期都包含在内。
+    """
+
+    __slots__ = ("text", "customer_type", "date_from", "date_to", "phone_prefix", "notes", "sort", "descending")
+
+    def __init__(self, text="", customer_type="所有", date_from="", date_to="", phone_prefix="", notes="",
+                 sort="id", descending=True):
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"不支持的排序列: {sort}")
+        self.text = text or ""
+        self.customer_type = customer_type if customer_type and customer_type != "所有" else "所有"
+        self.date_from = date_from or ""
+        self.date_to = date_to or ""
+        self.phone_prefix = (phone_prefix or "").strip()
+        self.notes = notes or ""
+        self.sort = sort
+        self.descending = bool(descending)
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, CustomerFilter) and self.astuple() == other.astuple()
+
+    def __hash__(self):
+        return hash(self.astuple())
+
+    def __repr__(self):
+        return "CustomerFilter(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__) + ")"
+
+    def replace(self, **changes):
+        """返回修改了部分条件的副本"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return CustomerFilter(**values)
+
+    def params(self):
+        """转成 URL 查询参数（局域网服务器的 /customers 和 /customers/count）"""
+        return {"q": self.text, "type": self.customer_type, "from": self.date_from, "to": self.date_to,
+                "phone": self.phone_prefix, "notes": self.notes, "sort": self.sort,
+                "desc": "1" if self.descending else "0"}
+
+    @classmethod
+    def from_params(cls, get):
+        """从查询参数还原，get(名称, 默认值) 读取一个参数"""
+        return cls(get("q", ""), get("type", "所有"), get("from", ""), get("to", ""), get("phone", ""),
+                   get("notes", ""), get("sort", "id"), get("desc", "1") != "0")
+
+    def narrows(self, other):
+        """本条件的结果是否一定包含在 other 的结果中（不考虑排序），是则可以在内存中从 other 的结果过滤"""
+        return ((other.date_from, other.date_to, other.phone_prefix, other.notes)
+                == (self.date_from, self.date_to, self.phone_prefix, self.notes)
+                and other.customer_type in ("所有", self.customer_type)
+                and search.narrows(other.text, self.text))
+
+    def matches(self, customer, substring=True):
+        """在内存中判断客户是否满足条件
+
+        搜索词按子串判断，与 trigram/LIKE 一致；substring 为 False（unicode61 按词前缀匹配）
+        且有搜索词或备注关键词时无法判断，返回 None。
+        """
+        if self.customer_type != "所有" and customer.customer_type != self.customer_type:
+            return False
+        if self.date_from and customer.registration_date < self.date_from:
+            return False
+        if self.date_to and customer.registration_date > self.date_to:
+            return False
+        if self.phone_prefix and not customer.phone.startswith(self.phone_prefix):
+            return False
+        if (self.text or self.notes) and not substring:
+            return None
+        return (search.row_matches(customer.search_values(), self.text)
+                and search.row_matches([customer.notes], self.notes))
+
+
+class CustomerQuery:
+    """编译好的筛选条件：WHERE 子句的各个条件及其参数，以及排序列和方向"""
+
+    __slots__ = ("conditions", "params", "sort", "descending")
+
+    def __init__(self, conditions=(), params=(), sort="id", descending=True):
+        self.conditions = list(conditions)
+        self.params = list(params)
+        self.sort = sort
+        self.descending = descending
+
+    def where(self, *extra):
+        conditions = self.conditions + [condition for condition in extra if condition]
+        return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    def order_by(self, reverse=False):
+        """ORDER BY 子句；reverse 为 True 时按结果的反方向"""
+        direction = "DESC" if self.descending != reverse else "ASC"
+        if self.sort == "id":
+            return f" ORDER BY id {direction}"
+        return f" ORDER BY {self.sort} {direction}, id {direction}"
+
+    def key(self, customer):
+        """客户在结果中的排序键：按 id 排序时是 id，否则是 (排序列的值, id)"""
+        if self.sort == "id":
+            return customer.id
+        return (getattr(customer, self.sort), customer.id)
+
+    def keyset(self, op, anchor):
+        """键集分页的条件和参数：op 按结果顺序比较排序键与 anchor（见 KEYSET_OPERATORS）"""
+        if op not in KEYSET_OPERATORS:
+            raise ValueError(f"不支持的比较方式: {op}")
+        sql_op = op if self.descending else _ASCENDING_OPERATORS[op]
+        if self.sort == "id":
+            return f"id {sql_op} ?", [anchor]
+        # 行值比较 (列, id) < (?, ?) 可以直接利用该列上的索引（索引隐含 rowid）
+        value, customer_id = anchor
+        return f"({self.sort}, id) {sql_op} (?, ?)", [value, customer_id]
+
+
+ALL = CustomerQuery()
+
+
+class CustomerRepository:
+    """在一个连接上读写客户"""
+
+    def __init__(self, conn, on_change=None):
+        self.conn = conn
+        self.on_change = on_change
+
+    def _select(self, sql, params=()):
+        cursor = self.conn.cursor()
+        cursor.row_factory = Customer.from_row
+        return cursor.execute(sql, params)
+
+    # ---- 查询 ----
+
+    def query(self, search_text="", customer_type="所有"):
+        """把搜索框和客户类型编译成筛选条件"""
+        return self.compile(CustomerFilter(search_text, customer_type))
+
+    def compile(self, customer_filter):
+        """把 CustomerFilter 编译成参数化的筛选条件，每个条件都能走索引"""
+        conditions = []
+        params = []
+        if customer_filter.text:
+            # 公司名称、联系人、电话和备注走 FTS5 索引
+            conditions, params = search.build_conditions(self.conn, customer_filter.text)
+        if customer_filter.notes:
+            # 备注关键词用 FTS5 的列过滤，只在备注中查找
+            notes_conditions, notes_params = search.build_conditions(self.conn, customer_filter.notes, ("notes",))
+            conditions += notes_conditions
+            params += notes_params
+        if customer_filter.customer_type != "所有":
+            conditions.append("customer_type = ?")
+            params.append(customer_filter.customer_type)
+        if customer_filter.date_from:
+            conditions.append("registration_date >= ?")
+            params.append(customer_filter.date_from)
+        if customer_filter.date_to:
+            conditions.append("registration_date <= ?")
+            params.append(customer_filter.date_to)
+        if customer_filter.phone_prefix:
+            # 前缀写成范围条件才能用上 idx_customers_phone（LIKE 'x%' 受大小写规则影响用不上索引）
+            prefix = customer_filter.phone_prefix
+            conditions.append("phone >= ? AND phone < ?")
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        return CustomerQuery(conditions, params, customer_filter.sort, customer_filter.descending)
+
+    def count(self, query=ALL):
+        return self.conn.execute("SELECT COUNT(*) FROM customers" + query.where(), query.params).fetchone()[0]
+
+    def page(self, query=ALL, op=None, anchor=None, order="DESC", limit=100, offset=0):
+        """按结果顺序读取一页
+
+        op 为 "<="、"<" 或 ">" 时只读取从 anchor 开始、anchor 之后或之前的行，anchor 是 query.key()
+        返回的排序键；order 为 "ASC" 时按结果的反方向读取（向前翻页）。默认按 id 倒序时即比较 id。
+        """
+        if order not in ("ASC", "DESC"):
+            raise ValueError(f"不支持的排序方式: {order}")
+        extra, anchor_params = query.keyset(op, anchor) if op else (None, [])
+        params = query.params + anchor_params + [limit, offset]
+        sql = f"SELECT {COLUMNS} FROM customers{query.where(extra)}{query.order_by(order == 'ASC')} LIMIT ? OFFSET ?"
+        return self._select(sql, params).fetchall()
+
+    def key_at(self, query, offset):
+        """结果集中第 offset 行的排序键，超出范围时返回 None"""
+        columns = "id" if query.sort == "id" else f"{query.sort}, id"
+        row = self.conn.execute(f"SELECT {columns} FROM customers{query.where()}{query.order_by()} LIMIT 1 OFFSET ?",
+                                query.params + [offset]).fetchone()
+        if row is None:
+            return None
+        return row[0] if query.sort == "id" else tuple(row)
+
+    def iter_rows(self, query=ALL, chunk_size=5000):
+        """按结果顺序逐块产出 FIELDS 顺序的元组，不创建 Customer 对象，供导出等大批量场景使用"""
+        cursor = self.conn.execute(f"SELECT {COLUMNS} FROM customers{query.where()}{query.order_by()}",
+                                   query.params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    def ids(self, query=ALL):
+        """结果集中全部客户的 id，按结果顺序（界面“全选”用）"""
+        return [row[0] for row in self.conn.execute(f"SELECT id FROM customers{query.where()}{query.order_by()}",
+                                                    query.params)]
+
+    def search(self, text, customer_type=None, limit=50):
+        """按相关度返回最匹配的客户"""
+        rows = search.search(self.conn, text, customer_type, limit, columns=COLUMNS)
+        return [Customer(*row) for row in rows]
+
+    def get(self, customer_id):
+        """按 id 读取客户，不存在时返回 None"""
+        return self._select(SELECT_BY_ID, (customer_id,)).fetchone()
+
+    def get_many(self, ids):
+        """按 id 批量读取，返回 {id: Customer}"""
+        result = {}
+        for chunk in _chunks(list(ids)):
+            placeholders = ", ".join("?" * len(chunk))
+            for customer in self._select(f"SELECT {COLUMNS} FROM customers WHERE id IN ({placeholders})", chunk):
+                result[customer.id] = customer
+        return result
+
+    def counts_by_type(self):
+        """各类型客户数，来自触发器维护的计数表"""
+        return dict(self.conn.execute(COUNTS_BY_TYPE))
+
+    def recent(self, limit=5):
+        """最近添加的客户"""
+        return self._select(RECENT, (limit,)).fetchall()
+
+    # ---- 修改（由调用方提交） ----
+
+    def add(self, data, registration_date):
+        """校验并添加客户，返回新客户的 id"""
+        error = validate_customer(data)
+        if error:
+            raise CustomerError(error)
+        values = (data["company_name"], data["contact_name"], data["phone"],
+                  data["customer_type"], data.get("notes", ""), registration_date)
+        customer_id = self.conn.execute(INSERT, values).lastrowid
+        if self.on_change is not None:
+            self.on_change(CustomerChange(INSERTED, customer_id, after=Customer(customer_id, *values)))
+        return customer_id
+
+    def update(self, customer_id, data):
+        """校验并修改客户资料（登记日期不变）"""
+        error = validate_customer(data)
+        if error:
+            raise CustomerError(error)
+        before = self.get(customer_id) if self.on_change is not None else None
+        cursor = self.conn.execute(UPDATE, (data["company_name"], data["contact_name"], data["phone"],
+                                            data["customer_type"], data.get("notes", ""), customer_id))
+        if cursor.rowcount == 0:
+            raise CustomerError("该客户已不存在")
+        if self.on_change is not None:
+            after = Customer(before.id, data["company_name"], data["contact_name"], data["phone"],
+                             data["customer_type"], data.get("notes", ""), before.registration_date)
+            self.on_change(CustomerChange(UPDATED, before.id, before, after))
+
+    def delete(self, customer_id):
+        """删除客户，返回是否真的删除了一行"""
+        before = self.get(customer_id) if self.on_change is not None else None
+        deleted = self.conn.execute(DELETE, (customer_id,)).rowcount > 0
+        if deleted and self.on_change is not None:
+            self.on_change(CustomerChange(DELETED, before.id, before))
+        return deleted
+
+    def insert_many(self, rows):
+        """批量插入已校验的行 (公司名称, 客户名称, 联系电话, 客户类型, 备注, 登记日期)，返回插入的行数
+
+        不报告逐行修改，调用方在提交后整体刷新。
+        """
+        cursor = self.conn.executemany(INSERT, rows)
+        return cursor.rowcount
+
+    def update_many(self, ids, changes):
+        """把 ids 中的客户的若干字段改成相同的值，返回修改的行数"""
+        unknown = set(changes) - set(EDITABLE_FIELDS)
+        if unknown:
+            raise ValueError("不能批量修改的字段: " + "、".join(sorted(unknown)))
+        if not changes:
+            return 0
+        assignments = ", ".join(f"{field} = ?" for field in changes)
+        updated = 0
+        for chunk in _chunks(list(ids)):
+            before = self.get_many(chunk) if self.on_change is not None else None
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = self.conn.execute(f"UPDATE customers SET {assignments} WHERE id IN ({placeholders})",
+                                       list(changes.values()) + chunk)
+            updated += cursor.rowcount
+            if before:
+                for customer in before.values():
+                    after = Customer(*customer.astuple())
+                    for field, value in changes.items():
+                        setattr(after, field, value)
+                    self.on_change(CustomerChange(UPDATED, customer.id, customer, after))
+        return updated
+
+    def delete_many(self, ids):
+        """批量删除，返回删除的行数"""
+        deleted = 0
+        for chunk in _chunks(list(ids)):
+            before = self.get_many(chunk) if self.on_change is not None else None
+            placeholders = ", ".join("?" * len(chunk))
+            deleted += self.conn.execute(f"DELETE FROM customers WHERE id IN ({placeholders})", chunk).rowcount
+            if before:
+                for customer in before.values():
+                    self.on_change(CustomerChange(DELETED, customer.id, customer))
+        return deleted
+
+    def append_notes(self, ids, text, separator=NOTES_SEPARATOR):
+        """在客户备注末尾追加 text（原备注非空时用 separator 隔开），返回修改的行数"""
+        updated = 0
+        for chunk in _chunks(list(ids)):
+            before = self.get_many(chunk)
+            after = {}
+            for customer in before.values():
+                after[customer.id] = Customer(*customer.astuple())
+                after[customer.id].notes = customer.notes + separator + text if customer.notes else text
+            self.conn.executemany(UPDATE_NOTES, [(customer.notes, customer.id) for customer in after.values()])
+            updated += len(after)
+            if self.on_change is not None:
+                for customer in before.values():
+                    self.on_change(CustomerChange(UPDATED, customer.id, customer, after[customer.id]))
+        return updated
+
+    def restore(self, customers):
+        """把客户恢复成给定的内容（撤销批量修改和删除）：仍存在的按 id 改回，已删除的按原 id 重新插入
+
+        返回恢复的行数。
+        """
+        customers = list(customers)
+        restored = 0
+        for start in range(0, len(customers), ID_CHUNK_SIZE):
+            chunk = customers[start:start + ID_CHUNK_SIZE]
+            existing = self.get_many(customer.id for customer in chunk)
+            updates = [customer for customer in chunk if customer.id in existing]
+            inserts = [customer for customer in chunk if customer.id not in existing]
+            self.conn.executemany(UPDATE, [(customer.company_name, customer.contact_name, customer.phone,
+                                            customer.customer_type, customer.notes, customer.id)
+                                           for customer in updates])
+            self.conn.executemany(RESTORE, [customer.astuple() for customer in inserts])
+            restored += len(chunk)
+            if self.on_change is not None:
+                for customer in updates:
+                    self.on_change(CustomerChange(UPDATED, customer.id, existing[customer.id], customer))
+                for customer in inserts:
+                    self.on_change(CustomerChange(INSERTED, customer.id, after=customer))
+        return restored
+
+
+def _chunks(ids, size=ID_CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
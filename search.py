@@ -0,0 +1,189 @@
+"""客户全文检索（SQLite FTS5）"""
+import sqlite3
+
+# 参与检索的列及其在排序中的权重
+FTS_COLUMNS = ("company_name", "contact_name", "phone", "notes")
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# trigram 分词器至少需要 3 个字符才能走索引
+TRIGRAM_MIN_LENGTH = 3
+
+
+def install(conn):
+    """创建 FTS5 索引表及同步触发器，并为已有客户重建索引（由调用方提交事务）"""
+    if fts_tokenizer(conn) is not None:
+        return
+
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{col}" for col in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{col}" for col in FTS_COLUMNS)
+
+    try:
+        # trigram 按三字组切分，适合不以空格分词的中文公司名（需要 SQLite 3.34+）
+        conn.execute(f"""
+        CREATE VIRTUAL TABLE customers_fts USING fts5(
+            {columns}, content='customers', content_rowid='id', tokenize='trigram'
+        )""")
+    except sqlite3.OperationalError:
+        try:
+            conn.execute(f"""
+            CREATE VIRTUAL TABLE customers_fts USING fts5(
+                {columns}, content='customers', content_rowid='id', prefix='2 3'
+            )""")
+        except sqlite3.OperationalError:
+            # 当前 SQLite 未编译 FTS5，退回 LIKE 查询；换用支持 FTS5 的 SQLite 后由 migrations.ensure_fts_index 补建
+            return
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customers_fts(rowid, {columns}) VALUES (new.id, {new_values});
+    END""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+        INSERT INTO customers_fts(customers_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+    END""")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE ON customers BEGIN
+        INSERT INTO customers_fts(customers_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        INSERT INTO customers_fts(rowid, {columns}) VALUES (new.id, {new_values});
+    END""")
+
+    # 为已有客户建立索引
+    conn.execute("INSERT INTO customers_fts(customers_fts) VALUES ('rebuild')")
+
+
+def pause_sync(conn):
+    """批量插入前暂停逐行同步索引，返回恢复所需的状态
+
+    必须与之后的 resume_sync 处于同一个事务中，回滚时触发器会一起恢复。
+    """
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'customers_fts_ai'"
+    ).fetchone()
+    if row is None:
+        return None
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM customers").fetchone()[0]
+    conn.execute("DROP TRIGGER customers_fts_ai")
+    return row[0], max_id
+
+
+def resume_sync(conn, state):
+    """把暂停期间新插入的客户一次性写入索引，并恢复插入触发器"""
+    if state is None:
+        return
+    trigger_sql, max_id = state
+    columns = ", ".join(FTS_COLUMNS)
+    conn.execute(f"""
+    INSERT INTO customers_fts(rowid, {columns})
+    SELECT id, {columns} FROM customers WHERE id > ?
+    """, (max_id,))
+    conn.execute(trigger_sql)
+
+
+def fts_tokenizer(conn):
+    """返回索引表使用的分词器（trigram/unicode61），没有索引表时返回 None"""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'customers_fts'"
+    ).fetchone()
+    if row is None:
+        return None
+    return "trigram" if "trigram" in row[0] else "unicode61"
+
+
+def fts5_available(conn):
+    """当前 SQLite 是否编译了 FTS5（在 temp 库中试建一张表，不修改数据库文件）"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+
+def split_terms(text):
+    """按空白拆分搜索词，多个词之间是“并且”关系"""
+    return [term for term in text.strip().lower().split() if term]
+
+
+def narrows(old_text, new_text):
+    """新的搜索词是否只会缩小旧的结果（每个旧词都包含在某个新词中）"""
+    new_terms = split_terms(new_text)
+    return all(any(old in new for new in new_terms) for old in split_terms(old_text))
+
+
+def row_matches(values, text):
+    """在内存中按子串判断一行是否匹配搜索文本，与 trigram/LIKE 的结果一致"""
+    values = [(value or "").lower() for value in values]
+    return all(any(term in value for value in values) for term in split_terms(text))
+
+
+def compile_query(conn, text, columns=FTS_COLUMNS):
+    """把搜索文本拆成 FTS5 MATCH 表达式和无法走索引的 LIKE 条件
+
+    columns 是 FTS_COLUMNS 的一部分时只在这些列中查找。
+    返回 (match, conditions, params)，match 为 None 表示没有可索引的词。
+    """
+    tokenizer = fts_tokenizer(conn)
+    # FTS5 的列过滤语法：{列1 列2} : "词"
+    column_filter = "" if tuple(columns) == FTS_COLUMNS else "{" + " ".join(columns) + "} : "
+    match_terms = []
+    conditions = []
+    params = []
+
+    for term in split_terms(text):
+        if tokenizer == "trigram" and len(term) >= TRIGRAM_MIN_LENGTH:
+            # trigram 本身就是子串匹配，自然包含前缀匹配
+            match_terms.append(column_filter + _quote(term))
+        elif tokenizer == "unicode61":
+            match_terms.append(column_filter + _quote(term) + "*")
+        else:
+            like = "(" + " OR ".join(f"LOWER({col}) LIKE ?" for col in columns) + ")"
+            conditions.append(like)
+            params.extend([f"%{term}%"] * len(columns))
+
+    match = " AND ".join(match_terms) if match_terms else None
+    return match, conditions, params
+
+
+def build_conditions(conn, text, columns=FTS_COLUMNS):
+    """把搜索文本编译成 customers 表上的 WHERE 条件和参数"""
+    match, conditions, params = compile_query(conn, text, columns)
+    if match is not None:
+        conditions.insert(0, "id IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?)")
+        params.insert(0, match)
+    return conditions, params
+
+
+def search(conn, text, customer_type=None, limit=50,
+           columns="id, company_name, contact_name, phone, customer_type, notes"):
+    """按相关度返回最匹配的客户
+
+    公司名称权重最高，其次是联系人、电话和备注；没有可索引的词时按 id 倒序。
+    """
+    match, conditions, params = compile_query(conn, text)
+    if customer_type:
+        conditions.append("customer_type = ?")
+        params.append(customer_type)
+
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    if match is None:
+        query = f"SELECT {columns} FROM customers{where} ORDER BY id DESC LIMIT ?"
+        return conn.execute(query, params + [limit]).fetchall()
+
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    query = f"""
+    SELECT {columns} FROM customers
+    JOIN (
+        SELECT rowid AS fts_id, bm25(customers_fts, {weights}) AS score
+        FROM customers_fts WHERE customers_fts MATCH ?
+    ) ON fts_id = id{where}
+    ORDER BY score, id DESC
+    LIMIT ?
+    """
+    return conn.execute(query, [match] + params + [limit]).fetchall()
+
+
+def _quote(term):
+    """把搜索词转成 FTS5 字符串，避免用户输入被当成查询语法"""
+    return '"' + term.replace('"', '""') + '"'
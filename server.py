@@ -0,0 +1,609 @@
+"""局域网服务器：一台电脑打开客户数据库，其他电脑上的界面通过 HTTP/JSON 访问
+
+    python server.py [--host 0.0.0.0] [--port 8765] [--db data/customer_data.db]
+    python main.py --server http://服务器地址:8765
+
+默认只监听本机（127.0.0.1）；传输是明文 HTTP，登录令牌在服务器重启或修改密码前一直有效，
+只有在可信的局域网中才用 --host 0.0.0.0 让其他电脑访问。
+
+只用标准库 asyncio 实现够用的 HTTP/1.1（支持 keep-alive）。读请求在只读连接池上并发执行；
+写请求排队后由唯一的写线程执行，上一批执行期间到达的写请求合并在同一个事务中一次提交。
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import re
+import secrets
+import urllib.parse
+
+import accounts
+import analytics
+import backup
+import customers
+import db_pool
+import dedup
+import history
+import migrations
+from repository import FIELDS, KEYSET_OPERATORS, Customer, CustomerFilter, CustomerRepository
+import stats
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 并发执行读请求的只读连接数
+SERVER_READERS = 4
+
+# 一个事务中最多合并的写请求数
+WRITE_BATCH_SIZE = 256
+
+# 请求体大小上限（字节）
+MAX_BODY_SIZE = 1024 * 1024
+
+# 一次列表请求最多返回的行数
+MAX_PAGE_ROWS = 5000
+
+# 检查自动备份的间隔（秒）
+AUTO_BACKUP_CHECK_SECONDS = 60 * 60
+
+# 查重分桶键补算完后，隔多久再检查一次新增和改名的客户（秒）
+DEDUP_REFRESH_SECONDS = 60
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    """以指定状态码返回给客户端的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """解析后的请求"""
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.token = None
+        self.user = None
+
+    def json(self):
+        """请求体中的 JSON 对象"""
+        try:
+            data = json.loads(self.body.decode("utf-8")) if self.body else {}
+        except ValueError:
+            raise HttpError(400, "请求体不是有效的 JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "请求体必须是 JSON 对象")
+        return data
+
+    def arg(self, name, default=None, convert=str):
+        """查询参数"""
+        if name not in self.query:
+            return default
+        try:
+            return convert(self.query[name])
+        except ValueError:
+            raise HttpError(400, f"参数 {name} 无效")
+
+
+class WriteBatcher:
+    """写请求队列：写线程每次取出队列中的全部请求，在一个事务中执行并提交
+
+    每个请求在单独的保存点中执行，一个请求失败只回滚它自己。写线程空闲时请求立即执行，
+    繁忙时排队的请求自然合并成一批，提交（及 WAL 同步）的次数远少于请求数。
+    """
+
+    def __init__(self, pool, executor, on_commit=None, batch_size=WRITE_BATCH_SIZE):
+        self.pool = pool
+        self.executor = executor
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.batches = 0
+        self.requests = 0
+        self._queue = asyncio.Queue()
+
+    async def submit(self, func, *args):
+        """排队执行 func(conn, *args)，返回其结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((func, args, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self._execute, [(func, args) for func, args, _ in batch])
+            except Exception as e:
+                # 提交失败时整批都没有生效
+                results = [(False, e)] * len(batch)
+            else:
+                self.batches += 1
+                self.requests += len(batch)
+                if self.on_commit is not None:
+                    self.on_commit()
+
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _execute(self, batch):
+        results = []
+        with self.pool.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for func, args in batch:
+                    conn.execute("SAVEPOINT request")
+                    try:
+                        results.append((True, func(conn, *args)))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO request")
+                        results.append((False, e))
+                    conn.execute("RELEASE request")
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+        return results
+
+
+def fetch_page(conn, customer_filter, op, anchor, order, limit, offset):
+    """按筛选条件做一次键集分页读取"""
+    repo = CustomerRepository(conn)
+    return repo.page(repo.compile(customer_filter), op, anchor, order, limit, offset)
+
+
+def parse_anchor(text, sort):
+    """解析 JSON 格式的排序键：按 id 排序时是整数，否则是 [值, id]"""
+    try:
+        anchor = json.loads(text)
+    except ValueError:
+        raise HttpError(400, "参数 anchor 无效")
+    if sort == "id":
+        valid = isinstance(anchor, int)
+    else:
+        valid = isinstance(anchor, list) and len(anchor) == 2 and isinstance(anchor[1], int)
+    if not valid:
+        raise HttpError(400, "参数 anchor 无效")
+    return anchor if sort == "id" else tuple(anchor)
+
+
+def rows_json(customers):
+    """Customer 列表转成 JSON 数组，每个客户是按 repository.FIELDS 顺序排列的数组"""
+    return [customer.astuple() for customer in customers]
+
+
+def changes_json(changes):
+    """CustomerChange 列表转成 JSON 数组"""
+    return [change.astuple() for change in changes]
+
+
+class CustomerServer:
+    """客户数据 HTTP/JSON 服务"""
+
+    def __init__(self, db_path, readers=SERVER_READERS):
+        self.db_path = db_path
+        # 备份放在数据库所在目录下的 backups 中，与单机版相同
+        self.backup_dir = os.path.join(os.path.dirname(db_path), "backups")
+        self.pool = db_pool.ConnectionPool(db_path, readers)
+        self.read_executor = concurrent.futures.ThreadPoolExecutor(readers, thread_name_prefix="api-reader")
+        self.write_executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="api-writer")
+        self.dashboard_stats = stats.DashboardStats()
+        self.writes = None
+        # 登录令牌 -> 用户名
+        self.sessions = {}
+        self.routes = [
+            ("POST", re.compile(r"^/api/login$"), self.login, False),
+            ("POST", re.compile(r"^/api/password$"), self.change_password, True),
+            ("GET", re.compile(r"^/api/stats$"), self.get_stats, True),
+            ("GET", re.compile(r"^/api/analytics$"), self.get_analytics, True),
+            ("GET", re.compile(r"^/api/customers/count$"), self.count_customers, True),
+            ("GET", re.compile(r"^/api/customers/ids$"), self.list_customer_ids, True),
+            ("GET", re.compile(r"^/api/customers/duplicates$"), self.find_duplicates, True),
+            ("GET", re.compile(r"^/api/duplicates$"), self.duplicate_report, True),
+            ("GET", re.compile(r"^/api/history/changes$"), self.history_changes, True),
+            ("GET", re.compile(r"^/api/history/deleted$"), self.deleted_customers, True),
+            ("POST", re.compile(r"^/api/history/undelete$"), self.undelete_customers, True),
+            ("POST", re.compile(r"^/api/history/revert$"), self.revert_customers, True),
+            ("POST", re.compile(r"^/api/customers/batch$"), self.batch_customers, True),
+            ("POST", re.compile(r"^/api/customers/restore$"), self.restore_customers, True),
+            ("GET", re.compile(r"^/api/customers/search$"), self.search_customers, True),
+            ("GET", re.compile(r"^/api/customers$"), self.list_customers, True),
+            ("POST", re.compile(r"^/api/customers$"), self.create_customer, True),
+            ("GET", re.compile(r"^/api/customers/(\d+)$"), self.get_customer, True),
+            ("GET", re.compile(r"^/api/customers/(\d+)/history$"), self.customer_timeline, True),
+            ("PUT", re.compile(r"^/api/customers/(\d+)$"), self.update_customer, True),
+            ("DELETE", re.compile(r"^/api/customers/(\d+)$"), self.delete_customer, True),
+        ]
+
+    async def read(self, func, *args):
+        """在只读连接上执行 func(conn, *args)"""
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, self._read, func, args)
+
+    def _read(self, func, args):
+        with self.pool.reader() as conn:
+            return func(conn, *args)
+
+    async def run_writer(self, func, *args):
+        """在写线程上单独执行 func(conn, *args) 并提交，不与其他写请求合并"""
+        return await asyncio.get_running_loop().run_in_executor(self.write_executor, self._write, func, args)
+
+    def _write(self, func, args):
+        with self.pool.writer() as conn:
+            try:
+                result = func(conn, *args)
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+        return result
+
+    # ---- 接口 ----
+
+    async def login(self, request):
+        data = request.json()
+        username = str(data.get("username", ""))
+        password = str(data.get("password", ""))
+        # 派生密钥较慢，在只读连接上并发校验；旧格式的哈希再交给写线程升级
+        hashed_password = await self.read(accounts.verify_login, username, password)
+        if hashed_password is None:
+            raise HttpError(401, "用户名或密码错误")
+        if accounts.needs_rehash(hashed_password):
+            new_hash = await asyncio.get_running_loop().run_in_executor(
+                self.read_executor, accounts.hash_password, password)
+            await self.writes.submit(accounts.replace_hash, username, hashed_password, new_hash)
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = username
+        return {"token": token}
+
+    async def change_password(self, request):
+        password = str(request.json().get("password", ""))
+        if not password:
+            raise HttpError(400, "新密码不能为空")
+        # 新哈希先在读线程池中算好，写线程只执行 UPDATE
+        new_hash = await asyncio.get_running_loop().run_in_executor(
+            self.read_executor, accounts.hash_password, password)
+        await self.writes.submit(accounts.store_hash, request.user, new_hash)
+        # 该用户在其他电脑上的登录全部失效
+        for token, user in list(self.sessions.items()):
+            if user == request.user and token != request.token:
+                del self.sessions[token]
+        return {}
+
+    async def get_stats(self, request):
+        data = self.dashboard_stats.cached
+        if data is None:
+            data = await self.read(self.dashboard_stats.get)
+        return dict(data, recent=rows_json(data["recent"]))
+
+    async def get_analytics(self, request):
+        # 备注统计可能要重新计算，单独在写线程中执行，不拖慢合并提交的写请求
+        return await self.run_writer(analytics.report)
+
+    def customer_filter(self, request):
+        try:
+            return CustomerFilter.from_params(request.arg)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+
+    async def count_customers(self, request):
+        pager = await self.read(customers.query_customers, self.customer_filter(request))
+        return {
+            "total": pager.total,
+            "rows": rows_json(pager.buffer[1]) if pager.complete else None,
+            "reusable": pager.reusable,
+        }
+
+    async def list_customer_ids(self, request):
+        return {"ids": await self.read(customers.customer_ids, self.customer_filter(request))}
+
+    async def find_duplicates(self, request):
+        data = {field: request.arg(field, "") for field in ("company_name", "contact_name", "phone")}
+        results = await self.read(dedup.find_duplicates, data, request.arg("exclude", None, int))
+        return {"duplicates": [[customer.astuple(), score, reasons] for customer, score, reasons in results]}
+
+    async def duplicate_report(self, request):
+        # 要先补算分桶键，单独在写线程中执行
+        groups = await self.run_writer(dedup.duplicate_report)
+        return {"groups": [rows_json(group) for group in groups]}
+
+    def history_as_of(self, value):
+        if not isinstance(value, str):
+            raise HttpError(400, "参数 as_of 无效")
+        try:
+            return history.parse_as_of(value)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+
+    async def history_changes(self, request):
+        pairs = await self.read(history.changed_since, self.history_as_of(request.arg("as_of", "")))
+        return {"changes": [[then and then.astuple(), now and now.astuple()] for then, now in pairs]}
+
+    async def deleted_customers(self, request):
+        deleted = await self.read(history.deleted_customers)
+        return {"deleted": [[changed_at, customer.astuple()] for changed_at, customer in deleted]}
+
+    async def customer_timeline(self, request, customer_id):
+        entries = await self.read(history.timeline, int(customer_id))
+        return {"entries": [[changed_at, action, fields] for changed_at, action, fields in entries]}
+
+    async def search_customers(self, request):
+        limit = request.arg("limit", 50, int)
+        if not 0 <= limit <= MAX_PAGE_ROWS:
+            raise HttpError(400, f"每次最多读取 {MAX_PAGE_ROWS} 行")
+        customer_type = request.arg("type")
+        rows = await self.read(customers.search_customers, request.arg("q", ""),
+                               None if customer_type == "所有" else customer_type, limit)
+        return {"rows": rows_json(rows)}
+
+    async def list_customers(self, request):
+        op = request.arg("op")
+        if op is not None and op not in KEYSET_OPERATORS:
+            raise HttpError(400, "参数 op 无效")
+        order = request.arg("order", "DESC").upper()
+        if order not in ("ASC", "DESC"):
+            raise HttpError(400, "参数 order 无效")
+        limit = request.arg("limit", customers.PAGE_SIZE, int)
+        if not 0 <= limit <= MAX_PAGE_ROWS:
+            raise HttpError(400, f"每次最多读取 {MAX_PAGE_ROWS} 行")
+        customer_filter = self.customer_filter(request)
+        anchor = request.arg("anchor")
+        if op is not None:
+            if anchor is None:
+                raise HttpError(400, "缺少参数 anchor")
+            anchor = parse_anchor(anchor, customer_filter.sort)
+        rows = await self.read(fetch_page, customer_filter, op, anchor, order, limit, request.arg("offset", 0, int))
+        return {"rows": rows_json(rows)}
+
+    async def get_customer(self, request, customer_id):
+        customer = await self.read(customers.get_customer, int(customer_id))
+        if customer is None:
+            raise HttpError(404, "该客户已不存在")
+        return {"customer": customer.astuple()}
+
+    # 写接口同时返回逐行修改，客户端据此只更新变化的行
+
+    async def create_customer(self, request):
+        changes = []
+        customer_id = await self.writes.submit(customers.add_customer, request.json(), None, changes.append)
+        return {"id": customer_id, "changes": changes_json(changes)}
+
+    async def update_customer(self, request, customer_id):
+        changes = []
+        await self.writes.submit(customers.update_customer, int(customer_id), request.json(), changes.append)
+        return {"changes": changes_json(changes)}
+
+    async def delete_customer(self, request, customer_id):
+        changes = []
+        deleted = await self.writes.submit(customers.delete_customer, int(customer_id), changes.append)
+        return {"deleted": deleted, "changes": changes_json(changes)}
+
+    async def batch_customers(self, request):
+        """批量删除、修改类型或追加备注：{"action": "delete" | "type" | "notes", "ids": [...], "value": ...}"""
+        data = request.json()
+        ids = data.get("ids")
+        if not isinstance(ids, list) or not all(type(customer_id) is int for customer_id in ids):
+            raise HttpError(400, "参数 ids 无效")
+        action = data.get("action")
+        if action == "delete":
+            func, args = customers.delete_customers, (ids,)
+        elif action == "type":
+            func, args = customers.set_customers_type, (ids, str(data.get("value", "")))
+        elif action == "notes":
+            func, args = customers.append_customers_notes, (ids, str(data.get("value", "")))
+        else:
+            raise HttpError(400, "参数 action 无效")
+        changes = []
+        before = await self.writes.submit(func, *args, changes.append)
+        return {"count": len(before), "changes": changes_json(changes)}
+
+    async def restore_customers(self, request):
+        rows = request.json().get("customers")
+        if not isinstance(rows, list) or not all(isinstance(row, list) and len(row) == len(FIELDS) for row in rows):
+            raise HttpError(400, "参数 customers 无效")
+        changes = []
+        restored = await self.writes.submit(customers.restore_customers, [Customer(*row) for row in rows],
+                                            changes.append)
+        return {"count": restored, "changes": changes_json(changes)}
+
+    def history_ids(self, data):
+        ids = data.get("ids")
+        if not isinstance(ids, list) or not all(type(customer_id) is int for customer_id in ids):
+            raise HttpError(400, "参数 ids 无效")
+        return ids
+
+    async def undelete_customers(self, request):
+        ids = self.history_ids(request.json())
+        changes = []
+        restored = await self.writes.submit(history.undelete, ids, changes.append)
+        return {"count": restored, "changes": changes_json(changes)}
+
+    async def revert_customers(self, request):
+        data = request.json()
+        ids, as_of = self.history_ids(data), self.history_as_of(data.get("as_of"))
+        changes = []
+        reverted = await self.writes.submit(history.revert, ids, as_of, changes.append)
+        return {"count": reverted, "changes": changes_json(changes)}
+
+    # ---- HTTP ----
+
+    async def dispatch(self, request):
+        allowed = False
+        for method, pattern, handler, needs_login in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            if needs_login:
+                auth = request.headers.get("authorization", "")
+                request.token = auth[len("Bearer "):] if auth.startswith("Bearer ") else None
+                request.user = self.sessions.get(request.token)
+                if request.user is None:
+                    raise HttpError(401, "请先登录")
+            return await handler(request, *match.groups())
+        if allowed:
+            raise HttpError(405, "不支持的请求方法")
+        raise HttpError(404, "接口不存在")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "Content-Length 无效"}, False)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": "请求体太大"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                url = urllib.parse.urlsplit(target)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                request = Request(method.upper(), url.path, query, headers, body)
+                try:
+                    status, payload = 200, await self.dispatch(request)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except customers.CustomerError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"服务器内部错误: {e}"}
+
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    # ---- 启动与关闭 ----
+
+    def _setup(self, conn):
+        migrations.migrate(conn)
+        accounts.ensure_admin(conn)
+        if accounts.verify_login(conn, accounts.ADMIN_USERNAME, accounts.DEFAULT_PASSWORD) is not None:
+            print(f"警告：管理员 {accounts.ADMIN_USERNAME} 仍在使用默认密码，请登录后在“系统设置”中修改")
+
+    async def auto_backup_loop(self):
+        """服务器负责自动备份，客户端不再各自备份"""
+        while True:
+            try:
+                await self.run_writer(backup.auto_backup, self.backup_dir)
+            except Exception as e:
+                print(f"自动备份失败: {e}")
+            await asyncio.sleep(AUTO_BACKUP_CHECK_SECONDS)
+
+    async def dedup_refresh_loop(self):
+        """分批补算查重分桶键，每批单独提交，不长时间占用写线程"""
+        while True:
+            try:
+                done = await self.run_writer(dedup.refresh, dedup.REFRESH_CHUNK)
+            except Exception as e:
+                print(f"补算查重索引失败: {e}")
+                done = 0
+            if done < dedup.REFRESH_CHUNK:
+                await asyncio.sleep(DEDUP_REFRESH_SECONDS)
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, auto_backup=True):
+        """建表并开始监听，返回 asyncio.Server"""
+        await self.run_writer(self._setup)
+        self.writes = WriteBatcher(self.pool, self.write_executor, self.dashboard_stats.invalidate)
+        self._tasks = [asyncio.ensure_future(self.writes.run()), asyncio.ensure_future(self.dedup_refresh_loop())]
+        if auto_backup:
+            self._tasks.append(asyncio.ensure_future(self.auto_backup_loop()))
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        """停止监听，等待写线程结束后关闭所有连接"""
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+        self.pool.close()
+
+
+async def serve(db_path, host, port):
+    server = CustomerServer(db_path)
+    listener = await server.start(host, port)
+    for sock in listener.sockets:
+        print(f"客户数据服务已启动: http://{sock.getsockname()[0]}:{sock.getsockname()[1]}  数据库: {db_path}")
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="凯川矿客户管理系统局域网服务器")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址，其他电脑要访问时用 0.0.0.0（所有网卡）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument("--db", default="data/customer_data.db", help="数据库文件")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.db, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
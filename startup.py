@@ -0,0 +1,106 @@
+"""启动耗时记录
+
+main.py 在导入其他模块之前先导入本模块，从这时开始计时，在启动过程的各个节点调用 mark()。
+命令行带 --startup-report（或设置环境变量 CUSTOMER_STARTUP_REPORT=1）时还会记录每个模块的
+导入耗时（与 python -X importtime 的口径相同：自身耗时和包含子模块的累计耗时），
+首帧显示、数据库就绪之后把报告打印到控制台。
+"""
+import builtins
+import os
+import sys
+import threading
+import time
+
+REPORT_FLAG = "--startup-report"
+
+# 报告中列出的导入耗时最多的模块数
+REPORT_IMPORTS = 15
+
+
+def requested(argv=None):
+    """是否要求输出启动报告"""
+    argv = sys.argv if argv is None else argv
+    return REPORT_FLAG in argv or os.environ.get("CUSTOMER_STARTUP_REPORT") == "1"
+
+
+class StartupProfile:
+    """按时间顺序记录启动的各个节点，以及（可选）每个模块的导入耗时"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # [(节点名称, 距离开始的秒数)]
+        self.marks = []
+        # [(模块名, 嵌套深度, 自身秒数, 累计秒数)]，按导入完成的顺序
+        self.imports = []
+        self._original_import = None
+        self._child_time = []
+
+    def mark(self, label):
+        """记录一个节点，返回距离开始的秒数"""
+        elapsed = time.perf_counter() - self.started
+        self.marks.append((label, elapsed))
+        return elapsed
+
+    def elapsed(self, label):
+        """某个节点距离开始的秒数，还没有到达时返回 None"""
+        for name, seconds in self.marks:
+            if name == label:
+                return seconds
+        return None
+
+    def track_imports(self):
+        """替换内置的 __import__，记录之后主线程中每次真正加载了新模块的导入"""
+        if self._original_import is not None:
+            return
+        self._original_import = original = builtins.__import__
+        main_thread = threading.get_ident()
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if threading.get_ident() != main_thread:
+                return original(name, globals, locals, fromlist, level)
+            loaded = len(sys.modules)
+            self._child_time.append(0.0)
+            started = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                total = time.perf_counter() - started
+                children = self._child_time.pop()
+                if self._child_time:
+                    self._child_time[-1] += total
+                if len(sys.modules) != loaded:
+                    label = name if not fromlist or fromlist == ("*",) else f"{name} ({', '.join(fromlist)})"
+                    self.imports.append(("." * level + label, len(self._child_time), total - children, total))
+
+        builtins.__import__ = timed_import
+
+    def stop_tracking(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def report(self):
+        """生成文字报告"""
+        lines = ["启动耗时（从 main.py 开始执行计时）：", f"{'节点':<16}{'累计 ms':>10}{'间隔 ms':>10}"]
+        previous = 0.0
+        for label, seconds in self.marks:
+            lines.append(f"{label:<16}{seconds * 1000:>10.1f}{(seconds - previous) * 1000:>10.1f}")
+            previous = seconds
+
+        if self.imports:
+            top = sorted(self.imports, key=lambda item: item[3], reverse=True)
+            top = [item for item in top if item[1] == 0][:REPORT_IMPORTS]
+            total = sum(item[3] for item in self.imports if item[1] == 0)
+            lines.append("")
+            lines.append(f"模块导入共 {total * 1000:.1f} ms，耗时最多的顶层导入：")
+            lines.append(f"{'自身 ms':>10}{'累计 ms':>10}  模块")
+            for name, depth, own, cumulative in top:
+                lines.append(f"{own * 1000:>10.1f}{cumulative * 1000:>10.1f}  {name}")
+        return "\n".join(lines)
+
+
+PROFILE = StartupProfile()
+
+
+def mark(label):
+    return PROFILE.mark(label)
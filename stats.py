@@ -0,0 +1,121 @@
+"""首页统计：触发器维护的分类计数表 + 内存缓存"""
+from repository import DELETED, INSERTED, UPDATED, CustomerRepository
+
+# 首页显示的最近添加客户数
+RECENT_LIMIT = 5
+
+
+def install(conn):
+    """创建 customer_stats 计数表及维护触发器，并用现有数据初始化（由调用方提交事务）"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS customer_stats (
+        customer_type TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_stats_ai AFTER INSERT ON customers BEGIN
+        INSERT OR IGNORE INTO customer_stats (customer_type, count) VALUES (new.customer_type, 0);
+        UPDATE customer_stats SET count = count + 1 WHERE customer_type = new.customer_type;
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_stats_ad AFTER DELETE ON customers BEGIN
+        UPDATE customer_stats SET count = count - 1 WHERE customer_type = old.customer_type;
+    END''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS customer_stats_au AFTER UPDATE OF customer_type ON customers
+    WHEN old.customer_type IS NOT new.customer_type BEGIN
+        UPDATE customer_stats SET count = count - 1 WHERE customer_type = old.customer_type;
+        INSERT OR IGNORE INTO customer_stats (customer_type, count) VALUES (new.customer_type, 0);
+        UPDATE customer_stats SET count = count + 1 WHERE customer_type = new.customer_type;
+    END''')
+
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """用一次分组查询重新计算计数表"""
+    conn.execute("DELETE FROM customer_stats")
+    conn.execute('''
+    INSERT INTO customer_stats (customer_type, count)
+    SELECT customer_type, COUNT(*) FROM customers GROUP BY customer_type
+    ''')
+
+
+def load(conn, recent_limit=RECENT_LIMIT):
+    """读取首页所需的全部统计数据，代价与客户数量无关"""
+    repo = CustomerRepository(conn)
+    counts = repo.counts_by_type()
+    return {
+        "total": sum(counts.values()),
+        "by_type": counts,
+        "recent": repo.recent(recent_limit),
+    }
+
+
+class DashboardStats:
+    """首页统计的内存缓存，只在客户数据提交修改后失效"""
+
+    def __init__(self, loader=load):
+        # loader(conn) 读取统计数据；连接服务器时换成通过接口读取
+        self._loader = loader
+        self._data = None
+        # 每次失效加一；只读连接并发读取时，读取期间失效的结果不能缓存
+        self._generation = 0
+
+    @property
+    def cached(self):
+        """已缓存的统计数据，没有缓存时为 None"""
+        return self._data
+
+    def get(self, conn):
+        data = self._data
+        if data is None:
+            generation = self._generation
+            data = self._loader(conn)
+            if generation == self._generation:
+                self._data = data
+        return data
+
+    def invalidate(self):
+        self._data = None
+        self._generation += 1
+
+    def apply(self, changes, recent_limit=RECENT_LIMIT):
+        """把已提交的逐行修改（repository.CustomerChange）直接应用到缓存，不必重新读取
+
+        删除了最近客户中的一行、需要补上更早的客户时无法只靠修改本身更新，缓存失效。
+        """
+        data = self._data
+        # 读取期间发生的修改已经应用不到那次读取的结果上
+        self._generation += 1
+        if data is None:
+            return
+        by_type = dict(data["by_type"])
+        recent = list(data["recent"])
+        for change in changes:
+            if (change.kind != INSERTED and change.before is None) or (change.kind != DELETED and change.after is None):
+                self.invalidate()
+                return
+            if change.before is not None:
+                by_type[change.before.customer_type] = by_type.get(change.before.customer_type, 0) - 1
+            if change.after is not None:
+                by_type[change.after.customer_type] = by_type.get(change.after.customer_type, 0) + 1
+
+            ids = [customer.id for customer in recent]
+            if change.kind == DELETED:
+                if change.id in ids:
+                    # 还有更早的客户应当补进来
+                    if sum(by_type.values()) >= len(recent):
+                        self.invalidate()
+                        return
+                    del recent[ids.index(change.id)]
+            elif change.kind == UPDATED:
+                if change.id in ids:
+                    recent[ids.index(change.id)] = change.after
+            else:
+                recent.append(change.after)
+                recent.sort(key=lambda customer: customer.id, reverse=True)
+                del recent[recent_limit:]
+        self._data = {"total": sum(by_type.values()), "by_type": by_type, "recent": recent}
@@ -0,0 +1,20 @@
+"""客户资料校验规则（界面录入和批量导入共用）"""
+import re
+
+PHONE_PATTERN = re.compile(r'^1[3-9]\d{9}$')
+
+CUSTOMER_TYPES = ("精煤", "中煤")
+
+
+def validate_customer(data):
+    """校验客户资料，通过时返回 None，否则返回错误提示"""
+    if not data.get("company_name") or not data.get("contact_name") or not data.get("phone"):
+        return "公司名称、客户名称和联系电话不能为空"
+
+    if not PHONE_PATTERN.match(data["phone"]):
+        return "请输入有效的手机号码"
+
+    if data.get("customer_type") not in CUSTOMER_TYPES:
+        return "客户类型只能是" + "或".join(CUSTOMER_TYPES)
+
+    return None